@@ -23,11 +23,22 @@ from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
 import os
-import uuid
+import re
+import secrets
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from archive import is_archived
+from ledger import LEDGER_GRANT, ensure_ledger, ledger_entry, record_entries
+from shared_cache import table_versions
 
 # Configuration
 SECRET_KEY = st.secrets.get("SECRET_KEY", "alumni_club_secret_key_for_demo")
 DATABASE_PATH = "alumni_club.db"
+# Check-ins go through SQLAlchemy so hour_ledger is written in the same transaction
+engine = sa.create_engine(f"sqlite:///{DATABASE_PATH}")
+# Organizer dashboard: participants shown per page, and pages kept per process
+PARTICIPANTS_PAGE_SIZE = 50
+PARTICIPANT_PAGES_CACHED = 256
 
 # Initialize database
 def init_database():
@@ -76,8 +87,17 @@ def init_database():
         )
     ''')
     
+    # Events created before QR tokens existed get the column the API and streamlit_app.py use
+    cursor.execute("PRAGMA table_info(events)")
+    if "qr_token" not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE events ADD COLUMN qr_token CHAR(24)")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_events_qr_token ON events (qr_token)")
+    
     conn.commit()
     conn.close()
+    
+    # Hours awarded here are recorded in hour_ledger like the API's
+    ensure_ledger(engine)
 
 # Authentication functions
 def hash_password(password):
@@ -157,8 +177,17 @@ def get_user_by_email(email):
     return None
 
 # QR Code functions
-def generate_qr_code(event_id):
-    qr_data = f"alumni_club_event_{event_id}_{uuid.uuid4().hex[:8]}"
+QR_PREFIX = "alumni_club_event_"
+QR_TOKEN_PATTERN = re.compile(r"[0-9a-f]{24}")
+
+def parse_qr_token(qr_data):
+    if not qr_data or not qr_data.startswith(QR_PREFIX):
+        return None
+    token = qr_data[len(QR_PREFIX):]
+    return token if QR_TOKEN_PATTERN.fullmatch(token) else None
+
+def generate_qr_code(token):
+    qr_data = f"{QR_PREFIX}{token}"
     
     qr = qrcode.QRCode(version=1, box_size=10, border=4)
     qr.add_data(qr_data)
@@ -194,18 +223,19 @@ def create_event(name, description, date, duration, organizer_id):
     conn = sqlite3.connect(DATABASE_PATH)
     cursor = conn.cursor()
     
-    # Generate QR code data
-    temp_id = int(datetime.now().timestamp())
-    qr_data, qr_image = generate_qr_code(temp_id)
+    # Случайный 96-битный токен: QR-код готов до вставки, мероприятие записывается один раз
+    qr_token = secrets.token_hex(12)
+    qr_data, qr_image = generate_qr_code(qr_token)
     
     cursor.execute(
-        "INSERT INTO events (name, description, date, duration, organizer_id, qr_code_data) VALUES (?, ?, ?, ?, ?, ?)",
-        (name, description, date, duration, organizer_id, qr_data)
+        "INSERT INTO events (name, description, date, duration, organizer_id, qr_code_data, qr_token) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (name, description, date, duration, organizer_id, qr_data, qr_token)
     )
     
     event_id = cursor.lastrowid
     conn.commit()
     conn.close()
+    table_versions.bump("events")
     
     return event_id, qr_data, qr_image
 
@@ -228,45 +258,92 @@ def get_user_events(user_id):
     conn = sqlite3.connect(DATABASE_PATH)
     cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM events WHERE organizer_id = ? ORDER BY date DESC", (user_id,))
+    # Participant counts and hours for every event in one grouped pass
+    cursor.execute('''
+        SELECT e.id, e.name, e.description, e.date, e.duration,
+               COALESCE(t.participant_count, 0), COALESCE(t.total_hours_awarded, 0),
+               (SELECT COALESCE(MAX(seq), 0) FROM hour_ledger)
+        FROM events e
+        LEFT JOIN (
+            SELECT p.event_id, COUNT(*) AS participant_count, SUM(p.hours_awarded) AS total_hours_awarded
+            FROM participation p
+            JOIN events pe ON pe.id = p.event_id
+            WHERE pe.organizer_id = ?
+            GROUP BY p.event_id
+        ) t ON t.event_id = e.id
+        WHERE e.organizer_id = ?
+        ORDER BY e.date DESC
+    ''', (user_id, user_id))
     events = cursor.fetchall()
     conn.close()
     return events
 
-def participate_in_event(user_id, qr_data):
+def get_event_participants(event_id, limit, offset=0):
     conn = sqlite3.connect(DATABASE_PATH)
     cursor = conn.cursor()
     
-    # Find event by QR data
-    cursor.execute("SELECT * FROM events WHERE qr_code_data = ?", (qr_data,))
-    event = cursor.fetchone()
-    
-    if not event:
-        conn.close()
-        return False, "Мероприятие не найдено"
-    
-    # Check if already participated
-    cursor.execute("SELECT * FROM participation WHERE user_id = ? AND event_id = ?", (user_id, event[0]))
-    existing = cursor.fetchone()
-    
-    if existing:
-        conn.close()
-        return False, "Вы уже участвовали в этом мероприятии"
-    
-    # Add participation
-    cursor.execute(
-        "INSERT INTO participation (user_id, event_id, hours_awarded) VALUES (?, ?, ?)",
-        (user_id, event[0], event[4])  # event[4] is duration
-    )
-    
-    # Update user total hours
-    cursor.execute(
-        "UPDATE users SET total_hours = total_hours + ? WHERE id = ?",
-        (event[4], user_id)
-    )
-    
-    conn.commit()
+    cursor.execute('''
+        SELECT u.name, u.email, p.timestamp, p.hours_awarded
+        FROM participation p
+        JOIN users u ON p.user_id = u.id
+        WHERE p.event_id = ?
+        ORDER BY p.id
+        LIMIT ? OFFSET ?
+    ''', (event_id, limit, offset))
+    participants = cursor.fetchall()
     conn.close()
+    return participants
+
+@st.cache_data(max_entries=PARTICIPANT_PAGES_CACHED, show_spinner=False)
+def get_participants_page(event_id, version, page):
+    """Participants page as a DataFrame; ``version`` changes with every check-in, so stale pages are never served"""
+    participants = get_event_participants(event_id, PARTICIPANTS_PAGE_SIZE, page * PARTICIPANTS_PAGE_SIZE)
+    return pd.DataFrame(participants, columns=['Имя', 'Email', 'Время участия', 'Часов'])
+
+def participate_in_event(user_id, qr_data):
+    with engine.begin() as conn:
+        # Find event by QR token; codes printed before tokens existed match on the full text
+        qr_token = parse_qr_token(qr_data)
+        if qr_token is not None:
+            event = conn.execute(
+                sa.text("SELECT * FROM events WHERE qr_token = :qr_token"), {"qr_token": qr_token}
+            ).fetchone()
+        else:
+            event = conn.execute(
+                sa.text("SELECT * FROM events WHERE qr_code_data = :qr_data"), {"qr_data": qr_data}
+            ).fetchone()
+        
+        if not event:
+            return False, "Мероприятие не найдено"
+        
+        # Check-ins of archived years are in archive tables, which the check below does not read
+        with Session(bind=conn) as db:
+            if is_archived(db, datetime.fromisoformat(str(event[3]))):
+                return False, "Мероприятие относится к архивному учебному году"
+        
+        # Check if already participated
+        existing = conn.execute(
+            sa.text("SELECT * FROM participation WHERE user_id = :user_id AND event_id = :event_id"),
+            {"user_id": user_id, "event_id": event[0]}
+        ).fetchone()
+        
+        if existing:
+            return False, "Вы уже участвовали в этом мероприятии"
+        
+        # Add participation
+        conn.execute(
+            sa.text("INSERT INTO participation (user_id, event_id, hours_awarded) VALUES (:user_id, :event_id, :hours)"),
+            {"user_id": user_id, "event_id": event[0], "hours": event[4]}  # event[4] is duration
+        )
+        
+        # Update user total hours, with its ledger entry in the same transaction
+        conn.execute(
+            sa.text("UPDATE users SET total_hours = total_hours + :hours WHERE id = :user_id"),
+            {"hours": event[4], "user_id": user_id}
+        )
+        record_entries(conn, [ledger_entry(user_id, event[4], LEDGER_GRANT, event[0])])
+    # The API's cached listings read these tables
+    table_versions.bump("participation", "users")
     
     return True, f"Участие засчитано! Получено {event[4]} часов"
 
@@ -582,33 +659,40 @@ def organizer_dashboard():
         st.subheader("📅 Мои мероприятия")
         events = get_user_events(st.session_state.user['id'])
         
-        if events:
-            for event in events:
-                with st.expander(f"{event[1]} - {event[3][:10]}"):
-                    st.write(f"**Описание:** {event[2] or 'Нет описания'}")
-                    st.write(f"**Дата:** {event[3]}")
-                    st.write(f"**Продолжительность:** {event[4]} часов")
-                    
-                    # Show participants
-                    conn = sqlite3.connect(DATABASE_PATH)
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        SELECT u.name, u.email, p.timestamp, p.hours_awarded
-                        FROM participation p
-                        JOIN users u ON p.user_id = u.id
-                        WHERE p.event_id = ?
-                    ''', (event[0],))
-                    participants = cursor.fetchall()
-                    conn.close()
-                    
-                    if participants:
-                        st.write(f"**Участников:** {len(participants)}")
-                        df = pd.DataFrame(participants, columns=['Имя', 'Email', 'Время участия', 'Часов'])
-                        st.dataframe(df)
-                    else:
-                        st.info("Пока нет участников")
-        else:
+        if not events:
             st.info("Пока нет созданных мероприятий")
+            return
+        
+        # Only the selected event's participants are loaded
+        events_by_id = {event[0]: event for event in events}
+        event = events_by_id[st.selectbox(
+            "Мероприятие",
+            list(events_by_id),
+            format_func=lambda event_id: (
+                f"{events_by_id[event_id][1]} - {events_by_id[event_id][3][:10]} "
+                f"({events_by_id[event_id][5]} уч.)"
+            ),
+            key="organizer_event"
+        )]
+        st.write(f"**Описание:** {event[2] or 'Нет описания'}")
+        st.write(f"**Дата:** {event[3]}")
+        st.write(f"**Продолжительность:** {event[4]} часов")
+        st.write(f"**Участников:** {event[5]}")
+        st.write(f"**Начислено часов:** {event[6]:g}")
+        
+        if not event[5]:
+            st.info("Пока нет участников")
+            return
+        
+        pages = -(-event[5] // PARTICIPANTS_PAGE_SIZE)
+        page = 1
+        if pages > 1:
+            page = st.number_input("Страница", min_value=1, max_value=pages, value=1, key=f"participants_page_{event[0]}")
+        # Participation ids can be reused after a delete, but ledger seqs never are:
+        # every check-in and revocation appends one, so it always gives a new version
+        version = (event[5], event[7])
+        st.dataframe(get_participants_page(event[0], version, int(page) - 1))
+        st.caption(f"Страница {int(page)} из {pages}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,262 @@
+"""Archival of participation from closed academic years.
+
+Check-ins for events of an academic year that has ended move from
+``participation`` to ``participation_archive_<year>`` (one table per year,
+``<year>`` being the year it starts in), so the hot table and its indexes
+only hold the current year. ``users.total_hours`` is stored on the user and
+is not touched; full-history queries union the archive tables back in.
+
+Usage:
+    python archive.py                 # archive every closed year and print a report
+    python archive.py --year 2023     # archive one year (it must be closed)
+    python archive.py --dry-run       # only print what would move
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import Column, select, func, delete, union_all, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import (
+    User, Event, Participation, ParticipationArchive,
+    participation_archive_table, ARCHIVE_TABLE_PREFIX,
+)
+from shared_cache import table_versions
+
+
+def academic_year(date: datetime) -> int:
+    """The calendar year the academic year containing ``date`` starts in"""
+    return date.year if date.month >= settings.academic_year_start_month else date.year - 1
+
+
+def year_bounds(year: int):
+    """Start (inclusive) and end (exclusive) of an academic year"""
+    month = settings.academic_year_start_month
+    return datetime(year, month, 1), datetime(year + 1, month, 1)
+
+
+def archived_years(db: Session) -> List[int]:
+    return list(db.execute(select(ParticipationArchive.year).order_by(ParticipationArchive.year)).scalars())
+
+
+def is_archived(db: Session, event_date: datetime) -> bool:
+    """Whether check-ins for an event on ``event_date`` live in an archive table"""
+    year = academic_year(event_date)
+    if year >= academic_year(datetime.utcnow()):
+        # The current year is never archived; skip the lookup on the check-in path
+        return False
+    return db.get(ParticipationArchive, year) is not None
+
+
+def participation_table_for_event(db: Session, event_date: datetime):
+    """The table holding check-ins for an event: participation or its year's archive"""
+    if is_archived(db, event_date):
+        return participation_archive_table(academic_year(event_date))
+    return Participation.__table__
+
+
+def closed_years(db: Session, now: datetime = None) -> List[int]:
+    """Academic years before the current one that still have rows in participation"""
+    current_start, _ = year_bounds(academic_year(now or datetime.utcnow()))
+    event_dates = db.execute(
+        select(Event.date)
+        .where(Event.date < current_start)
+        .where(select(Participation.id).where(Participation.event_id == Event.id).exists())
+    ).scalars()
+    years = set()
+    for event_date in event_dates:
+        if isinstance(event_date, str):
+            event_date = datetime.fromisoformat(event_date)
+        years.add(academic_year(event_date))
+    return sorted(years)
+
+
+def archived_years_between(db: Session, date_from: datetime = None, date_to: datetime = None) -> List[int]:
+    """Archived years with events in [date_from, date_to] (either end open)"""
+    return [
+        year for year in archived_years(db)
+        if (date_from is None or year_bounds(year)[1] > date_from)
+        and (date_to is None or year_bounds(year)[0] <= date_to)
+    ]
+
+
+def archive_year(db: Session, year: int) -> dict:
+    """Move one closed year's participation into its archive table, in one transaction"""
+    start, end = year_bounds(year)
+    if end > year_bounds(academic_year(datetime.utcnow()))[0]:
+        raise ValueError(f"Academic year {year} is not closed yet")
+    archive = participation_archive_table(year)
+    archive.create(db.get_bind(), checkfirst=True)
+    # Tables archived before the unique index existed get it here
+    for index in archive.indexes:
+        index.create(db.get_bind(), checkfirst=True)
+
+    in_year = select(Event.id).where(Event.date >= start, Event.date < end)
+    moved = db.execute(
+        select(func.count(), func.coalesce(func.sum(Participation.hours_awarded), 0.0))
+        .where(Participation.event_id.in_(in_year))
+    ).one()
+    columns = [Participation.id, Participation.user_id, Participation.event_id,
+               Participation.timestamp, Participation.hours_awarded]
+    db.execute(archive.insert().from_select(
+        [c.name for c in columns], select(*columns).where(Participation.event_id.in_(in_year))
+    ))
+    db.execute(delete(Participation).where(Participation.event_id.in_(in_year)))
+
+    entry = db.get(ParticipationArchive, year)
+    if entry is None:
+        entry = ParticipationArchive(year=year, table_name=archive.name, rows=0, hours=0.0)
+        db.add(entry)
+    entry.rows += moved[0]
+    entry.hours += moved[1]
+    entry.archived_at = datetime.utcnow()
+    db.commit()
+    table_versions.bump("participation")
+    return {"year": year, "table": archive.name, "rows": moved[0], "hours": moved[1]}
+
+
+def participation_history_query(user_id: int, years: List[int], columns):
+    """``participation_list_query`` over participation and the given archive tables"""
+    queries = [
+        select(*columns)
+        .join(Event, Event.id == Participation.event_id)
+        .where(Participation.user_id == user_id)
+    ]
+    for year in years:
+        archive = participation_archive_table(year)
+        queries.append(
+            select(*[_archive_column(column, archive) for column in columns])
+            .join(Event, Event.id == archive.c.event_id)
+            .where(archive.c.user_id == user_id)
+        )
+    history = union_all(*queries).subquery()
+    return select(history).order_by(history.c.id)
+
+
+def participation_totals(years: List[int], event_ids=None):
+    """Check-ins and hours awarded per event, over participation and the given archive tables"""
+    queries = []
+    for table in [Participation.__table__] + [participation_archive_table(year) for year in years]:
+        query = select(table.c.event_id, table.c.hours_awarded)
+        if event_ids is not None:
+            # Filtered in every branch, so each table is read through its event_id index
+            query = query.where(table.c.event_id.in_(event_ids))
+        queries.append(query)
+    source = (union_all(*queries) if len(queries) > 1 else queries[0]).subquery()
+    return (
+        select(
+            source.c.event_id,
+            func.count().label("participant_count"),
+            func.sum(source.c.hours_awarded).label("total_hours_awarded"),
+        )
+        .group_by(source.c.event_id)
+        .subquery()
+    )
+
+
+def _archive_column(column, archive):
+    # Participation columns map to the archive table; event columns stay as they are
+    expression = column.__clause_element__() if hasattr(column, "__clause_element__") else column
+    if isinstance(expression, Column) and expression.table is Participation.__table__:
+        return archive.c[expression.name]
+    return column
+
+
+def count_participations(db: Session, user_id: int) -> int:
+    """Check-ins of a user across participation and every archive table"""
+    count = db.execute(
+        select(func.count()).select_from(Participation).where(Participation.user_id == user_id)
+    ).scalar()
+    for year in archived_years(db):
+        archive = participation_archive_table(year)
+        count += db.execute(
+            select(func.count()).select_from(archive).where(archive.c.user_id == user_id)
+        ).scalar()
+    return count
+
+
+def table_stats(db: Session, table_name: str) -> dict:
+    """Row count and on-disk index size (bytes, when the database can tell) of a table"""
+    rows = db.execute(text(f'SELECT COUNT(*) FROM "{table_name}"')).scalar()
+    dialect = db.get_bind().dialect.name
+    index_bytes = None
+    try:
+        if dialect == "postgresql":
+            index_bytes = db.execute(text("SELECT pg_indexes_size(:name)"), {"name": table_name}).scalar()
+        elif dialect == "sqlite":
+            # Needs SQLite built with the dbstat virtual table
+            index_bytes = db.execute(
+                text("SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                     "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :name)"),
+                {"name": table_name},
+            ).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        db.rollback()
+    return {"rows": rows, "index_bytes": index_bytes}
+
+
+def time_history_queries(db: Session, user_ids: List[int], years: List[int], columns) -> dict:
+    """Median milliseconds for the hot-only and full-history queries of ``user_ids``"""
+    def median_ms(build):
+        timings = []
+        for user_id in user_ids:
+            started = time.perf_counter()
+            db.execute(build(user_id)).all()
+            timings.append((time.perf_counter() - started) * 1000.0)
+        timings.sort()
+        return round(timings[len(timings) // 2], 3) if timings else None
+
+    hot = median_ms(lambda user_id: select(*columns)
+                    .join(Event, Event.id == Participation.event_id)
+                    .where(Participation.user_id == user_id)
+                    .order_by(Participation.id))
+    full = median_ms(lambda user_id: participation_history_query(user_id, years, columns))
+    return {"history_ms": hot, "full_history_ms": full}
+
+
+def report(db: Session, user_ids: List[int], columns) -> dict:
+    years = archived_years(db)
+    tables = {"participation": table_stats(db, "participation")}
+    for year in years:
+        name = f"{ARCHIVE_TABLE_PREFIX}{year}"
+        tables[name] = table_stats(db, name)
+    return {"tables": tables, "queries": time_history_queries(db, user_ids, years, columns)}
+
+
+def main(argv=None):
+    from database import SessionLocal
+    from main import PARTICIPATION_LIST_COLUMNS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--year", type=int, help="archive only this academic year (by its start year)")
+    parser.add_argument("--dry-run", action="store_true", help="list the years that would be archived")
+    parser.add_argument("--sample-users", type=int, default=50, help="users timed in the report")
+    args = parser.parse_args(argv)
+
+    with SessionLocal() as db:
+        years = [args.year] if args.year is not None else closed_years(db)
+        if args.dry_run:
+            print(json.dumps({"years": years}))
+            return 0
+        user_ids = list(db.execute(
+            select(User.id).where(User.role == "student").order_by(User.id).limit(args.sample_users)
+        ).scalars())
+        before = report(db, user_ids, PARTICIPATION_LIST_COLUMNS)
+        try:
+            archived = [archive_year(db, year) for year in years]
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        after = report(db, user_ids, PARTICIPATION_LIST_COLUMNS)
+    print(json.dumps({"archived": archived, "before": before, "after": after}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
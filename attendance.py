@@ -0,0 +1,144 @@
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from config import settings
+from shared_cache import cache_backend, invalidation_bus
+
+
+class AttendanceHub:
+    """In-process pub/sub that fans check-ins out to per-event subscribers.
+
+    Each event keeps a small replay buffer so a reconnecting client can
+    resume from its ``Last-Event-ID``. Message ids are assigned by the
+    publishing worker (see ``next_message_id``), so every worker numbers a
+    check-in the same way. Subscribers are plain asyncio queues, so idle
+    connections cost no polling and no database access.
+    """
+
+    def __init__(self, replay_size: int = 100, queue_size: int = 256, max_replay_events: int = 1000):
+        self.replay_size = replay_size
+        self.queue_size = queue_size
+        self.max_replay_events = max_replay_events
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._replay: "OrderedDict[int, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, event_id: int, last_event_id: Optional[int] = None):
+        """Register a subscriber, returning its queue and any missed messages"""
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(event_id, set()).add(queue)
+            backlog = list(self._replay.get(event_id, ()))
+        if last_event_id is None:
+            return queue, []
+        # Messages from other workers can arrive slightly out of order
+        return queue, sorted(item for item in backlog if item[0] > last_event_id)
+
+    def unsubscribe(self, event_id: int, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(event_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[event_id]
+
+    def publish(self, event_id: int, payload: dict, message_id: int) -> int:
+        """Record a check-in and deliver it to every subscriber of the event"""
+        with self._lock:
+            item = (message_id, payload)
+            replay = self._replay.get(event_id)
+            if replay is None:
+                replay = self._replay[event_id] = deque(maxlen=self.replay_size)
+                while len(self._replay) > self.max_replay_events:
+                    self._replay.popitem(last=False)
+            else:
+                self._replay.move_to_end(event_id)
+            replay.append(item)
+            queues = list(self._subscribers.get(event_id, ()))
+
+        if queues:
+            loop = self._loop
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if loop is None or running is loop:
+                self._deliver(queues, item)
+            else:
+                loop.call_soon_threadsafe(self._deliver, queues, item)
+        return message_id
+
+    @staticmethod
+    def _deliver(queues, item):
+        for queue in queues:
+            if queue.full():
+                # Drop the oldest message for slow consumers; ids reveal the gap
+                queue.get_nowait()
+            queue.put_nowait(item)
+
+    def subscriber_count(self, event_id: Optional[int] = None) -> int:
+        with self._lock:
+            if event_id is not None:
+                return len(self._subscribers.get(event_id, ()))
+            return sum(len(queues) for queues in self._subscribers.values())
+
+
+attendance_hub = AttendanceHub(replay_size=settings.attendance_replay_size)
+
+ATTENDANCE_SEQUENCE = "attendance:sequence"
+
+# The counter starts from the clock in milliseconds: with the in-memory backend
+# a restarted worker still numbers above the ids its clients have seen, and a
+# shared backend keeps the counter across restarts
+cache_backend.add(ATTENDANCE_SEQUENCE, int(time.time() * 1000))
+
+
+def next_message_id() -> int:
+    """SSE id for a new check-in, increasing across workers and restarts"""
+    return cache_backend.incr(ATTENDANCE_SEQUENCE)
+
+
+def publish_checkin(event_id: int, checkin: dict):
+    """Announce a committed check-in to subscribers on every worker"""
+    invalidation_bus.publish("attendance", {"event_id": event_id, "id": next_message_id(), "checkin": checkin})
+
+
+invalidation_bus.subscribe(
+    "attendance",
+    lambda message: attendance_hub.publish(message["event_id"], message["checkin"], message["id"])
+)
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def format_sse(message_id: int, payload: dict) -> str:
+    data = json.dumps(payload, default=_json_default, ensure_ascii=False)
+    return f"id: {message_id}\nevent: checkin\ndata: {data}\n\n"
+
+
+async def attendance_stream(hub: AttendanceHub, event_id: int, last_event_id: Optional[int] = None,
+                            heartbeat_seconds: float = 15.0):
+    """Yield server-sent events for ``event_id`` until the client disconnects"""
+    queue, backlog = hub.subscribe(event_id, last_event_id)
+    try:
+        yield "retry: 3000\n\n"
+        for message_id, payload in backlog:
+            yield format_sse(message_id, payload)
+        while True:
+            try:
+                message_id, payload = await asyncio.wait_for(queue.get(), timeout=heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(message_id, payload)
+    finally:
+        hub.unsubscribe(event_id, queue)
@@ -0,0 +1,964 @@
+"""Load-test and benchmark suite for the check-in hot path.
+
+Seeds a dedicated SQLite database with synthetic data and drives the API
+in-process through an ASGI client, reporting throughput and latency
+percentiles as JSON.
+
+Usage:
+    python benchmark.py --seed                  # seed, then run
+    python benchmark.py --concurrency 32 --requests 2000
+    python benchmark.py --save-baseline         # store results as the baseline
+    python benchmark.py                         # compare against the baseline
+    python benchmark.py --scenario search       # FTS5 vs LIKE at 100k events
+    python benchmark.py --scenario json         # pydantic vs orjson at 10k rows
+    python benchmark.py --scenario importtime   # cold `import main` against a budget
+    python benchmark.py --scenario qr           # signed QR checks vs token lookups
+    python benchmark.py --scenario checkin      # /scan-qr with and without the event index
+    python benchmark.py --scenario burst        # one event opening: per-request commit vs group commit
+    python benchmark.py --scenario checkin-recovery  # journal recovery time after a crash
+    python benchmark.py --scenario archive      # history queries before/after archiving closed years
+    python benchmark.py --scenario overload     # /me latency while image scans are flooded
+    python benchmark.py --scenario image-memory # peak RSS per image decode, capped vs unbounded
+    python benchmark.py --scenario ledger       # full vs incremental hour-ledger replay, drift detection
+    python benchmark.py --scenario reports      # weekly organizer reports: grouped pass vs per-event queries
+    python benchmark.py --scenario event-list   # /my-events counts: grouped query vs per-event queries
+    python benchmark.py --backends sqlite,postgresql  # same scenario on SQLite and a throwaway PostgreSQL
+    python benchmark.py --backends postgresql+psycopg2://alumni@localhost/bench  # an existing server
+
+Pass/fail checks for crash recovery, load shedding and image memory live in
+checks.py, which needs no seeded database.
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+# Every simulated client shares one address; measure the handlers, not the limiter
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx
+import qrcode
+from sqlalchemy import create_engine, select, func, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, User, Event, Participation
+from auth import create_access_token
+from seed_data import seed_database, DEFAULT_DB_PATH as BENCH_DB_PATH, DEFAULT_PASSWORD as BENCH_PASSWORD
+
+BASELINE_PATH = "benchmark_baseline.json"
+
+ENDPOINTS = ["login", "scan-qr", "scan-qr-image", "events", "my-participations"]
+
+
+def bench_engine(db_path: str):
+    """Create an engine for the benchmark database, a SQLite file or a database URL"""
+    from database import engine_options
+    url = db_path if "://" in db_path else f"sqlite:///{db_path}"
+    return create_engine(url, **engine_options(url))
+
+
+def needs_seed(args, db_path: str) -> bool:
+    if args.seed:
+        return True
+    if "://" not in db_path:
+        return not os.path.exists(db_path)
+    engine = create_engine(db_path)
+    try:
+        return not inspect(engine).has_table("participation")
+    finally:
+        engine.dispose()
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class Workload:
+    """Pre-computed tokens, QR payloads and images used to build requests"""
+
+    def __init__(self, engine, sample_size: int = 200, seed: int = 42):
+        self.rng = random.Random(seed)
+        with engine.connect() as conn:
+            students = conn.execute(
+                select(User.email).where(User.role == "student").limit(sample_size)
+            ).scalars().all()
+            qr_codes = conn.execute(
+                select(Event.qr_code_data).order_by(Event.id).limit(sample_size)
+            ).scalars().all()
+        if not students or not qr_codes:
+            raise SystemExit("Benchmark database is empty, run with --seed first")
+
+        self.student_emails = students
+        self.tokens = [create_access_token({"sub": email}) for email in students]
+        self.qr_codes = qr_codes
+        self.qr_images = [self._qr_png(data) for data in qr_codes[:20]]
+        self._burst = itertools.count()
+
+    @staticmethod
+    def _qr_png(qr_data: str) -> bytes:
+        img = qrcode.make(qr_data)
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def auth_headers(self):
+        return {"Authorization": f"Bearer {self.rng.choice(self.tokens)}"}
+
+    def request(self, client: httpx.AsyncClient, endpoint: str):
+        if endpoint == "login":
+            return client.post("/login", json={
+                "email": self.rng.choice(self.student_emails),
+                "password": BENCH_PASSWORD,
+            })
+        if endpoint == "scan-qr":
+            return client.post("/scan-qr", data={"qr_data": self.rng.choice(self.qr_codes)},
+                               headers=self.auth_headers())
+        if endpoint == "scan-qr-burst":
+            # Every sampled student scans the same event once, as when a large event opens
+            token = self.tokens[next(self._burst) % len(self.tokens)]
+            return client.post("/scan-qr", data={"qr_data": self.qr_codes[0]},
+                               headers={"Authorization": f"Bearer {token}"})
+        if endpoint == "scan-qr-image":
+            image = self.rng.choice(self.qr_images)
+            return client.post("/scan-qr-image", files={"file": ("qr.png", image, "image/png")},
+                               headers=self.auth_headers())
+        if endpoint == "events":
+            return client.get("/events")
+        if endpoint == "me":
+            return client.get("/me", headers=self.auth_headers())
+        if endpoint == "my-participations":
+            return client.get("/my-participations", headers=self.auth_headers())
+        raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+# Statuses a healthy run of each endpoint returns; anything else counts as an error
+EXPECTED_STATUSES = {
+    "login": {200},
+    # Random scans repeat a user and event now and then, which is rejected with 400
+    "scan-qr": {200, 400},
+    "scan-qr-burst": {200},
+    "scan-qr-image": {200, 400},
+    "events": {200},
+    "me": {200},
+    "my-participations": {200},
+}
+
+
+async def run_endpoint(app, workload: Workload, endpoint: str, total: int, concurrency: int,
+                       expected=None) -> dict:
+    """Drive one endpoint with a fixed number of requests and concurrent clients"""
+    expected = expected or EXPECTED_STATUSES[endpoint]
+    latencies = []
+    statuses = Counter()
+    errors = 0
+    remaining = total
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    response = await workload.request(client, endpoint)
+                    statuses[response.status_code] += 1
+                    if response.status_code not in expected:
+                        errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append((time.perf_counter() - started) * 1000.0)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    summary = summarize(latencies, elapsed, errors)
+    summary["concurrency"] = concurrency
+    summary["status_codes"] = {str(code): count for code, count in sorted(statuses.items())}
+    return summary
+
+
+def summarize(latencies, elapsed: float, errors: int = 0) -> dict:
+    """Throughput and latency percentiles for a list of millisecond samples"""
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "errors": errors,
+    }
+
+
+def timed_calls(fn, args_list, repeats: int = 1) -> dict:
+    """Call ``fn`` once per argument tuple, ``repeats`` times, and summarize the latencies"""
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for args in args_list:
+            call_started = time.perf_counter()
+            fn(*args)
+            latencies.append((time.perf_counter() - call_started) * 1000.0)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def bench_session(engine):
+    """Return a session factory bound to ``engine`` and route the app's get_db to it"""
+    from main import app
+    from database import get_db
+
+    BenchSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_bench_db():
+        db = BenchSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = get_bench_db
+    return app, BenchSession
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float):
+    """Return a list of human readable regressions against the stored baseline"""
+    regressions = []
+    for endpoint, current in results.items():
+        if "budget_ms" in current:
+            regressions.extend(check_import_budget(endpoint, current, baseline.get(endpoint), tolerance))
+            continue
+        if "ok" in current:
+            if not current["ok"]:
+                regressions.append(f"{endpoint}: {current.get('error', 'check failed')}")
+            continue
+        previous = baseline.get(endpoint)
+        # Measurements without latencies (such as peak RSS) are reported, not compared
+        if not previous or "p95_ms" not in current or "p95_ms" not in previous:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{endpoint}: p95 {current['p95_ms']}ms > baseline {previous['p95_ms']}ms"
+            )
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{endpoint}: throughput {current['throughput_rps']} rps < baseline {previous['throughput_rps']} rps"
+            )
+        if current["errors"] > previous.get("errors", 0):
+            regressions.append(f"{endpoint}: {current['errors']} errors")
+    return regressions
+
+
+def scenario_endpoints(args) -> dict:
+    """Concurrent requests against the check-in hot path endpoints"""
+    engine = bench_engine(args.db)
+    if needs_seed(args, args.db):
+        stats = seed_database(engine, args.users, args.events, args.participations, args.random_seed)
+        print(f"Seeded {args.db}: {json.dumps(stats)}", file=sys.stderr)
+
+    app, _ = bench_session(engine)
+    workload = Workload(engine, seed=args.random_seed)
+    results = {}
+    for endpoint in [e.strip() for e in args.endpoints.split(",") if e.strip()]:
+        results[endpoint] = asyncio.run(
+            run_endpoint(app, workload, endpoint, args.requests, args.concurrency)
+        )
+    return results
+
+
+SEARCH_TERMS = ["hackathon", "charity fair", "mentoring", "theatre", "ecology cleanup", "12345"]
+
+
+def scenario_search(args) -> dict:
+    """FTS5 event search against a LIKE '%q%' scan over a large events table"""
+    from search import search_events, like_search_events
+
+    engine = bench_engine(args.search_db)
+    if needs_seed(args, args.search_db):
+        stats = seed_database(engine, 1000, args.search_events, 0, args.random_seed)
+        print(f"Seeded {args.search_db}: {json.dumps(stats)}", file=sys.stderr)
+
+    Session = sessionmaker(bind=engine)
+    terms = [(term,) for term in SEARCH_TERMS]
+    with Session() as db:
+        fts = timed_calls(lambda q: search_events(db, q), terms, args.repeats)
+        like = timed_calls(lambda q: like_search_events(db, q), terms, args.repeats)
+    return {"search-fts": fts, "search-like": like}
+
+
+def scenario_json(args) -> dict:
+    """Pydantic response_model serialization against the orjson row fast path"""
+    from typing import List
+    import orjson
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import parse_obj_as
+    from main import EventResponse, event_list_query
+
+    engine = bench_engine(args.db)
+    if needs_seed(args, args.db):
+        stats = seed_database(engine, args.users, args.events, args.participations, args.random_seed)
+        print(f"Seeded {args.db}: {json.dumps(stats)}", file=sys.stderr)
+
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        result = db.execute(event_list_query().limit(args.json_rows))
+        keys = list(result.keys())
+        rows = result.all()
+
+    def model_path():
+        # What the endpoints do today: build models, then FastAPI validates and encodes them again
+        models = [EventResponse(**dict(zip(keys, row))) for row in rows]
+        content = jsonable_encoder(parse_obj_as(List[EventResponse], models))
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    def orjson_path():
+        return orjson.dumps([dict(zip(keys, row)) for row in rows])
+
+    return {
+        f"json-pydantic-{len(rows)}": timed_calls(model_path, [()], args.repeats),
+        f"json-orjson-{len(rows)}": timed_calls(orjson_path, [()], args.repeats),
+    }
+
+
+def scenario_qr(args) -> dict:
+    """Rejecting forged QR codes by signature against rejecting them by a database lookup"""
+    from qr_utils import InvalidQRCode, SIGNED_QR_PREFIX, sign_qr_payload, verify_qr_payload, new_qr_token
+
+    engine = bench_engine(args.db)
+    if needs_seed(args, args.db):
+        stats = seed_database(engine, args.users, args.events, args.participations, args.random_seed)
+        print(f"Seeded {args.db}: {json.dumps(stats)}", file=sys.stderr)
+
+    now = int(time.time())
+    valid = [(sign_qr_payload(event_id, now - 60, now + 3600),) for event_id in range(1, 51)]
+    forged = [(payload[:-4] + "AAAA",) for (payload,) in valid]
+    unknown_tokens = [(new_qr_token(),) for _ in range(50)]
+
+    # Scanned text is attacker controlled: each of these must be rejected, never raise anything else
+    malformed = [
+        f"{SIGNED_QR_PREFIX}1.\u00e9.2.abc",
+        f"{SIGNED_QR_PREFIX}1.2.3.\u00e9\u00e9\u00e9",
+        f"{SIGNED_QR_PREFIX}1.2.3.\ud800",
+        f"{SIGNED_QR_PREFIX}..",
+        f"{SIGNED_QR_PREFIX}",
+    ]
+    unexpected = []
+    for payload in malformed:
+        try:
+            verify_qr_payload(payload)
+            unexpected.append(f"{payload!r} accepted")
+        except InvalidQRCode:
+            pass
+        except Exception as e:
+            unexpected.append(f"{payload!r} raised {type(e).__name__}")
+
+    def verify(payload):
+        try:
+            verify_qr_payload(payload)
+        except InvalidQRCode:
+            pass
+
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        def lookup(token):
+            db.execute(select(Event.id).where(Event.qr_token == token)).first()
+
+        return {
+            "qr-signed-valid": timed_calls(verify, valid, args.repeats),
+            "qr-signed-forged": timed_calls(verify, forged, args.repeats),
+            "qr-token-lookup-miss": timed_calls(lookup, unknown_tokens, args.repeats),
+            "qr-malformed-rejected": {
+                "ok": not unexpected,
+                "cases": len(malformed),
+                "error": "; ".join(unexpected) or None,
+            },
+        }
+
+
+@contextmanager
+def copied_database(path: str):
+    """Engine on a throwaway copy of ``path``, so writing scenarios start from the same data"""
+    if "://" in path:
+        with copied_postgres_database(path) as url:
+            engine = bench_engine(url)
+            try:
+                yield engine
+            finally:
+                engine.dispose()
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        db_copy = os.path.join(tmp, os.path.basename(path))
+        shutil.copyfile(path, db_copy)
+        engine = bench_engine(db_copy)
+        try:
+            yield engine
+        finally:
+            engine.dispose()
+
+
+@contextmanager
+def copied_postgres_database(url: str):
+    """Clone a PostgreSQL database with CREATE DATABASE ... TEMPLATE and drop it afterwards"""
+    source = make_url(url)
+    copy_name = f"{source.database}_copy_{os.getpid()}"
+    admin = create_engine(source.set(database="postgres"), isolation_level="AUTOCOMMIT")
+    try:
+        with admin.connect() as conn:
+            conn.exec_driver_sql(f'CREATE DATABASE "{copy_name}" TEMPLATE "{source.database}"')
+        try:
+            yield source.set(database=copy_name).render_as_string(hide_password=False)
+        finally:
+            with admin.connect() as conn:
+                conn.exec_driver_sql(f'DROP DATABASE IF EXISTS "{copy_name}"')
+    finally:
+        admin.dispose()
+
+
+@contextmanager
+def temporary_postgres(bin_dir: Optional[str] = None):
+    """Start a throwaway PostgreSQL cluster in a temp dir and yield a URL to an empty database"""
+    def tool(name):
+        path = os.path.join(bin_dir, name) if bin_dir else shutil.which(name)
+        if not path:
+            raise SystemExit(f"{name} not found; install PostgreSQL or pass --pg-bin")
+        return path
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, "data")
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        subprocess.run([tool("initdb"), "-D", data_dir, "-U", "postgres", "--auth=trust", "-E", "UTF8"],
+                       check=True, stdout=subprocess.DEVNULL)
+        # Unix socket only, with benchmark-friendly (not crash-safe) durability
+        options = f"-p {port} -k {tmp} -c listen_addresses='' -c fsync=off -c synchronous_commit=off"
+        subprocess.run([tool("pg_ctl"), "-D", data_dir, "-o", options, "-l", os.path.join(tmp, "log"), "-w", "start"],
+                       check=True, stdout=subprocess.DEVNULL)
+        try:
+            url = f"postgresql+psycopg2://postgres@/bench?host={tmp}&port={port}"
+            admin = create_engine(make_url(url).set(database="postgres"), isolation_level="AUTOCOMMIT")
+            with admin.connect() as conn:
+                conn.exec_driver_sql("CREATE DATABASE bench")
+            admin.dispose()
+            yield url
+        finally:
+            subprocess.run([tool("pg_ctl"), "-D", data_dir, "-m", "fast", "-w", "stop"],
+                           check=False, stdout=subprocess.DEVNULL)
+
+
+def run_backends(args, backends) -> dict:
+    """Run the scenario once per backend, prefixing every result with the backend name"""
+    results = {}
+    for backend in backends:
+        if backend == "sqlite":
+            current = SCENARIOS[args.scenario](args)
+        elif backend == "postgresql":
+            with temporary_postgres(args.pg_bin) as url:
+                current = SCENARIOS[args.scenario](argparse.Namespace(**{**vars(args), "db": url, "search_db": url}))
+        else:
+            current = SCENARIOS[args.scenario](argparse.Namespace(**{**vars(args), "db": backend, "search_db": backend}))
+            backend = make_url(backend).get_backend_name()
+        results.update({f"{backend}:{name}": value for name, value in current.items()})
+    return results
+
+
+def seeded_engine(args):
+    from database import migrate_schema
+    from ledger import open_ledger
+
+    engine = bench_engine(args.db)
+    if needs_seed(args, args.db):
+        stats = seed_database(engine, args.users, args.events, args.participations, args.random_seed)
+        print(f"Seeded {args.db}: {json.dumps(stats)}", file=sys.stderr)
+    else:
+        # Databases seeded by an older version may lack tables and indexes added since
+        Base.metadata.create_all(bind=engine)
+        migrate_schema(engine)
+        open_ledger(engine)
+    return engine
+
+
+def scenario_checkin(args) -> dict:
+    """/scan-qr throughput with event lookups from SQLite against the hot-event index"""
+    from config import settings
+    from event_index import event_index
+
+    seeded_engine(args).dispose()
+    results = {}
+    enabled = settings.event_index_enabled
+    try:
+        for name, use_index in (("scan-qr-db-lookup", False), ("scan-qr-event-index", True)):
+            with copied_database(args.db) as engine:
+                app, BenchSession = bench_session(engine)
+                workload = Workload(engine, seed=args.random_seed)
+                settings.event_index_enabled = use_index
+                event_index.clear()
+                if use_index:
+                    # Synthetic event dates are spread over a year, so load all of them
+                    with BenchSession() as db:
+                        event_index.load(db, everything=True)
+                results[name] = asyncio.run(
+                    run_endpoint(app, workload, "scan-qr", args.requests, args.concurrency)
+                )
+                results[name]["event_index"] = event_index.stats()
+    finally:
+        settings.event_index_enabled = enabled
+    return results
+
+
+def scenario_burst(args) -> dict:
+    """Distinct students checking in to one event: a commit per request against group commit"""
+    import main
+    from checkin_buffer import CheckinBuffer
+
+    seeded_engine(args).dispose()
+    results = {}
+    for name, buffered in (("burst-commit-per-request", False), ("burst-group-commit", True)):
+        with copied_database(args.db) as engine, tempfile.TemporaryDirectory() as journal_dir:
+            app, BenchSession = bench_session(engine)
+            workload = Workload(engine, sample_size=args.requests, seed=args.random_seed)
+            if buffered:
+                main.checkin_buffer = CheckinBuffer(BenchSession, journal_dir)
+                main.checkin_buffer.start()
+            try:
+                results[name] = asyncio.run(
+                    run_endpoint(app, workload, "scan-qr-burst", args.requests, args.concurrency)
+                )
+            finally:
+                if buffered:
+                    results[name]["buffer"] = main.checkin_buffer.stats()
+                    main.checkin_buffer.stop()
+                    main.checkin_buffer = None
+    return results
+
+
+def scenario_checkin_recovery(args) -> dict:
+    """Time recovering the journal of a crashed worker; checks.py verifies the recovered rows"""
+    from checkin_buffer import CheckinBuffer
+    from checks import RECOVERY_CASES, crash_checkin_worker
+
+    seeded_engine(args).dispose()
+    per_case = 50
+    results = {}
+    with copied_database(args.db) as engine, tempfile.TemporaryDirectory() as journal_dir:
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            event_id, duration = db.execute(select(Event.id, Event.duration).order_by(Event.id)).first()
+            attended = select(Participation.user_id).where(Participation.event_id == event_id)
+            students = db.execute(
+                select(User.id).where(User.role == "student", User.id.not_in(attended))
+                .order_by(User.id).limit(per_case * len(RECOVERY_CASES))
+            ).scalars().all()
+        if len(students) < per_case * len(RECOVERY_CASES):
+            raise SystemExit("Not enough students without a check-in for the recovery scenario")
+
+        url = engine.url.render_as_string(hide_password=False)
+        for number, case in enumerate(RECOVERY_CASES):
+            user_ids = students[number * per_case:(number + 1) * per_case]
+            crash_checkin_worker(url, journal_dir, case, event_id, duration, user_ids)
+            started = time.perf_counter()
+            recovered = CheckinBuffer(Session, journal_dir).recover()
+            elapsed = time.perf_counter() - started
+            results[f"recovery-{case}"] = summarize([elapsed * 1000.0], elapsed)
+            results[f"recovery-{case}"].update({"acknowledged": per_case, "recovered": recovered})
+    return results
+
+
+def scenario_archive(args) -> dict:
+    """Per-user history queries and participation index size before and after archiving closed years"""
+    from archive import closed_years, archive_year, archived_years, participation_history_query, table_stats
+    from main import participation_list_query, PARTICIPATION_LIST_COLUMNS
+
+    seeded_engine(args).dispose()
+    with copied_database(args.db) as engine:
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            users = [(user_id,) for user_id in db.execute(
+                select(Participation.user_id).distinct().order_by(Participation.user_id).limit(100)
+            ).scalars()]
+
+            def history(user_id):
+                db.execute(participation_list_query(user_id)).all()
+
+            before = timed_calls(history, users, args.repeats)
+            before["participation"] = table_stats(db, "participation")
+            started = time.perf_counter()
+            archived = [archive_year(db, year) for year in closed_years(db)]
+            archive_seconds = round(time.perf_counter() - started, 2)
+            after = timed_calls(history, users, args.repeats)
+            after["participation"] = table_stats(db, "participation")
+
+            years = archived_years(db)
+            full = timed_calls(
+                lambda user_id: db.execute(
+                    participation_history_query(user_id, years, PARTICIPATION_LIST_COLUMNS)
+                ).all(),
+                users, args.repeats,
+            )
+            full["archived"] = archived
+            full["archive_seconds"] = archive_seconds
+    return {"archive-history-before": before, "archive-history-after": after, "archive-full-history": full}
+
+
+def scenario_ledger(args) -> dict:
+    """Full ledger replay against an incremental one after corrections, and drift detection"""
+    from ledger import replay, drifted_totals, fix_totals, revoke_checkin
+
+    seeded_engine(args).dispose()
+    with copied_database(args.db) as engine:
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            full = replay(db, full=True)
+            clean = len(drifted_totals(db))
+
+            # Corrections go through the ledger; tampered totals do not
+            revoked = db.execute(
+                select(Participation.user_id, Participation.event_id)
+                .order_by(Participation.id.desc()).limit(args.ledger_corrections)
+            ).all()
+            for user_id, event_id in revoked:
+                revoke_checkin(db, user_id, event_id, reason="benchmark correction")
+            tampered = list(db.execute(
+                select(User.id).where(User.role == "student").order_by(User.id).limit(10)
+            ).scalars())
+            db.execute(
+                User.__table__.update().where(User.id.in_(tampered)).values(total_hours=User.total_hours + 5)
+            )
+            db.commit()
+
+            incremental = replay(db)
+            started = time.perf_counter()
+            drifted = drifted_totals(db)
+            verify_seconds = round(time.perf_counter() - started, 3)
+            fixed = fix_totals(db, [row["user_id"] for row in drifted])
+            remaining = len(drifted_totals(db))
+
+    failures = []
+    if clean:
+        failures.append(f"{clean} users drifted right after a full replay")
+    if incremental["entries"] != len(revoked):
+        failures.append(f"incremental replay read {incremental['entries']} entries, expected {len(revoked)}")
+    if sorted(row["user_id"] for row in drifted) != tampered:
+        failures.append(f"drift found for {len(drifted)} users, expected the {len(tampered)} tampered ones")
+    if remaining:
+        failures.append(f"{remaining} users still drifted after fixing")
+    return {
+        "ledger-replay-full": full,
+        "ledger-replay-incremental": incremental,
+        "ledger-check": {
+            "corrections": len(revoked),
+            "drifted": len(drifted),
+            "verify_seconds": verify_seconds,
+            "fixed": fixed,
+            "ok": not failures,
+            "error": "; ".join(failures) or None,
+        },
+    }
+
+
+def scenario_reports(args) -> dict:
+    """Weekly organizer reports: one grouped pass against a participants query per event"""
+    from datetime import date
+    from reports import organizer_aggregates, build_reports, week_bounds
+
+    seeded_engine(args).dispose()
+    # seed_data dates events around 2024-09-01
+    start, end = week_bounds(date(2024, 9, 2))
+    with copied_database(args.db) as engine:
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            event_ids = list(db.execute(
+                select(Event.id).where(Event.date >= start, Event.date < end).order_by(Event.id)
+            ).scalars())
+
+            def per_event():
+                # What an organizer's client does today: /events/{id}/participants for each event
+                for event_id in event_ids:
+                    db.execute(
+                        select(User.name, User.email, Participation.timestamp, Participation.hours_awarded)
+                        .join(User, User.id == Participation.user_id)
+                        .where(Participation.event_id == event_id)
+                    ).all()
+
+            loop = timed_calls(per_event, [()], args.repeats)
+            grouped = timed_calls(lambda: organizer_aggregates(db, start, end), [()], args.repeats)
+        loop["events"] = len(event_ids)
+        with tempfile.TemporaryDirectory() as directory:
+            grouped["build"] = build_reports(Session, start, end, force=True,
+                                             workers=args.report_workers, directory=directory)
+    return {"reports-per-event-queries": loop, "reports-grouped-pass": grouped}
+
+
+def scenario_event_list(args) -> dict:
+    """Organizer dashboard: a participants query per event against one grouped /my-events query"""
+    from main import event_list_query
+
+    seeded_engine(args).dispose()
+    with copied_database(args.db) as engine:
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            organizer_id, events = db.execute(
+                select(Event.organizer_id, func.count())
+                .group_by(Event.organizer_id)
+                .order_by(func.count().desc())
+                .limit(1)
+            ).one()
+            event_ids = list(db.execute(
+                select(Event.id).where(Event.organizer_id == organizer_id).order_by(Event.id)
+            ).scalars())
+
+            def per_event():
+                # What the dashboards did: the organizer's events, then each event's participants
+                db.execute(select(Event).where(Event.organizer_id == organizer_id)).all()
+                for event_id in event_ids:
+                    db.execute(
+                        select(User.name, User.email, Participation.timestamp, Participation.hours_awarded)
+                        .join(User, User.id == Participation.user_id)
+                        .where(Participation.event_id == event_id)
+                    ).all()
+
+            loop = timed_calls(per_event, [()], args.repeats)
+            grouped = timed_calls(
+                lambda: db.execute(event_list_query(Event.organizer_id == organizer_id)).all(), [()], args.repeats
+            )
+            every_event = timed_calls(lambda: db.execute(event_list_query()).all(), [()], args.repeats)
+            every_event["events"] = db.execute(select(func.count()).select_from(Event)).scalar()
+    loop["events"] = grouped["events"] = events
+    return {
+        "my-events-per-event-queries": loop,
+        "my-events-grouped": grouped,
+        "events-grouped": every_event,
+    }
+
+
+def scenario_overload(args) -> dict:
+    """Cheap endpoints while /scan-qr-image is flooded, without and with load shedding"""
+    import main
+
+    seeded_engine(args).dispose()
+    image_class = main.load_shedder.classes["image"]
+    limits = (image_class.max_concurrency, image_class.max_queue)
+    cheap_requests = min(args.requests, 200)
+    results = {}
+
+    async def cheap_while_flooded(app, workload, flood: bool):
+        flood_task = None
+        if flood:
+            # Shed requests are the point of the flood, not errors
+            flood_task = asyncio.ensure_future(run_endpoint(
+                app, workload, "scan-qr-image", args.requests, args.overload_concurrency,
+                expected=EXPECTED_STATUSES["scan-qr-image"] | {503}
+            ))
+            # Let the flood fill the queues first
+            await asyncio.sleep(0.5)
+        cheap = await run_endpoint(app, workload, "me", cheap_requests, 2)
+        return cheap, (await flood_task if flood_task else None)
+
+    with copied_database(args.db) as engine:
+        app, _ = bench_session(engine)
+        workload = Workload(engine, seed=args.random_seed)
+        try:
+            for mode, flood, shedding in (("idle", False, True), ("unlimited", True, False),
+                                          ("shedding", True, True)):
+                if shedding:
+                    image_class.max_concurrency, image_class.max_queue = limits
+                else:
+                    image_class.max_concurrency = image_class.max_queue = 10 ** 6
+                before = dict(image_class.shed)
+                cheap, flooded = asyncio.run(cheap_while_flooded(app, workload, flood))
+                results[f"overload-me-{mode}"] = cheap
+                if flooded is not None:
+                    flooded["shed"] = {reason: count - before[reason] for reason, count in image_class.shed.items()}
+                    results[f"overload-image-{mode}"] = flooded
+        finally:
+            image_class.max_concurrency, image_class.max_queue = limits
+    return results
+
+
+def scenario_image_memory(args) -> dict:
+    """Peak RSS of one /scan-qr-image decode, with the upload limits and without (checks.py enforces the budget)"""
+    from checks import IMAGE_QR_DATA, image_cases, measure_decode
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for case, path in image_cases(directory).items():
+            capped = measure_decode("capped", path)
+            full = measure_decode("full", path)
+            results[f"image-memory-{case}"] = {
+                "bytes": os.path.getsize(path),
+                "peak_rss_mb": capped["peak_rss_mb"],
+                "unbounded_peak_rss_mb": full["peak_rss_mb"],
+                "decoded": capped["result"] == IMAGE_QR_DATA,
+                "rejected": capped["error"],
+            }
+    return results
+
+
+# Libraries the API must not load until a request (or the pre-warm step) needs them
+LAZY_MODULES = ("cv2", "numpy", "pyzbar", "PIL", "qrcode", "reportlab", "pandas", "pyarrow")
+
+
+def measure_import(module: str) -> dict:
+    """Import ``module`` in a fresh interpreter under ``-X importtime``"""
+    code = (
+        f"import sys, json; import {module}; "
+        f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    total_us = 0
+    direct = {}
+    for line in proc.stderr.splitlines():
+        fields = line.partition("import time:")[2].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0 and name.strip() == module:
+            total_us = int(fields[1])
+        elif depth == 1:
+            direct[name.strip()] = int(fields[1])
+    return {"total_us": total_us, "direct_us": direct, "eager": json.loads(proc.stdout)}
+
+
+def check_import_budget(name: str, current: dict, previous: Optional[dict], tolerance: float):
+    """Regressions for an import measurement: over budget, eager heavy modules, or slower than baseline"""
+    regressions = []
+    if current["total_ms"] > current["budget_ms"]:
+        regressions.append(f"{name}: {current['total_ms']}ms > budget {current['budget_ms']}ms")
+    if current["eager_modules"]:
+        regressions.append(f"{name}: loads {', '.join(current['eager_modules'])} at import time")
+    if previous and current["total_ms"] > previous["total_ms"] * (1 + tolerance):
+        regressions.append(f"{name}: {current['total_ms']}ms > baseline {previous['total_ms']}ms")
+    return regressions
+
+
+def scenario_importtime(args) -> dict:
+    """Cold-start cost of importing the API module, as seen by a fresh worker"""
+    runs = [measure_import("main") for _ in range(args.import_runs)]
+    totals = sorted(run["total_us"] / 1000 for run in runs)
+    # The fastest run is the least disturbed by the OS; report its breakdown
+    fastest = min(runs, key=lambda run: run["total_us"])
+    slowest_imports = sorted(fastest["direct_us"].items(), key=lambda item: item[1], reverse=True)[:10]
+    return {
+        "import-main": {
+            "total_ms": round(totals[0], 1),
+            "median_ms": round(totals[len(totals) // 2], 1),
+            "budget_ms": args.import_budget_ms,
+            "eager_modules": sorted({m for run in runs for m in run["eager"]}),
+            "slowest_imports_ms": {name: round(us / 1000, 1) for name, us in slowest_imports},
+        }
+    }
+
+
+SCENARIOS = {
+    "endpoints": scenario_endpoints,
+    "search": scenario_search,
+    "json": scenario_json,
+    "importtime": scenario_importtime,
+    "qr": scenario_qr,
+    "checkin": scenario_checkin,
+    "burst": scenario_burst,
+    "checkin-recovery": scenario_checkin_recovery,
+    "archive": scenario_archive,
+    "overload": scenario_overload,
+    "image-memory": scenario_image_memory,
+    "ledger": scenario_ledger,
+    "reports": scenario_reports,
+    "event-list": scenario_event_list,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="endpoints", choices=sorted(SCENARIOS))
+    parser.add_argument("--db", default=BENCH_DB_PATH, help="benchmark SQLite file")
+    parser.add_argument("--seed", action="store_true", help="(re)seed the benchmark database first")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--events", type=int, default=10_000)
+    parser.add_argument("--participations", type=int, default=2_000_000)
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help="comma separated subset of: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--overload-concurrency", type=int, default=32,
+                        help="clients flooding /scan-qr-image in the overload scenario")
+    parser.add_argument("--ledger-corrections", type=int, default=100,
+                        help="check-ins revoked before the incremental replay in the ledger scenario")
+    parser.add_argument("--report-workers", type=int, default=2,
+                        help="render processes in the reports scenario")
+    parser.add_argument("--repeats", type=int, default=20, help="repetitions for micro-benchmarks")
+    parser.add_argument("--search-db", default="bench_search.db", help="SQLite file for the search scenario")
+    parser.add_argument("--search-events", type=int, default=100_000)
+    parser.add_argument("--json-rows", type=int, default=10_000, help="rows for the json scenario")
+    parser.add_argument("--import-runs", type=int, default=5, help="fresh interpreters for the importtime scenario")
+    parser.add_argument("--import-budget-ms", type=float, default=1000.0,
+                        help="fail the importtime scenario when `import main` takes longer")
+    parser.add_argument("--backends", default="sqlite",
+                        help="comma separated: sqlite, postgresql (temporary cluster) or database URLs")
+    parser.add_argument("--pg-bin", help="directory with initdb and pg_ctl for --backends postgresql")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative regression before failing (default 0.25)")
+    args = parser.parse_args(argv)
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if backends == ["sqlite"]:
+        results = SCENARIOS[args.scenario](args)
+    else:
+        results = run_backends(args, backends)
+
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+        return 0
+
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print("Performance regressions detected:", file=sys.stderr)
+        for line in regressions:
+            print(f"  - {line}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from auth import verify_token
+from shared_cache import CacheUnavailable, TableVersions, table_versions
+
+
+class LRUCache:
+    """Thread-safe mapping that evicts the least recently used entry beyond ``max_entries``"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CachedRoute:
+    """Cache policy for one GET route: the tables it reads and whether it is per-user"""
+
+    def __init__(self, tables, user_scoped: bool = False):
+        self.tables = tuple(tables)
+        self.user_scoped = user_scoped
+
+
+class ResponseCacheMiddleware:
+    """ASGI middleware serving cached JSON bodies for read-heavy GET routes.
+
+    ETags are derived from the route, the caller (for per-user routes), the
+    query string and the versions of the tables the route reads, so a
+    matching ``If-None-Match`` is answered with 304 without calling the
+    endpoint, and an unchanged body is replayed from an LRU cache.
+    """
+
+    def __init__(self, app, routes: Dict[str, CachedRoute], max_entries: int = 1024,
+                 max_age: int = 0, versions: TableVersions = None):
+        self.app = app
+        self.routes = routes
+        self.cache = LRUCache(max_entries)
+        self.max_age = max_age
+        self.versions = versions or table_versions
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+
+    async def __call__(self, scope, receive, send):
+        route = self.routes.get(scope.get("path")) if scope["type"] == "http" else None
+        if route is None or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        user_scope = ""
+        if route.user_scoped:
+            user_scope = self._user_scope(headers.get(b"authorization", b""))
+            if user_scope is None:
+                # Let the endpoint produce its own 401/403
+                await self.app(scope, receive, send)
+                return
+
+        query = scope.get("query_string", b"").decode("latin-1")
+        try:
+            etag = await self._etag(scope["path"], user_scope, query, route.tables)
+        except CacheUnavailable:
+            # Cannot tell whether a cached body is current; serve a fresh one
+            await self.app(scope, receive, send)
+            return
+        cache_control = (
+            f"{'private' if route.user_scoped else 'public'}, max-age={self.max_age}, must-revalidate"
+        )
+
+        if etag in self._parse_if_none_match(headers.get(b"if-none-match", b"")):
+            self.not_modified += 1
+            await self._send(send, 304, [], b"", etag, cache_control)
+            return
+
+        key = (scope["path"], user_scope, query)
+        entry = self.cache.get(key)
+        if entry is not None and entry[0] == etag:
+            self.hits += 1
+            await self._send(send, 200, entry[1], entry[2], etag, cache_control)
+            return
+
+        self.misses += 1
+        await self._call_and_store(scope, receive, send, key, etag, cache_control)
+
+    async def _call_and_store(self, scope, receive, send, key, etag, cache_control):
+        start = {}
+        body = []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+
+        payload = b"".join(body)
+        status_code = start.get("status", 500)
+        headers = [
+            (name, value) for name, value in start.get("headers", [])
+            if name.lower() not in (b"content-length", b"etag", b"cache-control")
+        ]
+        if status_code == 200:
+            self.cache.set(key, (etag, headers, payload))
+            await self._send(send, status_code, headers, payload, etag, cache_control)
+        else:
+            await self._send(send, status_code, headers, payload)
+
+    @staticmethod
+    async def _send(send, status_code, headers, body, etag=None, cache_control=None):
+        headers = list(headers)
+        if etag is not None:
+            headers.append((b"etag", etag.encode("latin-1")))
+            headers.append((b"cache-control", cache_control.encode("latin-1")))
+        if status_code != 304:
+            headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _etag(self, path: str, user_scope: str, query: str, tables) -> str:
+        versions = ",".join(str(v) for v in await self.versions.asnapshot(tables))
+        raw = f"{self.versions.epoch}|{path}|{user_scope}|{query}|{versions}"
+        return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+    @staticmethod
+    def _user_scope(authorization: bytes) -> Optional[str]:
+        scheme, _, token = authorization.decode("latin-1").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        return verify_token(token.strip())
+
+    @staticmethod
+    def _parse_if_none_match(value: bytes):
+        tags = set()
+        for tag in value.decode("latin-1").split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag:
+                tags.add(tag)
+        return tags
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.cache),
+            "hits": self.hits,
+            "not_modified": self.not_modified,
+            "misses": self.misses,
+        }
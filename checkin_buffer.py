@@ -0,0 +1,274 @@
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import text, select
+
+from database import insert_ignore
+from ledger import record_entries, ledger_entry, LEDGER_GRANT
+from models import Participation
+from shared_cache import CacheBackend, cache_backend
+
+ADD_HOURS = text("UPDATE users SET total_hours = COALESCE(total_hours, 0) + :hours WHERE id = :user_id")
+
+
+class Checkin(NamedTuple):
+    user_id: int
+    event_id: int
+    timestamp: datetime
+    hours_awarded: float
+
+    def to_json(self) -> str:
+        return json.dumps([self.user_id, self.event_id, self.timestamp.isoformat(), self.hours_awarded])
+
+    @classmethod
+    def from_json(cls, line: str) -> "Checkin":
+        user_id, event_id, timestamp, hours_awarded = json.loads(line)
+        return cls(user_id, event_id, datetime.fromisoformat(timestamp), hours_awarded)
+
+
+class CheckinJournal:
+    """Append-only file of acknowledged check-ins, one JSON array per line.
+
+    Each journal is locked with ``flock`` by the worker that writes it for
+    as long as it is open, so a journal that can be locked by someone else
+    belongs to a worker that died and is safe to recover.
+    """
+
+    def __init__(self, directory: str, fsync: bool = True):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fsync = fsync
+        self.path = os.path.join(directory, f"{os.getpid()}-{time.time_ns()}.log")
+        self._file = open(self.path, "a", encoding="utf-8")
+        fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def append(self, checkin: Checkin):
+        self._file.write(checkin.to_json() + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self, remove: bool = False):
+        if remove:
+            os.unlink(self.path)
+        self._file.close()
+
+    @staticmethod
+    def read(path: str) -> List[Checkin]:
+        checkins = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    checkins.append(Checkin.from_json(line))
+                except (ValueError, TypeError):
+                    # A torn final line from a crash mid-write was never acknowledged
+                    break
+        return checkins
+
+    @classmethod
+    def claim_orphans(cls, directory: str, own_path: str = None):
+        """Yield (path, checkins) for journals left behind by workers that are gone"""
+        for path in sorted(glob.glob(os.path.join(directory, "*.log"))):
+            if path == own_path:
+                continue
+            try:
+                f = open(path, "r+", encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Still held by a live worker
+                f.close()
+                continue
+            try:
+                yield path, cls.read(path)
+                os.unlink(path)
+            finally:
+                f.close()
+
+
+class CheckinBuffer:
+    """Group commit for check-ins.
+
+    ``submit`` rejects users who already have a row or a check-in claimed in
+    the shared cache (possibly by another worker), appends the check-in to
+    the journal and returns; a background thread writes pending check-ins,
+    the matching ``total_hours`` increments and their ledger entries in one
+    transaction every ``flush_interval`` seconds. Each flush starts a new
+    journal and deletes the previous ones once their entries are committed.
+    """
+
+    def __init__(self, session_factory, journal_dir: str, flush_interval: float = 0.02,
+                 max_batch: int = 500, fsync: bool = True, claim_ttl: float = 86400,
+                 on_flush: Optional[Callable[[List[Checkin]], None]] = None,
+                 backend: CacheBackend = None):
+        self.session_factory = session_factory
+        self.journal_dir = journal_dir
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.on_flush = on_flush
+        self.journal: Optional[CheckinJournal] = None
+        # Journals swapped out by a flush whose entries are not all committed yet
+        self._retired: List[CheckinJournal] = []
+        # Claims must outlive the flush; afterwards the row itself rejects repeats
+        self.claim_ttl = claim_ttl
+        self.backend = backend or cache_backend
+        self._pending: List[Checkin] = []
+        self._pending_hours: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.flushed = 0
+        self.batches = 0
+
+    def start(self) -> int:
+        """Recover orphaned journals, open this worker's journal and start flushing"""
+        recovered = self.recover()
+        self.journal = CheckinJournal(self.journal_dir, self.fsync)
+        self._thread = threading.Thread(target=self._run, name="checkin-flusher", daemon=True)
+        self._thread.start()
+        return recovered
+
+    def recover(self) -> int:
+        recovered = 0
+        own_path = self.journal.path if self.journal else None
+        for path, checkins in CheckinJournal.claim_orphans(self.journal_dir, own_path):
+            for start in range(0, len(checkins), self.max_batch):
+                recovered += self._write(checkins[start:start + self.max_batch])
+            print(f"Recovered {len(checkins)} journaled check-ins from {path}")
+        return recovered
+
+    def submit(self, user_id: int, event_id: int, hours_awarded: float,
+               timestamp: datetime = None) -> Optional[Checkin]:
+        """Accept a check-in once it is journaled; None if the user already has one"""
+        if self._has_row(user_id, event_id):
+            return None
+        # Atomic across workers sharing the backend: only the first scan gets the claim
+        claim = f"checkin:{event_id}:{user_id}"
+        if not self.backend.add(claim, 1, ttl=self.claim_ttl):
+            return None
+        checkin = Checkin(user_id, event_id, timestamp or datetime.utcnow(), hours_awarded)
+        with self._lock:
+            try:
+                self.journal.append(checkin)
+            except Exception:
+                self.backend.delete(claim)
+                raise
+            self._pending.append(checkin)
+            self._pending_hours[user_id] = self._pending_hours.get(user_id, 0.0) + hours_awarded
+            if len(self._pending) >= self.max_batch:
+                self._wakeup.set()
+        return checkin
+
+    def pending_hours(self, user_id: int) -> float:
+        """Hours acknowledged for the user but not yet in users.total_hours"""
+        return self._pending_hours.get(user_id, 0.0)
+
+    def _has_row(self, user_id: int, event_id: int) -> bool:
+        with self.session_factory() as db:
+            return db.execute(
+                select(Participation.id)
+                .where(Participation.user_id == user_id, Participation.event_id == event_id)
+            ).first() is not None
+
+    def flush(self) -> int:
+        """Write every pending check-in; safe to call from any thread"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                if batch:
+                    # Later check-ins go to a fresh journal, so this one can be deleted once written
+                    self._retired.append(self.journal)
+                    self.journal = CheckinJournal(self.journal_dir, self.fsync)
+            written = 0
+            try:
+                for start in range(0, len(batch), self.max_batch):
+                    written += self._write(batch[start:start + self.max_batch])
+            except Exception:
+                # Keep the batch (already-written rows are skipped on retry)
+                with self._lock:
+                    self._pending = batch + self._pending
+                raise
+            with self._lock:
+                for checkin in batch:
+                    remaining = self._pending_hours.get(checkin.user_id, 0.0) - checkin.hours_awarded
+                    if remaining > 1e-9:
+                        self._pending_hours[checkin.user_id] = remaining
+                    else:
+                        self._pending_hours.pop(checkin.user_id, None)
+                # Every entry of the retired journals is in the database now
+                retired, self._retired = self._retired, []
+            for journal in retired:
+                journal.close(remove=True)
+            if batch and self.on_flush:
+                self.on_flush(batch)
+            return written
+
+    def _write(self, batch: List[Checkin]) -> int:
+        """Insert a batch in one transaction, returning how many rows were new"""
+        if not batch:
+            return 0
+        inserted = 0
+        hours: Dict[int, float] = {}
+        grants = []
+        with self.session_factory() as db:
+            # Idempotent insert: replaying a journal after a crash never duplicates a check-in
+            insert_checkin = insert_ignore(db.get_bind(), Participation)
+            for checkin in batch:
+                if db.execute(insert_checkin.values(**checkin._asdict())).rowcount:
+                    inserted += 1
+                    hours[checkin.user_id] = hours.get(checkin.user_id, 0.0) + checkin.hours_awarded
+                    grants.append(ledger_entry(checkin.user_id, checkin.hours_awarded, LEDGER_GRANT,
+                                               checkin.event_id, created_at=checkin.timestamp))
+            if hours:
+                db.execute(ADD_HOURS, [{"user_id": user_id, "hours": h} for user_id, h in hours.items()])
+            record_entries(db, grants)
+            db.commit()
+        self.flushed += inserted
+        self.batches += 1
+        return inserted
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Entries stay in the journal and are replayed on the next start
+                print(f"Error flushing check-ins: {e}")
+
+    def stop(self):
+        """Flush what is pending and release the journal"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.journal is None:
+            return
+        self.flush()
+        with self._lock:
+            empty = not self._pending
+        # After a failed flush the journals stay on disk for the next start to recover
+        for journal in self._retired:
+            journal.close()
+        self._retired = []
+        self.journal.close(remove=empty)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "journals": len(self._retired) + 1,
+        }
@@ -0,0 +1,328 @@
+"""Correctness checks for check-in crash recovery, load shedding and image memory limits.
+
+Each check builds what it needs in a temporary directory (a small SQLite
+database, check-in journals, images) and runs in seconds, without the
+seeded benchmark database; benchmark.py only measures timings.
+
+Usage:
+    python checks.py                      # run every check
+    python checks.py checkin-recovery     # only the named checks
+    python checks.py image-memory --image-rss-budget-mb 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import qrcode
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import sessionmaker
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+RECOVERY_CASES = ("crash-before-flush", "crash-mid-flush", "crash-mid-append")
+
+# Journals check-ins in a separate process and dies without flushing, as a killed worker would;
+# "crash-mid-flush" first flushes half of them but keeps a copy of the journal the flush deleted,
+# "crash-mid-append" leaves a torn final line that was never acknowledged
+CRASH_CHILD = """
+import json, os, shutil, sys
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from checkin_buffer import CheckinBuffer
+
+url, journal_dir, case, event_id, hours, user_ids = sys.argv[1:]
+event_id, hours, user_ids = int(event_id), float(hours), json.loads(user_ids)
+buffer = CheckinBuffer(sessionmaker(bind=create_engine(url)), journal_dir, flush_interval=3600)
+buffer.start()
+half = len(user_ids) // 2 if case == "crash-mid-flush" else 0
+for user_id in user_ids[:half]:
+    buffer.submit(user_id, event_id, hours)
+if half:
+    shutil.copyfile(buffer.journal.path, buffer.journal.path[:-len(".log")] + "-committed.log")
+    buffer.flush()
+for user_id in user_ids[half:]:
+    if buffer.submit(user_id, event_id, hours) is None:
+        sys.exit(f"check-in of user {user_id} was not acknowledged")
+if case == "crash-mid-append":
+    with open(buffer.journal.path, "a", encoding="utf-8") as f:
+        f.write('[1, 2, "2024-')
+        f.flush()
+os._exit(0)
+"""
+
+
+def crash_checkin_worker(url: str, journal_dir: str, case: str, event_id: int, hours: float, user_ids):
+    """Acknowledge check-ins for ``user_ids`` in a worker process that then crashes"""
+    # Claims in a shared cache would outlive the throwaway database
+    env = dict(os.environ, DATABASE_URL=url, CACHE_BACKEND="memory")
+    subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", CRASH_CHILD, url, journal_dir, case,
+         str(event_id), str(hours), json.dumps(list(user_ids))],
+        check=True, cwd=HERE, env=env,
+    )
+
+
+def tiny_database(directory: str, students: int):
+    """SQLite file with one organizer, ``students`` students and one event; returns (url, event, ids)"""
+    from ledger import ensure_ledger
+    from models import Base, User, Event
+
+    url = f"sqlite:///{os.path.join(directory, 'checks.db')}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    ensure_ledger(engine)
+    with sessionmaker(bind=engine)() as db:
+        organizer = User(name="Organizer", email="organizer@example.com", password_hash="-", role="organizer")
+        db.add(organizer)
+        db.flush()
+        event = Event(name="Check", date=datetime.utcnow(), duration=2.0, organizer_id=organizer.id,
+                      qr_code_data="alumni_club_event_checks")
+        users = [User(name=f"Student {i}", email=f"student{i}@example.com", password_hash="-",
+                      role="student", total_hours=0.0) for i in range(students)]
+        db.add_all([event, *users])
+        db.commit()
+        event = (event.id, event.duration)
+        user_ids = [user.id for user in users]
+    engine.dispose()
+    return url, event, user_ids
+
+
+def check_checkin_recovery(per_case: int = 20) -> dict:
+    """Crash around the check-in journal; recovery must write each acknowledged check-in exactly once"""
+    from checkin_buffer import CheckinBuffer
+    from models import User, Participation, HourLedgerEntry
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        url, (event_id, duration), students = tiny_database(directory, per_case * len(RECOVERY_CASES))
+        engine = create_engine(url)
+        Session = sessionmaker(bind=engine)
+        journal_dir = os.path.join(directory, "journal")
+        for number, case in enumerate(RECOVERY_CASES):
+            user_ids = students[number * per_case:(number + 1) * per_case]
+            crash_checkin_worker(url, journal_dir, case, event_id, duration, user_ids)
+            CheckinBuffer(Session, journal_dir).recover()
+
+            with Session() as db:
+                rows = db.execute(
+                    select(func.count()).select_from(Participation)
+                    .where(Participation.event_id == event_id, Participation.user_id.in_(user_ids))
+                ).scalar()
+                hours = db.execute(select(func.sum(User.total_hours)).where(User.id.in_(user_ids))).scalar()
+                grants = db.execute(
+                    select(func.count()).select_from(HourLedgerEntry).where(HourLedgerEntry.user_id.in_(user_ids))
+                ).scalar()
+            hours_ok = abs(hours - per_case * duration) < 1e-6
+            leftover = os.listdir(journal_dir)
+            ok = rows == per_case and grants == per_case and hours_ok and not leftover
+            results[f"recovery-{case}"] = {
+                "acknowledged": per_case,
+                "rows": rows,
+                "ledger_grants": grants,
+                "hours_ok": hours_ok,
+                "journals_left": len(leftover),
+                "ok": ok,
+                "error": None if ok else (
+                    f"{rows}/{per_case} rows, {grants} grants, hours_ok={hours_ok}, {len(leftover)} journals left"
+                ),
+            }
+        engine.dispose()
+    return results
+
+
+async def _shedding_round() -> dict:
+    from load_shedding import RouteClass, LoadShedder, LoadSheddingMiddleware
+
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        if scope["path"] != "/cheap":
+            await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    middleware = LoadSheddingMiddleware(app, LoadShedder(
+        classes={
+            "image": RouteClass("image", max_concurrency=1, max_queue=1, deadline_seconds=5.0),
+            "slow": RouteClass("slow", max_concurrency=1, max_queue=0, deadline_seconds=0.2),
+        },
+        routes={"/image": "image", "/slow": "slow"},
+    ))
+
+    async def request(path: str) -> int:
+        statuses = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        await middleware({"type": "http", "method": "GET", "path": path, "headers": []}, receive, send)
+        return statuses[0]
+
+    running = asyncio.ensure_future(request("/image"))
+    queued = asyncio.ensure_future(request("/image"))
+    await asyncio.sleep(0.05)
+    statuses = {
+        # One running, one queued: the next is shed at once instead of waiting
+        "image-over-queue": await asyncio.wait_for(request("/image"), 1.0),
+        # Routes without a class are not held up by a saturated one
+        "cheap-while-saturated": await asyncio.wait_for(request("/cheap"), 1.0),
+        "slow-past-deadline": await asyncio.wait_for(request("/slow"), 1.0),
+    }
+    release.set()
+    statuses["image-running"], statuses["image-queued"] = await asyncio.gather(running, queued)
+    return statuses
+
+
+def check_load_shedding() -> dict:
+    """A saturated route class sheds with 503 and 504 while other routes are served"""
+    expected = {"image-over-queue": 503, "cheap-while-saturated": 200, "slow-past-deadline": 504,
+                "image-running": 200, "image-queued": 200}
+    statuses = asyncio.run(_shedding_round())
+    wrong = [f"{name}: {statuses[name]} != {status}" for name, status in expected.items()
+             if statuses[name] != status]
+    return {"load-shedding": {
+        "statuses": statuses,
+        "ok": not wrong,
+        "error": "; ".join(wrong) or None,
+    }}
+
+
+# Decodes one image file in a fresh interpreter and reports the growth of peak RSS (Linux);
+# "full" mode is the unbounded reference: the whole image decoded at full size
+DECODE_CHILD = """
+import json, sys
+from qr_utils import decode_qr_from_image, prewarm
+prewarm()
+import numpy as np
+from PIL import Image
+from pyzbar import pyzbar
+
+def memory_kb(field):
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(field + ":"))
+
+mode, path = sys.argv[1:]
+with open(path, "rb") as f:
+    data = f.read()
+# Reset the peak so import-time allocations do not mask the decode (Linux >= 4.0)
+with open("/proc/self/clear_refs", "w") as f:
+    f.write("5")
+before = memory_kb("VmRSS")
+result = error = None
+try:
+    if mode == "full":
+        Image.MAX_IMAGE_PIXELS = None
+        pixels = np.array(Image.open(path).convert("RGB"))
+        codes = pyzbar.decode(pixels)
+        result = codes[0].data.decode() if codes else None
+    else:
+        result = decode_qr_from_image(data)
+except ValueError as e:
+    error = type(e).__name__
+peak = memory_kb("VmHWM")
+print(json.dumps({"peak_rss_mb": round((peak - before) / 1024, 1), "result": result, "error": error}))
+"""
+
+IMAGE_QR_DATA = "alumni_club_event_" + "0" * 24
+
+
+def image_cases(directory: str, qr_data: str = IMAGE_QR_DATA) -> dict:
+    """A phone photo (rotated by EXIF), a large screenshot and a decompression bomb"""
+    from PIL import Image
+
+    code = qrcode.make(qr_data).get_image().convert("RGB").resize((1200, 1200))
+    scene = Image.new("RGB", (4000, 3000), "white")
+    scene.paste(code, (1400, 900))
+    paths = {}
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # stored rotated, displayed upright
+    paths["photo-jpeg-12mp"] = os.path.join(directory, "photo.jpg")
+    scene.rotate(90, expand=True).save(paths["photo-jpeg-12mp"], "JPEG", quality=90, exif=exif)
+
+    paths["screenshot-png-12mp"] = os.path.join(directory, "screenshot.png")
+    scene.save(paths["screenshot-png-12mp"], "PNG")
+
+    # Tens of kilobytes on the wire, 144 megapixels once decoded
+    paths["bomb-png-144mp"] = os.path.join(directory, "bomb.png")
+    Image.new("1", (12000, 12000), 1).save(paths["bomb-png-144mp"], "PNG")
+    return paths
+
+
+def measure_decode(mode: str, path: str) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", DECODE_CHILD, mode, path],
+        capture_output=True, text=True, check=True, cwd=HERE,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def check_image_memory(budget_mb: float = 96.0) -> dict:
+    """Capped decodes stay under the RSS budget, decode real photos and reject bombs before decoding"""
+    failures = []
+    cases = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for case, path in image_cases(directory).items():
+            capped = measure_decode("capped", path)
+            cases[case] = capped["peak_rss_mb"]
+            if capped["peak_rss_mb"] > budget_mb:
+                failures.append(f"{case}: {capped['peak_rss_mb']}MB > {budget_mb}MB")
+            if case.startswith("bomb"):
+                if capped["error"] != "ImageTooLarge":
+                    failures.append(f"{case}: not rejected before decoding")
+            elif capped["result"] != IMAGE_QR_DATA:
+                failures.append(f"{case}: QR code not decoded ({capped['error'] or capped['result']})")
+    return {"image-memory": {
+        "budget_mb": budget_mb,
+        "peak_rss_mb": cases,
+        "ok": not failures,
+        "error": "; ".join(failures) or None,
+    }}
+
+
+CHECKS = {
+    "checkin-recovery": lambda args: check_checkin_recovery(),
+    "load-shedding": lambda args: check_load_shedding(),
+    "image-memory": lambda args: check_image_memory(args.image_rss_budget_mb),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("checks", nargs="*", help="checks to run (default: all): " + ", ".join(CHECKS))
+    parser.add_argument("--image-rss-budget-mb", type=float, default=96.0,
+                        help="peak RSS growth allowed for one image decode")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(unknown)}")
+
+    results = {}
+    for name in args.checks or CHECKS:
+        started = time.perf_counter()
+        for key, result in CHECKS[name](args).items():
+            results[key] = result
+        print(f"{name}: {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+    failed = [f"{name}: {result['error']}" for name, result in results.items() if not result["ok"]]
+    if failed:
+        print("Checks failed:", file=sys.stderr)
+        for line in failed:
+            print(f"  - {line}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
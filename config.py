@@ -19,8 +19,13 @@ class Settings(BaseSettings):
     password_min_length: int = 8
     
     # Database Configuration
-    database_url: str = "sqlite:///./data/alumni_club.db"
+    database_url: str = "sqlite:///./alumni_club.db"
     db_echo: bool = False
+    # Connection pool; size + overflow covers the 40 threadpool threads (recycle: PostgreSQL only)
+    db_pool_size: int = 10
+    db_max_overflow: int = 30
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 1800
     
     # Email Configuration
     smtp_server: str = "smtp.gmail.com"
@@ -33,10 +38,94 @@ class Settings(BaseSettings):
     # File Upload Settings
     max_file_size_mb: int = 10
     allowed_image_extensions: List[str] = ["png", "jpg", "jpeg", "gif"]
+    # QR images: pixel limit checked from the header, and the side they are decoded at
+    max_image_megapixels: int = 24
+    qr_decode_max_side: int = 1600
     
     # Rate Limiting
+    rate_limit_enabled: bool = True
     rate_limit_requests: int = 100
     rate_limit_window_minutes: int = 15
+    # Anonymous requests only; signed-in requests count against rate_limit_requests alone
+    rate_limit_ip_requests: int = 1000
+    # Login/registration attempts per email, and per IP (sized for an event behind one NAT)
+    rate_limit_login_requests: int = 20
+    rate_limit_register_requests: int = 10
+    rate_limit_login_ip_requests: int = 5000
+    rate_limit_register_ip_requests: int = 5000
+    rate_limit_scan_image_requests: int = 20
+    rate_limit_max_keys: int = 100000
+    
+    # QR Codes (signing key defaults to secret_key)
+    qr_signing_key: str = ""
+    qr_valid_before_hours: int = 24
+    qr_valid_after_hours: int = 24
+    qr_rotation_seconds: int = 30
+    qr_require_signature: bool = False
+    
+    # Hot-event index for check-ins (events from N hours ago to N hours ahead)
+    event_index_enabled: bool = True
+    event_index_past_hours: int = 24
+    event_index_ahead_hours: int = 72
+    event_index_refresh_seconds: int = 300
+    
+    # Group commit for check-ins: acknowledge once journaled, write in batches
+    checkin_buffer_enabled: bool = False
+    checkin_journal_dir: str = "./data/checkin_journal"
+    checkin_journal_fsync: bool = True
+    checkin_flush_interval_ms: int = 20
+    checkin_flush_max_batch: int = 500
+    
+    # Archival: participation from academic years before the current one moves to archive tables
+    academic_year_start_month: int = 9
+    
+    # Weekly organizer reports (PDF + CSV), built by a scheduler in the API process
+    reports_enabled: bool = False
+    report_dir: str = "./data/reports"
+    report_weekday: int = 0  # 0 = Monday; covers the week that just ended
+    report_hour_utc: int = 6
+    report_workers: int = 2
+    
+    # Shared Cache ("memory" for one worker, "sqlite" to share between workers)
+    cache_backend: str = "memory"
+    shared_cache_path: str = "./data/shared_cache.db"
+    # How long a worker waits for another one's write lock on the shared cache
+    shared_cache_busy_timeout_ms: int = 500
+    cache_poll_interval_ms: int = 500
+    create_tables_on_startup: bool = True
+    
+    # Load QR/PDF libraries in the background after startup instead of on first use
+    prewarm_heavy_imports: bool = False
+    
+    # Response Cache
+    response_cache_enabled: bool = True
+    response_cache_max_entries: int = 1024
+    response_cache_max_age_seconds: int = 0
+    
+    # Idempotency-Key replay for retried POST /scan-qr, /scan-qr-image and /events
+    idempotency_enabled: bool = True
+    idempotency_ttl_seconds: int = 86400
+    idempotency_lock_seconds: int = 60
+    idempotency_max_response_kb: int = 256
+    
+    # Load shedding: concurrency limits and bounded queues per route class
+    load_shedding_enabled: bool = True
+    shed_image_concurrency: int = 4
+    shed_image_queue: int = 16
+    shed_auth_concurrency: int = 8
+    shed_auth_queue: int = 64
+    shed_checkin_concurrency: int = 32
+    shed_checkin_queue: int = 256
+    shed_target_ms: int = 100
+    shed_interval_ms: int = 1000
+    shed_deadline_seconds: int = 10
+    
+    # Serialize list endpoints with orjson straight from SQL rows
+    fast_json_responses: bool = False
+    
+    # Live Attendance Stream
+    attendance_replay_size: int = 100
+    attendance_heartbeat_seconds: int = 15
     
     # CORS Settings
     allowed_origins: List[str] = ["http://localhost:8501", "http://127.0.0.1:8501"]
@@ -77,4 +166,5 @@ class Settings(BaseSettings):
 settings = Settings()
 
 # Create data directory if it doesn't exist
-os.makedirs(os.path.dirname(settings.database_url.replace("sqlite:///", "")), exist_ok=True)
+if settings.database_url.startswith("sqlite:///"):
+    os.makedirs(os.path.dirname(settings.database_url.replace("sqlite:///", "")) or ".", exist_ok=True)
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import Event
+from shared_cache import invalidation_bus
+
+
+class IndexedEvent(NamedTuple):
+    """The immutable part of an event that a check-in needs"""
+    id: int
+    name: str
+    duration: float
+    date: datetime
+    qr_code_data: str
+
+
+class EventIndex:
+    """In-process map of upcoming and ongoing events by id and QR data.
+
+    Events never change after creation, so entries are only added (on
+    ``create_event`` or a read-through miss) and dropped when a periodic
+    reload slides the date window past them.
+    """
+
+    def __init__(self, past_hours: int = 24, ahead_hours: int = 72):
+        self.past_hours = past_hours
+        self.ahead_hours = ahead_hours
+        self._by_id: Dict[int, IndexedEvent] = {}
+        self._by_qr_data: Dict[str, IndexedEvent] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loaded_at: Optional[datetime] = None
+
+    def window(self, now: datetime = None):
+        now = now or datetime.utcnow()
+        return now - timedelta(hours=self.past_hours), now + timedelta(hours=self.ahead_hours)
+
+    def load(self, db: Session, date_from: datetime = None, date_to: datetime = None, everything: bool = False):
+        """Replace the index with the events in the window (or every event)"""
+        if not everything and date_from is None and date_to is None:
+            date_from, date_to = self.window()
+        query = select(Event.id, Event.name, Event.duration, Event.date, Event.qr_code_data)
+        if date_from is not None:
+            query = query.where(Event.date >= date_from)
+        if date_to is not None:
+            query = query.where(Event.date <= date_to)
+        by_id = {}
+        by_qr_data = {}
+        for row in db.execute(query):
+            entry = IndexedEvent(*row)
+            by_id[entry.id] = entry
+            by_qr_data[entry.qr_code_data] = entry
+        with self._lock:
+            self._by_id, self._by_qr_data = by_id, by_qr_data
+            self.loaded_at = datetime.utcnow()
+        return len(by_id)
+
+    def add(self, event) -> bool:
+        """Index an event if it falls inside the window; accepts models and IndexedEvent"""
+        date = event.date
+        if date.tzinfo is not None:
+            date = date.astimezone(timezone.utc).replace(tzinfo=None)
+        date_from, date_to = self.window()
+        if not date_from <= date <= date_to:
+            return False
+        entry = IndexedEvent(event.id, event.name, event.duration, date, event.qr_code_data)
+        with self._lock:
+            self._by_id[entry.id] = entry
+            self._by_qr_data[entry.qr_code_data] = entry
+        return True
+
+    def get(self, event_id: int) -> Optional[IndexedEvent]:
+        return self._count(self._by_id.get(event_id))
+
+    def get_by_qr_data(self, qr_data: str) -> Optional[IndexedEvent]:
+        return self._count(self._by_qr_data.get(qr_data))
+
+    def _count(self, entry):
+        # Plain counters: an occasional lost increment under threads is acceptable for a metric
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._by_id, self._by_qr_data = {}, {}
+            self.hits = self.misses = 0
+            self.loaded_at = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "events": len(self._by_id),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+        }
+
+
+event_index = EventIndex(settings.event_index_past_hours, settings.event_index_ahead_hours)
+
+
+def announce_event(event):
+    """Index a newly created event in every worker"""
+    invalidation_bus.publish("events", {
+        "id": event.id,
+        "name": event.name,
+        "duration": event.duration,
+        "date": event.date.isoformat(),
+        "qr_code_data": event.qr_code_data,
+    })
+
+
+invalidation_bus.subscribe("events", lambda message: event_index.add(IndexedEvent(
+    message["id"], message["name"], message["duration"],
+    datetime.fromisoformat(message["date"]), message["qr_code_data"],
+)))
+
+
+def reload_index(session_factory) -> int:
+    with session_factory() as db:
+        return event_index.load(db)
+
+
+async def refresh_periodically(session_factory, interval_seconds: float):
+    """Reload the index so the window keeps sliding forward"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await asyncio.to_thread(reload_index, session_factory)
+        except Exception as e:
+            print(f"Error refreshing event index: {e}")
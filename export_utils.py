@@ -0,0 +1,198 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Optional, Sequence
+
+from sqlalchemy import Table, select, union_all
+
+from models import User, Event, Participation
+
+EXPORT_CHUNK_SIZE = 5000
+
+EXPORT_COLUMNS = [
+    "participation_id",
+    "user_id",
+    "user_name",
+    "user_email",
+    "event_id",
+    "event_name",
+    "event_date",
+    "timestamp",
+    "hours_awarded",
+]
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def participation_export_query(event_id: Optional[int] = None,
+                               date_from: Optional[datetime] = None,
+                               date_to: Optional[datetime] = None,
+                               tables: Sequence[Table] = None):
+    """Build the Participation x User x Event select used by every export format.
+
+    ``tables`` are participation-shaped tables to read (default: participation
+    only); archive tables from archive.py are unioned in with the hot table.
+    """
+    queries = []
+    for table in tables or [Participation.__table__]:
+        query = (
+            select(*[
+                column.label(name) for column, name in zip((
+                    table.c.id,
+                    User.id,
+                    User.name,
+                    User.email,
+                    Event.id,
+                    Event.name,
+                    Event.date,
+                    table.c.timestamp,
+                    table.c.hours_awarded,
+                ), EXPORT_COLUMNS)
+            ])
+            .join(User, User.id == table.c.user_id)
+            .join(Event, Event.id == table.c.event_id)
+        )
+        if event_id is not None:
+            query = query.where(table.c.event_id == event_id)
+        if date_from is not None:
+            query = query.where(Event.date >= date_from)
+        if date_to is not None:
+            query = query.where(Event.date <= date_to)
+        queries.append(query)
+    if len(queries) == 1:
+        return queries[0].order_by(EXPORT_COLUMNS[0])
+    export = union_all(*queries).subquery()
+    return select(export).order_by(export.c[EXPORT_COLUMNS[0]])
+
+
+def iter_row_chunks(session_factory, query, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Yield lists of row tuples through a server-side cursor, one chunk at a time"""
+    db = session_factory()
+    try:
+        result = db.execute(query.execution_options(yield_per=chunk_size))
+        for partition in result.partitions():
+            yield [tuple(row) for row in partition]
+    finally:
+        db.close()
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def stream_csv(chunks):
+    """Encode row chunks as CSV, yielding one bytes block per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows([[_isoformat(v) for v in row] for row in rows])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def stream_ndjson(chunks):
+    """Encode row chunks as newline-delimited JSON"""
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=_isoformat, ensure_ascii=False) + "\n"
+            for row in rows
+        ).encode("utf-8")
+
+
+class _DrainableSink:
+    """Write-only file object whose contents can be drained while keeping absolute offsets"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_parquet(chunks):
+    """Encode row chunks as Parquet, one row group per chunk"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("participation_id", pa.int64()),
+        ("user_id", pa.int64()),
+        ("user_name", pa.string()),
+        ("user_email", pa.string()),
+        ("event_id", pa.int64()),
+        ("event_name", pa.string()),
+        ("event_date", pa.timestamp("us")),
+        ("timestamp", pa.timestamp("us")),
+        ("hours_awarded", pa.float64()),
+    ])
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in chunks:
+            if not rows:
+                continue
+            columns = list(zip(*rows))
+            table = pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema,
+            )
+            writer.write_table(table)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def parquet_available() -> bool:
+    """Check whether the optional pyarrow dependency is installed"""
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def stream_export(session_factory, query, export_format: str, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Stream the rows of ``query`` encoded as ``export_format``"""
+    chunks = iter_row_chunks(session_factory, query, chunk_size)
+    if export_format == "csv":
+        return stream_csv(chunks)
+    if export_format == "ndjson":
+        return stream_ndjson(chunks)
+    if export_format == "parquet":
+        return stream_parquet(chunks)
+    raise ValueError(f"Unsupported export format: {export_format}")
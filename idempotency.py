@@ -0,0 +1,201 @@
+import hashlib
+import json
+from typing import Iterable, Optional
+
+from auth import verify_token
+from shared_cache import CacheBackend, CacheUnavailable, cache_backend
+
+PENDING = "pending:"
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware replaying stored responses for retried POSTs with an ``Idempotency-Key``.
+
+    The first request with a key runs normally and its response is stored,
+    keyed by caller, route and key, together with a fingerprint of the
+    request body. A retry with the same key and body gets the stored
+    response back without reaching the endpoint; the same key with a
+    different body is rejected with 422, and a retry that arrives while
+    the first request is still running gets 409. The body is buffered to
+    fingerprint it, so bodies over ``max_body_bytes`` are rejected with 413.
+    """
+
+    def __init__(self, app, paths: Iterable[str], ttl_seconds: float = 86400,
+                 lock_seconds: float = 60, max_response_bytes: int = 256 * 1024,
+                 max_body_bytes: int = 10 * 1024 * 1024, backend: CacheBackend = None):
+        self.app = app
+        self.paths = set(paths)
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self.max_response_bytes = max_response_bytes
+        self.max_body_bytes = max_body_bytes
+        self.backend = backend or cache_backend
+        self.replayed = 0
+        self.stored = 0
+        self.conflicts = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope.get("path") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(b"idempotency-key")
+        user = self._user(headers.get(b"authorization", b""))
+        if not idempotency_key or user is None:
+            # No key, or let the endpoint produce its own 401/403
+            await self.app(scope, receive, send)
+            return
+        if len(idempotency_key) > 255:
+            await self._send_json(send, 400, {"detail": "Idempotency-Key must be at most 255 characters"})
+            return
+
+        body = await self._read_body(receive, self.max_body_bytes)
+        if body is None:
+            await self._send_json(send, 413, {"detail": "Request body too large"})
+            return
+        fingerprint = self._fingerprint(headers.get(b"content-type", b""), body)
+        key = "idempotency:" + hashlib.sha256(
+            b"\0".join([user.encode(), scope["path"].encode(), idempotency_key])
+        ).hexdigest()
+
+        try:
+            if not await self.backend.aadd(key, PENDING + fingerprint, ttl=self.lock_seconds):
+                await self._replay(send, await self.backend.aget(key), fingerprint)
+                return
+        except CacheUnavailable:
+            # Without the store a retry could run twice; the client retries with the same key
+            await self._send(send, 503, [(b"content-type", b"application/json"), (b"retry-after", b"1")],
+                             json.dumps({"detail": "Server is busy, please retry"}).encode())
+            return
+
+        start = {}
+        chunks = []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        try:
+            await self.app(scope, self._replay_body(body, receive), capture)
+        except Exception:
+            await self._forget(key)
+            raise
+
+        payload = b"".join(chunks)
+        status_code = start.get("status", 500)
+        response_headers = [
+            (name, value) for name, value in start.get("headers", [])
+            if name.lower() != b"content-length"
+        ]
+        # Server errors and rate limiting are worth retrying for real
+        try:
+            if status_code < 500 and status_code != 429 and len(payload) <= self.max_response_bytes:
+                await self.backend.aset(key, self._encode(fingerprint, status_code, response_headers, payload),
+                                        ttl=self.ttl_seconds)
+                self.stored += 1
+            else:
+                await self.backend.adelete(key)
+        except CacheUnavailable as e:
+            # The request already ran; its pending marker expires after lock_seconds
+            print(f"Could not store idempotent response: {e}")
+        await self._send(send, status_code, response_headers, payload)
+
+    async def _forget(self, key: str):
+        try:
+            await self.backend.adelete(key)
+        except CacheUnavailable:
+            pass
+
+    async def _replay(self, send, entry, fingerprint: str):
+        if entry is None:
+            # Expired between add() and get(); the client can simply retry
+            await self._send_json(send, 409, {"detail": "A request with this Idempotency-Key is in progress"})
+            return
+        if isinstance(entry, str):
+            self.conflicts += 1
+            if entry[len(PENDING):] != fingerprint:
+                await self._send_json(send, 422, {"detail": "Idempotency-Key was used with a different request"})
+            else:
+                await self._send_json(send, 409, {"detail": "A request with this Idempotency-Key is in progress"})
+            return
+        stored_fingerprint, status_code, headers, payload = self._decode(entry)
+        if stored_fingerprint != fingerprint:
+            self.conflicts += 1
+            await self._send_json(send, 422, {"detail": "Idempotency-Key was used with a different request"})
+            return
+        self.replayed += 1
+        await self._send(send, status_code, headers + [(b"idempotent-replayed", b"true")], payload)
+
+    @staticmethod
+    def _user(authorization: bytes) -> Optional[str]:
+        scheme, _, token = authorization.decode("latin-1").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        return verify_token(token.strip())
+
+    @staticmethod
+    def _fingerprint(content_type: bytes, body: bytes) -> str:
+        # Multipart boundaries are random per attempt; drop them so a retried upload matches
+        _, _, boundary = content_type.partition(b"boundary=")
+        if boundary:
+            body = body.replace(boundary.strip(b'"').split(b";")[0], b"")
+        return hashlib.sha256(body).hexdigest()
+
+    @staticmethod
+    async def _read_body(receive, max_bytes: int) -> Optional[bytes]:
+        """The whole request body, or None as soon as it grows past ``max_bytes``"""
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > max_bytes:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    @staticmethod
+    def _replay_body(body: bytes, receive):
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return replay
+
+    @staticmethod
+    def _encode(fingerprint: str, status_code: int, headers, payload: bytes) -> bytes:
+        meta = {
+            "fingerprint": fingerprint,
+            "status": status_code,
+            "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in headers],
+        }
+        return json.dumps(meta, separators=(",", ":")).encode() + b"\n" + payload
+
+    @staticmethod
+    def _decode(entry: bytes):
+        meta, _, payload = bytes(entry).partition(b"\n")
+        meta = json.loads(meta)
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in meta["headers"]]
+        return meta["fingerprint"], meta["status"], headers, payload
+
+    @staticmethod
+    async def _send(send, status_code: int, headers, payload: bytes):
+        headers = list(headers) + [(b"content-length", str(len(payload)).encode())]
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": payload})
+
+    async def _send_json(self, send, status_code: int, content: dict):
+        await self._send(send, status_code, [(b"content-type", b"application/json")],
+                         json.dumps(content).encode())
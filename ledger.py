@@ -0,0 +1,287 @@
+"""Append-only ledger of hour awards.
+
+``users.total_hours`` is a denormalized counter; every change to it is also
+appended to ``hour_ledger`` in the same transaction: a grant per check-in,
+a revocation when a check-in is removed, and one opening entry per user with
+the total it had when the ledger was introduced. ``replay`` folds the
+entries written since its last run into per-user balances and moves a
+checkpoint forward, so after a correction only the new entries are read.
+
+Usage:
+    python ledger.py                  # replay new entries and report drifted totals
+    python ledger.py replay --full    # rebuild every balance from the first entry
+    python ledger.py replay --fix     # also reset drifted users.total_hours from the ledger
+    python ledger.py revoke --user 5 --event 7 --reason "scanned for a friend"
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from sqlalchemy import select, insert, update, delete, func, literal, and_, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from archive import participation_table_for_event, academic_year
+from models import (
+    Base, User, Event, Participation, ParticipationArchive,
+    HourLedgerEntry, HourBalance, LedgerCheckpoint,
+)
+from shared_cache import table_versions
+
+LEDGER_OPENING = "opening"
+LEDGER_GRANT = "grant"
+LEDGER_REVOKE = "revoke"
+
+# Checkpoint names: when opening entries were written, and how far replay got
+OPENED = "opened"
+REPLAYED = "replayed"
+
+# Waits for transactions that have inserted into the ledger but not committed (PostgreSQL)
+LOCK_LEDGER = text("LOCK TABLE hour_ledger IN SHARE MODE")
+
+# Totals are floats summed in different orders; smaller differences are not drift
+DRIFT_TOLERANCE = 1e-6
+
+
+def ledger_entry(user_id: int, hours: float, kind: str, event_id: int = None,
+                 reason: str = None, created_at: datetime = None) -> dict:
+    return {
+        "user_id": user_id,
+        "event_id": event_id,
+        "hours": hours,
+        "kind": kind,
+        "reason": reason,
+        "created_at": created_at or datetime.utcnow(),
+    }
+
+
+def record_entries(db, entries: List[dict]):
+    """Append entries in the caller's transaction, next to the total_hours change they describe"""
+    if entries:
+        db.execute(insert(HourLedgerEntry), entries)
+
+
+def open_ledger(engine) -> int:
+    """Write an opening entry with every user's current total, once per database"""
+    with engine.begin() as conn:
+        if conn.execute(select(LedgerCheckpoint.name).where(LedgerCheckpoint.name == OPENED)).first():
+            return 0
+    now = datetime.utcnow()
+    try:
+        with engine.begin() as conn:
+            # The checkpoint row doubles as a lock: a second worker fails here and skips
+            conn.execute(insert(LedgerCheckpoint).values(name=OPENED, seq=0, entries=0, updated_at=now))
+            opened = conn.execute(insert(HourLedgerEntry).from_select(
+                ["user_id", "hours", "kind", "reason", "created_at"],
+                select(User.id, User.total_hours, literal(LEDGER_OPENING), literal("total before the ledger"),
+                       literal(now))
+                .where(User.total_hours != 0)
+                .order_by(User.id)
+            )).rowcount
+            conn.execute(update(LedgerCheckpoint).where(LedgerCheckpoint.name == OPENED).values(entries=opened))
+    except IntegrityError:
+        return 0
+    return opened
+
+
+def ensure_ledger(engine) -> int:
+    """Create the ledger tables and open the ledger, for apps that write hours without create_tables"""
+    Base.metadata.create_all(
+        bind=engine, tables=[HourLedgerEntry.__table__, HourBalance.__table__, LedgerCheckpoint.__table__]
+    )
+    return open_ledger(engine)
+
+
+def high_water(db: Session) -> int:
+    """The newest sequence number below which every entry is committed"""
+    if db.get_bind().dialect.name == "postgresql":
+        # Sequence numbers are handed out before commit; wait for in-flight writers so
+        # no entry below the returned number can still appear
+        db.execute(LOCK_LEDGER)
+    seq = db.execute(select(func.coalesce(func.max(HourLedgerEntry.seq), 0))).scalar()
+    db.commit()
+    return seq
+
+
+def replay(db: Session, full: bool = False, batch_size: int = 10_000) -> dict:
+    """Fold ledger entries after the checkpoint into hour_ledger_balances, in one streaming pass"""
+    started = time.perf_counter()
+    end = high_water(db)
+    checkpoint = db.get(LedgerCheckpoint, REPLAYED)
+    start = 0 if full or checkpoint is None else checkpoint.seq
+
+    deltas: Dict[int, list] = {}
+    entries = 0
+    rows = db.execute(
+        select(HourLedgerEntry.seq, HourLedgerEntry.user_id, HourLedgerEntry.hours)
+        .where(HourLedgerEntry.seq > start, HourLedgerEntry.seq <= end)
+        .order_by(HourLedgerEntry.seq)
+        .execution_options(yield_per=batch_size)
+    )
+    for seq, user_id, hours in rows:
+        delta = deltas.get(user_id)
+        if delta is None:
+            deltas[user_id] = [hours, seq]
+        else:
+            delta[0] += hours
+            delta[1] = seq
+        entries += 1
+
+    if full:
+        db.execute(delete(HourBalance))
+    _add_to_balances(db, [
+        {"user_id": user_id, "hours": hours, "last_seq": seq} for user_id, (hours, seq) in deltas.items()
+    ])
+    if checkpoint is None:
+        checkpoint = LedgerCheckpoint(name=REPLAYED, entries=0)
+        db.add(checkpoint)
+    checkpoint.seq = end
+    checkpoint.entries = (0 if full else checkpoint.entries) + entries
+    checkpoint.updated_at = datetime.utcnow()
+    db.commit()
+    return {
+        "from_seq": start,
+        "to_seq": end,
+        "entries": entries,
+        "users": len(deltas),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def _add_to_balances(db: Session, rows: List[dict]):
+    if not rows:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    statement = dialect_insert(HourBalance)
+    statement = statement.on_conflict_do_update(
+        index_elements=[HourBalance.user_id],
+        set_={"hours": HourBalance.hours + statement.excluded.hours, "last_seq": statement.excluded.last_seq},
+    )
+    for start in range(0, len(rows), 10_000):
+        db.execute(statement, rows[start:start + 10_000])
+
+
+def _drift_query(through_seq: int):
+    """users.id, users.total_hours and the ledger's total for users where the two differ"""
+    # Entries committed after the replay are not in the balances yet
+    tail = (
+        select(HourLedgerEntry.user_id, func.sum(HourLedgerEntry.hours).label("hours"))
+        .where(HourLedgerEntry.seq > through_seq)
+        .group_by(HourLedgerEntry.user_id)
+        .subquery()
+    )
+    expected = func.coalesce(HourBalance.hours, 0.0) + func.coalesce(tail.c.hours, 0.0)
+    return (
+        select(User.id, func.coalesce(User.total_hours, 0.0), expected)
+        .outerjoin(HourBalance, HourBalance.user_id == User.id)
+        .outerjoin(tail, tail.c.user_id == User.id)
+        .where(func.abs(func.coalesce(User.total_hours, 0.0) - expected) > DRIFT_TOLERANCE)
+        .order_by(User.id)
+    )
+
+
+def drifted_totals(db: Session) -> List[dict]:
+    """Users whose total_hours differs from their replayed ledger balance"""
+    checkpoint = db.get(LedgerCheckpoint, REPLAYED)
+    return [
+        {"user_id": user_id, "total_hours": total, "ledger_hours": expected}
+        for user_id, total, expected in db.execute(_drift_query(checkpoint.seq if checkpoint else 0))
+    ]
+
+
+def fix_totals(db: Session, user_ids: Iterable[int]) -> int:
+    """Reset total_hours of the given users to their ledger balance"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    checkpoint = db.get(LedgerCheckpoint, REPLAYED)
+    through_seq = checkpoint.seq if checkpoint else 0
+    tail = (
+        select(func.coalesce(func.sum(HourLedgerEntry.hours), 0.0))
+        .where(HourLedgerEntry.user_id == User.id, HourLedgerEntry.seq > through_seq)
+        .scalar_subquery()
+    )
+    balance = select(HourBalance.hours).where(HourBalance.user_id == User.id).scalar_subquery()
+    fixed = db.execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values(total_hours=func.coalesce(balance, 0.0) + tail)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    table_versions.bump("users")
+    return fixed
+
+
+def revoke_checkin(db: Session, user_id: int, event_id: int, reason: str = None) -> float:
+    """Remove a check-in and take its hours back, recording the revocation"""
+    event = db.get(Event, event_id)
+    if event is None:
+        raise ValueError(f"Event {event_id} not found")
+    table = participation_table_for_event(db, event.date)
+    row = db.execute(
+        select(table.c.id, table.c.hours_awarded)
+        .where(and_(table.c.user_id == user_id, table.c.event_id == event_id))
+    ).first()
+    if row is None:
+        raise ValueError(f"User {user_id} has no check-in for event {event_id}")
+    db.execute(delete(table).where(table.c.id == row.id))
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(total_hours=User.total_hours - row.hours_awarded)
+        .execution_options(synchronize_session=False)
+    )
+    if table is not Participation.__table__:
+        archived = db.get(ParticipationArchive, academic_year(event.date))
+        archived.rows -= 1
+        archived.hours -= row.hours_awarded
+    record_entries(db, [ledger_entry(user_id, -row.hours_awarded, LEDGER_REVOKE, event_id, reason)])
+    db.commit()
+    table_versions.bump("participation", "users")
+    return row.hours_awarded
+
+
+def main(argv=None):
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command")
+    replay_parser = commands.add_parser("replay", help="fold new entries into the balances (default)")
+    replay_parser.add_argument("--full", action="store_true", help="rebuild balances from the first entry")
+    replay_parser.add_argument("--fix", action="store_true", help="reset drifted users.total_hours")
+    revoke_parser = commands.add_parser("revoke", help="remove a check-in and take its hours back")
+    revoke_parser.add_argument("--user", type=int, required=True)
+    revoke_parser.add_argument("--event", type=int, required=True)
+    revoke_parser.add_argument("--reason")
+    args = parser.parse_args(argv)
+
+    opened = open_ledger(engine)
+    with SessionLocal() as db:
+        if args.command == "revoke":
+            try:
+                hours = revoke_checkin(db, args.user, args.event, args.reason)
+            except ValueError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                return 1
+            print(json.dumps({"revoked_hours": hours}))
+            return 0
+
+        report = {"opened": opened, "replay": replay(db, full=getattr(args, "full", False))}
+        drifted = drifted_totals(db)
+        report["drifted"] = len(drifted)
+        report["drifted_sample"] = drifted[:20]
+        if drifted and getattr(args, "fix", False):
+            report["fixed"] = fix_totals(db, [row["user_id"] for row in drifted])
+    print(json.dumps(report, indent=2, default=str))
+    return 1 if drifted and "fixed" not in report else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
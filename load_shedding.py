@@ -0,0 +1,183 @@
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class RouteClass:
+    """Concurrency limit, bounded queue and deadline for routes of similar cost.
+
+    Queued requests are shed CoDel-style: once the time spent queueing has
+    stayed above ``target_ms`` for a whole ``interval_ms``, every request
+    that waited longer than the target is rejected instead of served, until
+    a request gets through below the target again. A standing queue is thus
+    drained quickly while short bursts are still absorbed.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, target_ms: float = 100.0,
+                 interval_ms: float = 1000.0, deadline_seconds: float = 10.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.target = target_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self.deadline = deadline_seconds
+        self.active = 0
+        self._waiters: deque = deque()
+        self._first_above: Optional[float] = None
+        self.dropping = False
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "codel": 0, "deadline": 0}
+        self.timed_out = 0
+
+    async def acquire(self) -> Optional[str]:
+        """Take a slot, returning None when admitted or the reason the request was shed"""
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self._observe(0.0, time.monotonic())
+            self.admitted += 1
+            return None
+        if len(self._waiters) >= self.max_queue:
+            return self._shed("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        enqueued = time.monotonic()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.deadline)
+        except asyncio.TimeoutError:
+            self._waiters.remove(waiter)
+            return self._shed("deadline")
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before the client went away
+                self.release()
+            raise
+
+        now = time.monotonic()
+        if self._observe(now - enqueued, now):
+            self.release()
+            return self._shed("codel")
+        self.admitted += 1
+        return None
+
+    def release(self):
+        """Hand the slot to the oldest live waiter, or free it"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _observe(self, sojourn: float, now: float) -> bool:
+        """Record a queueing delay; True if this request should be shed"""
+        if sojourn < self.target:
+            self._first_above = None
+            self.dropping = False
+            return False
+        if self._first_above is None:
+            self._first_above = now + self.interval
+        elif now >= self._first_above:
+            self.dropping = True
+        return self.dropping
+
+    def _shed(self, reason: str) -> str:
+        self.shed[reason] += 1
+        return reason
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "timed_out": self.timed_out,
+            "dropping": self.dropping,
+        }
+
+
+class LoadShedder:
+    """Maps request paths to route classes; paths without a class are not limited"""
+
+    def __init__(self, classes: Dict[str, RouteClass], routes: Dict[str, str]):
+        self.classes = classes
+        self.routes = routes
+
+    def route_class(self, path: str) -> Optional[RouteClass]:
+        name = self.routes.get(path)
+        return self.classes.get(name) if name else None
+
+    def stats(self) -> dict:
+        stats = {name: route_class.stats() for name, route_class in self.classes.items()}
+        stats["total_shed"] = sum(
+            sum(route_class.shed.values()) + route_class.timed_out for route_class in self.classes.values()
+        )
+        return stats
+
+
+class LoadSheddingMiddleware:
+    """ASGI middleware admitting requests through their route class.
+
+    Shed requests get 503 with ``Retry-After`` without reaching the
+    endpoint. A request still running at its deadline gets 504; the
+    endpoint keeps its slot until it actually finishes (threadpool work
+    cannot be interrupted) and its late response is discarded.
+    """
+
+    def __init__(self, app, shedder: LoadShedder, retry_after_seconds: int = 1):
+        self.app = app
+        self.shedder = shedder
+        self.retry_after = str(retry_after_seconds).encode()
+
+    async def __call__(self, scope, receive, send):
+        route_class = self.shedder.route_class(scope.get("path")) if scope["type"] == "http" else None
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        reason = await route_class.acquire()
+        if reason is not None:
+            await self._send_error(send, 503, "Server is busy, please retry", [(b"retry-after", self.retry_after)])
+            return
+
+        response_started = False
+        abandoned = False
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if abandoned:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        task = asyncio.ensure_future(self.app(scope, receive, guarded_send))
+        task.add_done_callback(lambda finished: self._finished(route_class, finished))
+        remaining = route_class.deadline - (time.monotonic() - started)
+        done, _ = await asyncio.wait({task}, timeout=max(remaining, 0.0))
+        if task in done or response_started:
+            await task
+            return
+
+        abandoned = True
+        route_class.timed_out += 1
+        await self._send_error(send, 504, "Request took too long, please retry", [])
+
+    @staticmethod
+    def _finished(route_class: RouteClass, task: asyncio.Task):
+        route_class.release()
+        if not task.cancelled():
+            # Retrieve it so an abandoned request's error is not reported as unhandled
+            task.exception()
+
+    @staticmethod
+    async def _send_error(send, status_code: int, detail: str, headers):
+        body = json.dumps({"detail": detail}).encode()
+        headers = headers + [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
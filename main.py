@@ -1,23 +1,141 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Query, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, ORJSONResponse, FileResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import Optional, List
+import os
 import uuid
+import asyncio
 from pydantic import BaseModel, EmailStr
 
-from database import get_db, create_tables
-from models import User, Event, Participation
+from database import get_db, create_tables, SessionLocal, insert_ignore
+from models import User, Event, Participation, OrganizerReport, participation_archive_table
 from auth import (
     authenticate_user, create_access_token, get_password_hash, 
     verify_token, ACCESS_TOKEN_EXPIRE_MINUTES
 )
-from qr_utils import generate_qr_code, decode_qr_from_image, validate_qr_data
+import qr_utils
+import pdf_generator
+from qr_utils import (
+    decode_qr_from_image, validate_qr_data, new_qr_token, parse_qr_token, render_qr_code,
+    sign_qr_payload, verify_qr_payload, event_validity_window, rotating_validity_window,
+    InvalidQRCode, ImageTooLarge, UnsupportedImage, QR_PREFIX
+)
 from pdf_generator import generate_certificate_pdf, send_certificate_email
+from export_utils import (
+    EXPORT_MEDIA_TYPES, participation_export_query, stream_export, parquet_available
+)
+from user_import import VALID_ROLES, ImportFileError, read_spreadsheet, import_users
+from search import search_events
+from cache import ResponseCacheMiddleware, CachedRoute, table_versions
+from config import settings
+from attendance import attendance_hub, attendance_stream, publish_checkin
+from rate_limit import (
+    RateLimitMiddleware, RouteBudget, InMemoryRateLimitBackend, CacheRateLimitBackend
+)
+from shared_cache import cache_backend, invalidation_bus
+from idempotency import IdempotencyMiddleware
+from load_shedding import RouteClass, LoadShedder, LoadSheddingMiddleware
+from event_index import event_index, announce_event, reload_index, refresh_periodically
+from checkin_buffer import CheckinBuffer
+from ledger import record_entries, ledger_entry, LEDGER_GRANT
+from reports import (
+    REPORT_MEDIA_TYPES, build_reports, reports_for, schedule_reports, week_bounds, previous_week
+)
+from archive import (
+    archived_years, is_archived, participation_table_for_event,
+    participation_history_query, participation_totals, count_participations, archived_years_between,
+)
 
 app = FastAPI(title="Alumni Club Connect", version="1.0.0")
 
+# Expensive routes get their own concurrency limits so they cannot starve
+# cheap ones; added first, so rate limiting and idempotent replays run before queueing
+def _route_class(name: str, concurrency: int, queue: int) -> RouteClass:
+    return RouteClass(
+        name, concurrency, queue,
+        target_ms=settings.shed_target_ms,
+        interval_ms=settings.shed_interval_ms,
+        deadline_seconds=settings.shed_deadline_seconds,
+    )
+
+load_shedder = LoadShedder(
+    classes={
+        "image": _route_class("image", settings.shed_image_concurrency, settings.shed_image_queue),
+        "auth": _route_class("auth", settings.shed_auth_concurrency, settings.shed_auth_queue),
+        "checkin": _route_class("checkin", settings.shed_checkin_concurrency, settings.shed_checkin_queue),
+    },
+    routes={
+        "/scan-qr-image": "image",
+        "/login": "auth",
+        "/register": "auth",
+        "/scan-qr": "checkin",
+    },
+)
+if settings.load_shedding_enabled:
+    app.add_middleware(LoadSheddingMiddleware, shedder=load_shedder)
+
+# Response cache for read-heavy listings (added first so CORS wraps it)
+if settings.response_cache_enabled:
+    app.add_middleware(
+        ResponseCacheMiddleware,
+        routes={
+            "/events": CachedRoute(tables=["events", "participation"]),
+            "/my-events": CachedRoute(tables=["events", "participation"], user_scoped=True),
+        },
+        max_entries=settings.response_cache_max_entries,
+        max_age=settings.response_cache_max_age_seconds,
+    )
+
+# Retried POSTs with the same Idempotency-Key get the first response back
+# (added before rate limiting, so replays still count against the budgets)
+if settings.idempotency_enabled:
+    app.add_middleware(
+        IdempotencyMiddleware,
+        paths=["/scan-qr", "/scan-qr-image", "/events"],
+        ttl_seconds=settings.idempotency_ttl_seconds,
+        lock_seconds=settings.idempotency_lock_seconds,
+        max_response_bytes=settings.idempotency_max_response_kb * 1024,
+        # The largest allowed upload plus room for the multipart framing
+        max_body_bytes=settings.max_file_size_mb * 1024 * 1024 + 64 * 1024,
+    )
+
+# Rate limiting: signed-in requests per user only (a whole venue can share one
+# NAT address during check-in); login and registration per account, with a
+# per-IP cap sized for that venue
+if settings.rate_limit_enabled:
+    app.add_middleware(
+        RateLimitMiddleware,
+        budgets={
+            "/login": RouteBudget(
+                per_ip=settings.rate_limit_login_ip_requests,
+                per_account=settings.rate_limit_login_requests
+            ),
+            "/register": RouteBudget(
+                per_ip=settings.rate_limit_register_ip_requests,
+                per_account=settings.rate_limit_register_requests
+            ),
+            "/scan-qr-image": RouteBudget(
+                per_ip=settings.rate_limit_ip_requests,
+                per_user=settings.rate_limit_scan_image_requests
+            ),
+        },
+        default_budget=RouteBudget(
+            per_ip=settings.rate_limit_ip_requests,
+            per_user=settings.rate_limit_requests
+        ),
+        window_seconds=settings.rate_limit_window_minutes * 60,
+        backend=(
+            CacheRateLimitBackend(cache_backend) if cache_backend.shared
+            else InMemoryRateLimitBackend(max_keys=settings.rate_limit_max_keys)
+        ),
+    )
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -64,6 +182,15 @@ class EventResponse(BaseModel):
     date: datetime
     duration: float
     organizer_name: str
+    # Filled in by /events and /my-events; search results leave them out
+    participant_count: Optional[int] = None
+    total_hours_awarded: Optional[float] = None
+
+class EventSearchResponse(BaseModel):
+    events: List[EventResponse]
+    limit: int
+    offset: int
+    has_more: bool
 
 class ParticipationResponse(BaseModel):
     id: int
@@ -72,6 +199,68 @@ class ParticipationResponse(BaseModel):
     hours_awarded: float
     timestamp: datetime
 
+class ReportResponse(BaseModel):
+    id: int
+    organizer_id: int
+    period_start: datetime
+    period_end: datetime
+    format: str
+    size_bytes: int
+    events: int
+    participants: int
+    hours: float
+    created_at: datetime
+    
+    class Config:
+        orm_mode = True
+
+# Opt-in fast path for list endpoints: Core row tuples go straight to orjson,
+# skipping per-row model construction and response_model re-validation
+EVENT_LIST_COLUMNS = (
+    Event.id,
+    Event.name,
+    Event.description,
+    Event.date,
+    Event.duration,
+    User.name.label("organizer_name"),
+)
+
+PARTICIPATION_LIST_COLUMNS = (
+    Participation.id,
+    Event.name.label("event_name"),
+    Event.date.label("event_date"),
+    Participation.hours_awarded,
+    Participation.timestamp,
+)
+
+def rows_json_response(db: Session, query) -> ORJSONResponse:
+    result = db.execute(query)
+    keys = list(result.keys())
+    return ORJSONResponse([dict(zip(keys, row)) for row in result])
+
+def event_list_query(*criteria, years=()):
+    """Events with their participant counts and hours, from one grouped pass over participation"""
+    totals = participation_totals(years, select(Event.id).where(*criteria) if criteria else None)
+    return (
+        select(
+            *EVENT_LIST_COLUMNS,
+            func.coalesce(totals.c.participant_count, 0).label("participant_count"),
+            func.coalesce(totals.c.total_hours_awarded, 0.0).label("total_hours_awarded"),
+        )
+        .join(User, User.id == Event.organizer_id)
+        .outerjoin(totals, totals.c.event_id == Event.id)
+        .where(*criteria)
+        .order_by(Event.id)
+    )
+
+def participation_list_query(user_id: int):
+    return (
+        select(*PARTICIPATION_LIST_COLUMNS)
+        .join(Event, Event.id == Participation.event_id)
+        .where(Participation.user_id == user_id)
+        .order_by(Participation.id)
+    )
+
 # Dependency to get current user
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
     token = credentials.credentials
@@ -87,10 +276,44 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+# Group-commit buffer for /scan-qr, created on startup when enabled
+checkin_buffer: Optional[CheckinBuffer] = None
+
 # Initialize database
 @app.on_event("startup")
 async def startup_event():
-    create_tables()
+    # serve.py prepares the schema once before forking workers
+    if settings.create_tables_on_startup:
+        create_tables()
+    if cache_backend.shared:
+        asyncio.create_task(invalidation_bus.run(settings.cache_poll_interval_ms / 1000))
+    if settings.event_index_enabled:
+        await run_in_threadpool(reload_index, SessionLocal)
+        asyncio.create_task(refresh_periodically(SessionLocal, settings.event_index_refresh_seconds))
+    if settings.prewarm_heavy_imports:
+        # Not awaited: the worker starts serving while the libraries load
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(None, qr_utils.prewarm)
+        loop.run_in_executor(None, pdf_generator.prewarm)
+    if settings.checkin_buffer_enabled:
+        global checkin_buffer
+        checkin_buffer = CheckinBuffer(
+            SessionLocal,
+            settings.checkin_journal_dir,
+            flush_interval=settings.checkin_flush_interval_ms / 1000,
+            max_batch=settings.checkin_flush_max_batch,
+            fsync=settings.checkin_journal_fsync,
+            on_flush=lambda batch: table_versions.bump("participation", "users")
+        )
+        # Replays journals of workers that crashed before flushing
+        await run_in_threadpool(checkin_buffer.start)
+    if settings.reports_enabled:
+        asyncio.create_task(schedule_reports(SessionLocal))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if checkin_buffer is not None:
+        await run_in_threadpool(checkin_buffer.stop)
 
 # Authentication endpoints
 @app.post("/register", response_model=UserResponse)
@@ -100,8 +323,8 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    # Create new user
-    hashed_password = get_password_hash(user.password)
+    # Create new user (bcrypt runs in the threadpool, off the event loop)
+    hashed_password = await run_in_threadpool(get_password_hash, user.password)
     db_user = User(
         name=user.name,
         email=user.email,
@@ -122,7 +345,7 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
 
 @app.post("/login", response_model=Token)
 async def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = authenticate_user(db, user.email, user.password)
+    db_user = await run_in_threadpool(authenticate_user, db, user.email, user.password)
     if not db_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -135,6 +358,46 @@ async def login(user: UserLogin, db: Session = Depends(get_db)):
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
+@app.post("/admin/users/import")
+async def bulk_import_users(
+    file: UploadFile = File(...),
+    default_role: str = Form("student"),
+    include_passwords: bool = Form(False),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can import users")
+    
+    if default_role not in VALID_ROLES:
+        raise HTTPException(status_code=400, detail="Invalid default role")
+    
+    contents = await file.read()
+    try:
+        df = read_spreadsheet(contents, file.filename or "")
+    except ImportFileError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Validation and bcrypt hashing are CPU bound, keep them off the event loop
+    try:
+        return await run_in_threadpool(
+            import_users, db, df, default_role, include_passwords=include_passwords
+        )
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Some users were registered during the import, please retry")
+
+@app.get("/admin/metrics")
+async def get_metrics(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view metrics")
+    
+    return {
+        "event_index": event_index.stats(),
+        "attendance_subscribers": attendance_hub.subscriber_count(),
+        "checkin_buffer": checkin_buffer.stats() if checkin_buffer else None,
+        "load_shedding": load_shedder.stats() if settings.load_shedding_enabled else None,
+    }
+
 # User endpoints
 @app.get("/me", response_model=UserResponse)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
@@ -147,7 +410,20 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
     )
 
 @app.get("/my-participations", response_model=List[ParticipationResponse])
-async def get_my_participations(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_my_participations(
+    full_history: bool = Query(False, description="Include archived academic years"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if full_history:
+        query = participation_history_query(current_user.id, archived_years(db), PARTICIPATION_LIST_COLUMNS)
+        if settings.fast_json_responses:
+            return rows_json_response(db, query)
+        return [ParticipationResponse(**row._mapping) for row in db.execute(query)]
+    
+    if settings.fast_json_responses:
+        return rows_json_response(db, participation_list_query(current_user.id))
+    
     participations = db.query(Participation).filter(Participation.user_id == current_user.id).all()
     result = []
     for p in participations:
@@ -171,9 +447,8 @@ async def create_event(
     if current_user.role not in ["organizer", "admin"]:
         raise HTTPException(status_code=403, detail="Only organizers can create events")
     
-    # Generate QR code
-    temp_event_id = int(datetime.now().timestamp())
-    qr_data, qr_image = generate_qr_code(temp_event_id)
+    # A random token identifies the event, so it is written once
+    qr_token = new_qr_token()
     
     # Create event
     db_event = Event(
@@ -182,11 +457,18 @@ async def create_event(
         date=event.date,
         duration=event.duration,
         organizer_id=current_user.id,
-        qr_code_data=qr_data
+        qr_code_data=f"{QR_PREFIX}{qr_token}",
+        qr_token=qr_token
     )
     db.add(db_event)
     db.commit()
     db.refresh(db_event)
+    table_versions.bump("events")
+    announce_event(db_event)
+    
+    # The printed code is signed and derived from the row; it is not stored
+    qr_data = sign_qr_payload(db_event.id, *event_validity_window(event.date, event.duration))
+    qr_image = render_qr_code(qr_data)
     
     return {
         "event_id": db_event.id,
@@ -197,37 +479,70 @@ async def create_event(
 
 @app.get("/events", response_model=List[EventResponse])
 async def get_events(db: Session = Depends(get_db)):
-    events = db.query(Event).all()
-    result = []
-    for event in events:
-        organizer = db.query(User).filter(User.id == event.organizer_id).first()
-        result.append(EventResponse(
-            id=event.id,
-            name=event.name,
-            description=event.description,
-            date=event.date,
-            duration=event.duration,
-            organizer_name=organizer.name
-        ))
-    return result
+    query = event_list_query(years=archived_years(db))
+    if settings.fast_json_responses:
+        return rows_json_response(db, query)
+    
+    return [EventResponse(**row._mapping) for row in db.execute(query)]
+
+@app.get("/events/search", response_model=EventSearchResponse)
+async def search_events_endpoint(
+    q: str = "",
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    # Fetch one extra row to know whether another page exists
+    rows = search_events(db, q, date_from, date_to, limit + 1, offset)
+    return EventSearchResponse(
+        events=[EventResponse(**row._mapping) for row in rows[:limit]],
+        limit=limit,
+        offset=offset,
+        has_more=len(rows) > limit
+    )
 
 @app.get("/my-events", response_model=List[EventResponse])
 async def get_my_events(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     if current_user.role not in ["organizer", "admin"]:
         raise HTTPException(status_code=403, detail="Only organizers can view their events")
     
-    events = db.query(Event).filter(Event.organizer_id == current_user.id).all()
-    result = []
-    for event in events:
-        result.append(EventResponse(
-            id=event.id,
-            name=event.name,
-            description=event.description,
-            date=event.date,
-            duration=event.duration,
-            organizer_name=current_user.name
-        ))
-    return result
+    query = event_list_query(Event.organizer_id == current_user.id, years=archived_years(db))
+    if settings.fast_json_responses:
+        return rows_json_response(db, query)
+    
+    return [EventResponse(**row._mapping) for row in db.execute(query)]
+
+@app.get("/events/{event_id}/qr")
+async def get_event_qr(
+    event_id: int,
+    rotating: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Issue a signed QR code; rotating codes expire after two rotation periods"""
+    event = db.query(Event).filter(Event.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    if current_user.role != "admin" and event.organizer_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    if rotating:
+        valid_from, valid_until = rotating_validity_window()
+    else:
+        valid_from, valid_until = event_validity_window(event.date, event.duration)
+    qr_data = sign_qr_payload(event.id, valid_from, valid_until)
+    
+    return {
+        "event_id": event.id,
+        "qr_code": render_qr_code(qr_data),
+        "qr_data": qr_data,
+        "valid_from": datetime.utcfromtimestamp(valid_from),
+        "valid_until": datetime.utcfromtimestamp(valid_until),
+        "refresh_after_seconds": settings.qr_rotation_seconds if rotating else None
+    }
 
 @app.get("/events/{event_id}/participants")
 async def get_event_participants(
@@ -243,7 +558,9 @@ async def get_event_participants(
     if current_user.role != "admin" and event.organizer_id != current_user.id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    participations = db.query(Participation).filter(Participation.event_id == event_id).all()
+    # Check-ins of events from archived academic years live in that year's archive table
+    source = participation_table_for_event(db, event.date)
+    participations = db.execute(select(source).where(source.c.event_id == event_id)).all()
     participants = []
     for p in participations:
         user = db.query(User).filter(User.id == p.user_id).first()
@@ -256,6 +573,127 @@ async def get_event_participants(
     
     return {"participants": participants, "total_participants": len(participants)}
 
+def _export_response(query, export_format: str, filename: str):
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported export format")
+    if export_format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+    return StreamingResponse(
+        stream_export(SessionLocal, query, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'},
+    )
+
+# Export endpoints
+@app.get("/events/{event_id}/participants/export")
+async def export_event_participants(
+    event_id: int,
+    export_format: str = Query("csv", alias="format"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    event = db.query(Event).filter(Event.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    if current_user.role != "admin" and event.organizer_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    query = participation_export_query(
+        event_id=event_id, tables=[participation_table_for_event(db, event.date)]
+    )
+    return _export_response(query, export_format, f"event_{event_id}_participants")
+
+@app.get("/export/participations")
+async def export_participations(
+    export_format: str = Query("csv", alias="format"),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can export all participations")
+    
+    # Closed years moved to their archive tables are part of the full dump; the
+    # lookup session is closed before streaming starts
+    with SessionLocal() as db:
+        years = archived_years_between(db, date_from, date_to)
+    tables = [participation_archive_table(year) for year in years]
+    query = participation_export_query(
+        date_from=date_from, date_to=date_to, tables=tables + [Participation.__table__]
+    )
+    return _export_response(query, export_format, "participations")
+
+# Organizer reports
+@app.get("/reports", response_model=List[ReportResponse])
+async def list_reports(
+    organizer_id: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if current_user.role not in ["organizer", "admin"]:
+        raise HTTPException(status_code=403, detail="Only organizers can view reports")
+    
+    return reports_for(db, current_user, organizer_id)
+
+@app.get("/reports/{report_id}")
+async def download_report(
+    report_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    report = db.get(OrganizerReport, report_id)
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    
+    if current_user.role != "admin" and report.organizer_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    path = os.path.join(settings.report_dir, report.path)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Report file is no longer available")
+    
+    return FileResponse(
+        path,
+        media_type=REPORT_MEDIA_TYPES[report.format],
+        filename=f"report_{report.period_start:%Y-%m-%d}.{report.format}",
+    )
+
+@app.post("/admin/reports/run")
+async def run_reports(
+    week: Optional[date] = Query(None, description="Any day of the week to build; default last week"),
+    force: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can build reports")
+    
+    start, end = week_bounds(week) if week else previous_week()
+    return await run_in_threadpool(build_reports, SessionLocal, start, end, force)
+
+@app.get("/events/{event_id}/attendance/stream")
+async def stream_event_attendance(
+    event_id: int,
+    last_event_id: Optional[int] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    event = db.query(Event).filter(Event.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    if current_user.role != "admin" and event.organizer_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    # Release the connection now; the stream itself never touches the database
+    db.close()
+    
+    return StreamingResponse(
+        attendance_stream(attendance_hub, event_id, last_event_id, settings.attendance_heartbeat_seconds),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # QR Code scanning endpoint
 @app.post("/scan-qr")
 async def scan_qr_code(
@@ -270,41 +708,89 @@ async def scan_qr_code(
     if not validate_qr_data(qr_data):
         raise HTTPException(status_code=400, detail="Invalid QR code")
     
-    # Find event by QR data
-    event = db.query(Event).filter(Event.qr_code_data == qr_data).first()
-    if not event:
-        raise HTTPException(status_code=404, detail="Event not found")
+    # Signed codes are checked without touching the database
+    try:
+        signed_event_id = verify_qr_payload(qr_data)
+    except InvalidQRCode as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Check if user already participated
-    existing_participation = db.query(Participation).filter(
-        Participation.user_id == current_user.id,
-        Participation.event_id == event.id
-    ).first()
+    if signed_event_id is None and settings.qr_require_signature:
+        raise HTTPException(status_code=400, detail="Invalid QR code")
     
-    if existing_participation:
-        raise HTTPException(status_code=400, detail="You have already participated in this event")
+    # Upcoming and ongoing events are served from memory
+    event = None
+    if settings.event_index_enabled:
+        if signed_event_id is not None:
+            event = event_index.get(signed_event_id)
+        else:
+            event = event_index.get_by_qr_data(qr_data)
     
-    # Create participation record
-    participation = Participation(
-        user_id=current_user.id,
-        event_id=event.id,
-        hours_awarded=event.duration
-    )
-    db.add(participation)
+    # Otherwise find it by primary key, fixed-width token or, for the oldest codes, the full string
+    if event is None:
+        if signed_event_id is not None:
+            event = db.get(Event, signed_event_id)
+        else:
+            qr_token = parse_qr_token(qr_data)
+            if qr_token is not None:
+                event = db.query(Event).filter(Event.qr_token == qr_token).first()
+            else:
+                event = db.query(Event).filter(Event.qr_code_data == qr_data).first()
+        if not event:
+            raise HTTPException(status_code=404, detail="Event not found")
+        if settings.event_index_enabled:
+            event_index.add(event)
     
-    # Update user's total hours
-    current_user.total_hours += event.duration
-    db.commit()
+    # The unique index only covers participation, so archived years take no new check-ins
+    if is_archived(db, event.date):
+        raise HTTPException(status_code=400, detail="This event belongs to an archived academic year")
+    
+    checked_in_at = datetime.utcnow()
+    if checkin_buffer is not None:
+        # Acknowledged once journaled; the flusher writes it with others in one transaction
+        checkin = await run_in_threadpool(
+            checkin_buffer.submit, current_user.id, event.id, event.duration, checked_in_at
+        )
+        if checkin is None:
+            raise HTTPException(status_code=400, detail="You have already participated in this event")
+        total_hours = current_user.total_hours + checkin_buffer.pending_hours(current_user.id)
+    else:
+        # Create participation record; the unique (user_id, event_id) index rejects a repeat
+        inserted = db.execute(insert_ignore(db.get_bind(), Participation).values(
+            user_id=current_user.id,
+            event_id=event.id,
+            timestamp=checked_in_at,
+            hours_awarded=event.duration
+        ))
+        
+        if inserted.rowcount == 0:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="You have already participated in this event")
+        
+        # Update user's total hours in SQL, so concurrent check-ins do not overwrite each other
+        current_user.total_hours = User.total_hours + event.duration
+        record_entries(db, [ledger_entry(current_user.id, event.duration, LEDGER_GRANT, event.id,
+                                         created_at=checked_in_at)])
+        db.commit()
+        table_versions.bump("participation", "users")
+        total_hours = current_user.total_hours
+    
+    publish_checkin(event.id, {
+        "user_name": current_user.name,
+        "user_email": current_user.email,
+        "timestamp": checked_in_at.isoformat(),
+        "hours_awarded": event.duration
+    })
     
     # Check if user reached 300 hours for certificate
-    if current_user.total_hours >= 300:
+    if total_hours >= 300:
         # Count events participated
-        events_count = db.query(Participation).filter(Participation.user_id == current_user.id).count()
+        events_count = count_participations(db, current_user.id)
         
         # Generate and send certificate
         try:
-            pdf_bytes = generate_certificate_pdf(current_user.name, current_user.total_hours, events_count)
-            send_certificate_email(current_user.email, current_user.name, pdf_bytes)
+            # ReportLab and SMTP are slow and blocking; keep them off the event loop
+            pdf_bytes = await run_in_threadpool(generate_certificate_pdf, current_user.name, total_hours, events_count)
+            await run_in_threadpool(send_certificate_email, current_user.email, current_user.name, pdf_bytes)
             certificate_message = "Congratulations! You've reached 300 hours. Certificate sent to your email!"
         except Exception as e:
             certificate_message = "You've reached 300 hours, but there was an error sending the certificate."
@@ -314,7 +800,7 @@ async def scan_qr_code(
     return {
         "message": f"Successfully participated in {event.name}",
         "hours_awarded": event.duration,
-        "total_hours": current_user.total_hours,
+        "total_hours": total_hours,
         "certificate_message": certificate_message
     }
 
@@ -327,11 +813,23 @@ async def scan_qr_image(
     if current_user.role != "student":
         raise HTTPException(status_code=403, detail="Only students can scan QR codes")
     
-    # Read image file
-    image_data = await file.read()
+    # End the read transaction so the pooled connection is not held while the
+    # upload is read and the image decodes
+    db.commit()
+    
+    # Read image file, at most one byte past the limit
+    image_data = await file.read(settings.max_file_size_mb * 1024 * 1024 + 1)
     
-    # Decode QR from image
-    qr_data = decode_qr_from_image(image_data)
+    # Decode QR from image in the threadpool; PIL and zbar would block the event loop
+    try:
+        qr_data = await run_in_threadpool(decode_qr_from_image, image_data)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedImage as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    finally:
+        del image_data
+        await file.close()
     if not qr_data:
         raise HTTPException(status_code=400, detail="No valid QR code found in image")
     
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, CHAR, Index, Table, MetaData
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -26,10 +26,11 @@ class Event(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     description = Column(String)
-    date = Column(DateTime, nullable=False)
+    date = Column(DateTime, nullable=False, index=True)
     duration = Column(Float, nullable=False)  # hours
     organizer_id = Column(Integer, ForeignKey("users.id"))
     qr_code_data = Column(String, unique=True, nullable=False)
+    qr_token = Column(CHAR(24), unique=True, index=True)  # NULL for events created before tokens
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -38,6 +39,12 @@ class Event(Base):
 
 class Participation(Base):
     __tablename__ = "participation"
+    __table_args__ = (
+        # Duplicate check-in checks and per-user history
+        Index("ux_participation_user_event", "user_id", "event_id", unique=True),
+        # Participant lists and exports per event; with hours_awarded, per-event totals read only the index
+        Index("ix_participation_event_hours", "event_id", "hours_awarded"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -48,3 +55,94 @@ class Participation(Base):
     # Relationships
     user = relationship("User", back_populates="participations")
     event = relationship("Event", back_populates="participations")
+
+class ParticipationArchive(Base):
+    """One row per academic year whose participation moved to its archive table"""
+    __tablename__ = "participation_archives"
+    
+    year = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    rows = Column(Integer, nullable=False, default=0)
+    hours = Column(Float, nullable=False, default=0.0)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+class HourLedgerEntry(Base):
+    """Append-only record of one change to users.total_hours; never updated or deleted"""
+    __tablename__ = "hour_ledger"
+    # Never reuse a sequence number, even after the newest row is lost in a rollback
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    seq = Column(Integer, primary_key=True, autoincrement=True)  # replay order
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    event_id = Column(Integer, ForeignKey("events.id"))
+    hours = Column(Float, nullable=False)  # negative for revocations
+    kind = Column(String, nullable=False)  # "opening", "grant", "revoke"
+    reason = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class HourBalance(Base):
+    """Per-user sum of the ledger entries replayed so far"""
+    __tablename__ = "hour_ledger_balances"
+    
+    user_id = Column(Integer, primary_key=True)
+    hours = Column(Float, nullable=False, default=0.0)
+    last_seq = Column(Integer, nullable=False, default=0)
+
+class LedgerCheckpoint(Base):
+    """Named positions in the ledger: how far replay got, and when the ledger was opened"""
+    __tablename__ = "hour_ledger_checkpoints"
+    
+    name = Column(String, primary_key=True)
+    seq = Column(Integer, nullable=False, default=0)
+    entries = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class ReportRun(Base):
+    """One row per report period, claimed by the worker that builds it"""
+    __tablename__ = "report_runs"
+    
+    period_start = Column(DateTime, primary_key=True)
+    period_end = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)  # NULL while building, or if the worker died
+    reports = Column(Integer, nullable=False, default=0)
+
+class OrganizerReport(Base):
+    """A stored report file for one organizer and period"""
+    __tablename__ = "organizer_reports"
+    __table_args__ = (
+        Index("ux_organizer_reports", "organizer_id", "period_start", "format", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    organizer_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    period_start = Column(DateTime, nullable=False)
+    period_end = Column(DateTime, nullable=False)
+    format = Column(String, nullable=False)  # "pdf", "csv"
+    path = Column(String, nullable=False)  # relative to REPORT_DIR
+    size_bytes = Column(Integer, nullable=False)
+    events = Column(Integer, nullable=False)
+    participants = Column(Integer, nullable=False)
+    hours = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Archive tables are created on demand, outside create_all()
+ARCHIVE_TABLE_PREFIX = "participation_archive_"
+archive_metadata = MetaData()
+
+def participation_archive_table(year: int) -> Table:
+    """Archive table for the academic year starting in ``year``; same columns as participation"""
+    name = f"{ARCHIVE_TABLE_PREFIX}{year}"
+    if name in archive_metadata.tables:
+        return archive_metadata.tables[name]
+    return Table(
+        name, archive_metadata,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, nullable=False),
+        Column("event_id", Integer, nullable=False),
+        Column("timestamp", DateTime),
+        Column("hours_awarded", Float, nullable=False),
+        # As on participation: a user checks in to an event once, whichever table holds it
+        Index(f"ux_{name}_user_event", "user_id", "event_id", unique=True),
+        Index(f"ix_{name}_event", "event_id"),
+    )
@@ -1,9 +1,3 @@
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
 import io
 import smtplib
 from email.mime.multipart import MIMEMultipart
@@ -12,9 +6,25 @@ from email.mime.base import MIMEBase
 from email import encoders
 import os
 from datetime import datetime
+from functools import lru_cache
+from typing import List
+from xml.sax.saxutils import escape
 
+# reportlab is imported on first use; most workers never render a certificate.
+# Styles are built once per process and shared by every document rendered in it.
+
+def prewarm():
+    """Import reportlab ahead of the first certificate"""
+    import reportlab.platypus  # noqa: F401
+    import reportlab.lib.styles  # noqa: F401
+
+@lru_cache(maxsize=None)
 def create_certificate_styles():
     """Create custom styles for certificate"""
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    
     styles = getSampleStyleSheet()
     
     # Title style
@@ -78,6 +88,10 @@ def create_certificate_styles():
 
 def generate_certificate_pdf(student_name: str, total_hours: float, events_count: int) -> bytes:
     """Generate PDF certificate for student"""
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib.units import inch
+    
     buffer = io.BytesIO()
     
     # Create PDF document
@@ -151,6 +165,92 @@ def generate_certificate_pdf(student_name: str, total_hours: float, events_count
     
     return pdf_bytes
 
+@lru_cache(maxsize=None)
+def create_report_template():
+    """Styles and table style for organizer reports"""
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+    
+    styles = getSampleStyleSheet()
+    
+    title_style = ParagraphStyle(
+        'ReportTitle',
+        parent=styles['Heading1'],
+        fontSize=20,
+        textColor=colors.HexColor('#667eea'),
+        spaceAfter=6
+    )
+    
+    subtitle_style = ParagraphStyle(
+        'ReportSubtitle',
+        parent=styles['Normal'],
+        fontSize=11,
+        textColor=colors.grey,
+        spaceAfter=16
+    )
+    
+    table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor('#f3f4fb')]),
+        ('LINEABOVE', (0, -1), (-1, -1), 0.5, colors.grey),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ])
+    
+    return {
+        'title': title_style,
+        'subtitle': subtitle_style,
+        'cell': styles['BodyText'],
+        'table': table_style
+    }
+
+def generate_report_pdf(organizer_name: str, period: str, events: List[dict],
+                        participants: int, hours: float) -> bytes:
+    """Generate an organizer's attendance summary for one period"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Table
+    from reportlab.lib.units import cm
+    
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        rightMargin=1.5*cm,
+        leftMargin=1.5*cm,
+        topMargin=1.5*cm,
+        bottomMargin=1.5*cm
+    )
+    template = create_report_template()
+    
+    rows = [["Мероприятие", "Дата", "Часы", "Участники", "Начислено часов"]]
+    for event in events:
+        rows.append([
+            Paragraph(escape(event['name']), template['cell']),
+            event['date'].strftime('%d.%m.%Y %H:%M'),
+            f"{event['duration']:g}",
+            str(event['participants']),
+            f"{event['hours']:g}"
+        ])
+    rows.append(["Итого", "", "", str(participants), f"{hours:g}"])
+    
+    table = Table(rows, colWidths=[7.5*cm, 3*cm, 1.5*cm, 2.2*cm, 3.3*cm], repeatRows=1)
+    table.setStyle(template['table'])
+    
+    doc.build([
+        Paragraph("Отчёт о посещаемости", template['title']),
+        Paragraph(f"{escape(organizer_name)} · {period}", template['subtitle']),
+        table
+    ])
+    
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+    
+    return pdf_bytes
+
 def send_certificate_email(student_email: str, student_name: str, pdf_bytes: bytes):
     """Send certificate via email"""
     # Email configuration (you should use environment variables in production)
@@ -1,16 +1,114 @@
-import qrcode
 import io
+import re
+import time
+import hmac
 import base64
-from PIL import Image
-import uuid
-import cv2
-import numpy as np
-from pyzbar import pyzbar
-
-def generate_qr_code(event_id: int) -> str:
-    """Generate QR code for an event and return base64 encoded image"""
-    # Create unique QR data
-    qr_data = f"alumni_club_event_{event_id}_{uuid.uuid4().hex[:8]}"
+import hashlib
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from config import settings
+
+QR_PREFIX = "alumni_club_event_"
+# Random 96-bit event token, stored hex encoded in the fixed-width events.qr_token column
+QR_TOKEN_BYTES = 12
+QR_TOKEN_LENGTH = QR_TOKEN_BYTES * 2
+QR_TOKEN_PATTERN = re.compile(f"[0-9a-f]{{{QR_TOKEN_LENGTH}}}")
+
+# Signed payload: alumni_club_event_s1.<event id>.<not before>.<not after>.<signature>
+SIGNED_QR_PREFIX = f"{QR_PREFIX}s1."
+SIGNATURE_BYTES = 12
+
+class InvalidQRCode(ValueError):
+    """Raised for signed QR data that is forged, malformed or outside its validity window"""
+
+class ImageTooLarge(ValueError):
+    """Raised for an upload over the byte or pixel limit, before it is decoded"""
+
+class UnsupportedImage(ValueError):
+    """Raised for an upload whose header is not one of the allowed image formats"""
+
+# qrcode/PIL and numpy/pyzbar are imported on first use so that workers
+# which never render or decode a QR code do not pay for loading them
+
+def prewarm():
+    """Import the QR rendering and decoding libraries ahead of the first request"""
+    import qrcode  # noqa: F401
+    import qrcode.image.pil  # noqa: F401
+    from PIL import Image  # noqa: F401
+    import numpy  # noqa: F401
+    from pyzbar import pyzbar  # noqa: F401
+
+def new_qr_token() -> str:
+    """Create a collision-free event token without touching the database"""
+    return secrets.token_hex(QR_TOKEN_BYTES)
+
+def parse_qr_token(qr_data: str) -> Optional[str]:
+    """Return the event token carried by QR data, or None for legacy codes"""
+    if not qr_data or not qr_data.startswith(QR_PREFIX):
+        return None
+    token = qr_data[len(QR_PREFIX):]
+    return token if QR_TOKEN_PATTERN.fullmatch(token) else None
+
+def _signing_key() -> bytes:
+    return (settings.qr_signing_key or settings.secret_key).encode("utf-8")
+
+def _signature(message: str, key: bytes) -> str:
+    digest = hmac.new(key, message.encode("ascii"), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return base64.urlsafe_b64encode(digest).decode("ascii")
+
+def sign_qr_payload(event_id: int, not_before: int, not_after: int, key: bytes = None) -> str:
+    """Build QR data for an event that is valid between two Unix timestamps"""
+    message = f"{int(event_id)}.{int(not_before)}.{int(not_after)}"
+    return f"{SIGNED_QR_PREFIX}{message}.{_signature(message, key or _signing_key())}"
+
+def verify_qr_payload(qr_data: str, now: float = None, key: bytes = None) -> Optional[int]:
+    """Return the event id of signed QR data, or None if the data is not signed.
+
+    Raises InvalidQRCode for a bad signature or an expired code; no database
+    access is needed for either check.
+    """
+    if not qr_data or not qr_data.startswith(SIGNED_QR_PREFIX):
+        return None
+    message, _, signature = qr_data[len(SIGNED_QR_PREFIX):].rpartition(".")
+    try:
+        # Compared as bytes: compare_digest rejects non-ASCII str, and scanned text can be anything
+        expected = _signature(message, key or _signing_key()).encode("ascii")
+        if not hmac.compare_digest(signature.encode("utf-8"), expected):
+            raise InvalidQRCode("Invalid QR code")
+        event_id, not_before, not_after = (int(part) for part in message.split("."))
+    except InvalidQRCode:
+        raise
+    except (UnicodeEncodeError, TypeError, ValueError) as e:
+        raise InvalidQRCode("Invalid QR code") from e
+    now = time.time() if now is None else now
+    if not not_before <= now <= not_after:
+        raise InvalidQRCode("QR code has expired" if now > not_after else "QR code is not valid yet")
+    return event_id
+
+def _unix(value: datetime) -> int:
+    # Naive datetimes are stored as UTC throughout the app
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+def event_validity_window(event_date: datetime, duration_hours: float) -> Tuple[int, int]:
+    """Validity of a printed event code: from before the start until after the end"""
+    not_before = event_date - timedelta(hours=settings.qr_valid_before_hours)
+    not_after = event_date + timedelta(hours=duration_hours + settings.qr_valid_after_hours)
+    return _unix(not_before), _unix(not_after)
+
+def rotating_validity_window(now: float = None, period_seconds: int = None) -> Tuple[int, int]:
+    """Validity of an on-screen code: the current period plus one period of grace"""
+    now = time.time() if now is None else now
+    period = period_seconds or settings.qr_rotation_seconds
+    start = int(now // period * period)
+    return start, start + 2 * period
+
+def render_qr_code(qr_data: str) -> str:
+    """Render QR data as a base64 encoded PNG"""
+    import qrcode
     
     # Generate QR code
     qr = qrcode.QRCode(
@@ -28,22 +126,87 @@ def generate_qr_code(event_id: int) -> str:
     # Convert to base64
     buffer = io.BytesIO()
     img.save(buffer, format='PNG')
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    
-    return qr_data, img_str
+    return base64.b64encode(buffer.getvalue()).decode()
+
+def generate_qr_code(token: str) -> str:
+    """Generate QR code for an event token and return its data and base64 encoded image"""
+    qr_data = f"{QR_PREFIX}{token}"
+    return qr_data, render_qr_code(qr_data)
+
+def _allowed_formats():
+    extensions = {ext.strip().lower().lstrip(".") for ext in settings.allowed_image_extensions}
+    if "jpg" in extensions:
+        extensions.add("jpeg")
+    return extensions
+
+def check_image_limits(size: Tuple[int, int], image_format: Optional[str] = None):
+    """Reject dimensions, or the format of an upload, outside the configured limits"""
+    if image_format is not None and image_format.lower() not in _allowed_formats():
+        raise UnsupportedImage(
+            f"Unsupported image format; allowed: {', '.join(settings.allowed_image_extensions)}"
+        )
+    width, height = size
+    if width * height > settings.max_image_megapixels * 1_000_000:
+        raise ImageTooLarge(f"Image is larger than {settings.max_image_megapixels} megapixels")
+
+# EXIF orientation -> the transpose that makes the image upright (as ImageOps.exif_transpose)
+EXIF_ORIENTATION = 0x0112
+EXIF_TRANSPOSE = {2: "FLIP_LEFT_RIGHT", 3: "ROTATE_180", 4: "FLIP_TOP_BOTTOM",
+                  5: "TRANSPOSE", 6: "ROTATE_270", 7: "TRANSVERSE", 8: "ROTATE_90"}
+
+def prepare_qr_image(image_data):
+    """Turn uploaded bytes or a PIL image into a small grayscale image for decoding.
+
+    Dimensions are checked from the header before any pixel data is decoded;
+    JPEGs are then decoded at a reduced scale (draft mode), and the image is
+    thumbnailed to ``qr_decode_max_side`` before its EXIF rotation is applied.
+    """
+    from PIL import Image
+
+    if isinstance(image_data, (bytes, bytearray)):
+        if len(image_data) > settings.max_file_size_mb * 1024 * 1024:
+            raise ImageTooLarge(f"Image is larger than {settings.max_file_size_mb} MB")
+        try:
+            image = Image.open(io.BytesIO(image_data))
+        except Image.DecompressionBombError:
+            raise ImageTooLarge(f"Image is larger than {settings.max_image_megapixels} megapixels")
+        except (OSError, SyntaxError):
+            raise UnsupportedImage("File is not a readable image")
+    else:
+        image = image_data
+    try:
+        # Images passed in memory have no file format to check
+        check_image_limits(image.size, image.format if image is not image_data else None)
+        max_side = settings.qr_decode_max_side
+        if image.format == "JPEG":
+            # Decode at 1/2, 1/4 or 1/8 scale straight from the DCT coefficients
+            image.draft("L", (max_side, max_side))
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+        gray = image.convert("L")
+    except (OSError, SyntaxError):
+        raise UnsupportedImage("File is not a readable image")
+    finally:
+        if image is not image_data:
+            image.close()
+    gray.thumbnail((max_side, max_side))
+    if orientation in EXIF_TRANSPOSE:
+        upright = gray.transpose(getattr(Image.Transpose, EXIF_TRANSPOSE[orientation]))
+        gray.close()
+        gray = upright
+    return gray
 
 def decode_qr_from_image(image_data) -> str:
-    """Decode QR code from uploaded image"""
+    """Decode QR code from uploaded image.
+
+    Raises ImageTooLarge or UnsupportedImage before decoding anything the
+    limits in settings do not allow; returns None if no code is found.
+    """
+    import numpy as np
+    from pyzbar import pyzbar
+    
+    gray = prepare_qr_image(image_data)
     try:
-        # Convert image data to numpy array
-        if isinstance(image_data, bytes):
-            nparr = np.frombuffer(image_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        else:
-            img = np.array(image_data)
-        
-        # Decode QR codes
-        decoded_objects = pyzbar.decode(img)
+        decoded_objects = pyzbar.decode(np.asarray(gray))
         
         if decoded_objects:
             return decoded_objects[0].data.decode('utf-8')
@@ -51,7 +214,9 @@ def decode_qr_from_image(image_data) -> str:
     except Exception as e:
         print(f"Error decoding QR: {e}")
         return None
+    finally:
+        gray.close()
 
 def validate_qr_data(qr_data: str) -> bool:
     """Validate if QR data is from our system"""
-    return qr_data and qr_data.startswith("alumni_club_event_")
+    return qr_data and qr_data.startswith(QR_PREFIX)
@@ -0,0 +1,242 @@
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from auth import verify_token
+from shared_cache import CacheUnavailable
+
+
+class RateLimitBackend:
+    """Storage for rate limit counters.
+
+    ``hit`` records one request for ``key`` and returns ``(allowed, retry_after)``.
+    Implementations may live in process memory or in a store shared by workers.
+    """
+
+    def hit(self, key: str, limit: int, window_seconds: float, now: float) -> Tuple[bool, float]:
+        raise NotImplementedError
+
+    async def ahit(self, key: str, limit: int, window_seconds: float, now: float) -> Tuple[bool, float]:
+        """``hit`` for async callers; backends doing I/O run it off the event loop"""
+        return self.hit(key, limit, window_seconds, now)
+
+
+def sliding_window_hit(current: int, previous: int, window_start: float, limit: int,
+                       window_seconds: float, now: float) -> Tuple[bool, float]:
+    """Sliding-window-counter decision from the counts of the current and previous fixed windows"""
+    elapsed = (now - window_start) / window_seconds
+    estimated = previous * (1.0 - elapsed) + current
+    if estimated + 1 <= limit:
+        return True, 0.0
+    if current + 1 > limit or previous == 0:
+        return False, window_start + window_seconds - now
+    # Wait until enough of the previous window has slid out
+    needed = 1.0 - (limit - 1 - current) / previous
+    return False, max(0.0, (needed - elapsed) * window_seconds)
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Sliding-window counters in process memory, O(1) per hit, at most ``max_keys`` keys"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # key -> [window_start, current_count, previous_count]
+        self._counters: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window_seconds: float, now: float) -> Tuple[bool, float]:
+        window_start = now - (now % window_seconds)
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = [window_start, 0, 0]
+                self._counters[key] = counter
+                if len(self._counters) > self.max_keys:
+                    self._counters.popitem(last=False)
+            else:
+                self._counters.move_to_end(key)
+                if counter[0] != window_start:
+                    adjacent = window_start - counter[0] == window_seconds
+                    counter[:] = [window_start, 0, counter[1] if adjacent else 0]
+            allowed, retry_after = sliding_window_hit(
+                counter[1], counter[2], window_start, limit, window_seconds, now
+            )
+            if allowed:
+                counter[1] += 1
+            return allowed, retry_after
+
+    def __len__(self):
+        return len(self._counters)
+
+
+class CacheRateLimitBackend(RateLimitBackend):
+    """Sliding-window counters in a shared cache backend, so budgets hold across workers"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def hit(self, key: str, limit: int, window_seconds: float, now: float) -> Tuple[bool, float]:
+        window_start = now - (now % window_seconds)
+        current_key = f"ratelimit:{key}:{int(window_start)}"
+        previous_key = f"ratelimit:{key}:{int(window_start - window_seconds)}"
+        # Take the slot first: incr is atomic, so workers racing on the same
+        # key each see a distinct count, and a rejected hit gives its slot back
+        current = self.cache.incr(current_key, 1, ttl=window_seconds * 2)
+        previous = self.cache.get(previous_key) or 0
+        allowed, retry_after = sliding_window_hit(
+            current - 1, previous, window_start, limit, window_seconds, now
+        )
+        if not allowed:
+            self.cache.incr(current_key, -1)
+        return allowed, retry_after
+
+    async def ahit(self, key: str, limit: int, window_seconds: float, now: float) -> Tuple[bool, float]:
+        return await self.cache.off_loop(self.hit, key, limit, window_seconds, now)
+
+
+# Login and registration bodies are a few hundred bytes; anything larger is not read for the account key
+MAX_ACCOUNT_BODY_BYTES = 16 * 1024
+
+
+class RouteBudget:
+    """Requests allowed per window for one route.
+
+    ``per_user`` applies to requests with a valid JWT, which are then not
+    counted per IP: a whole venue can share one NAT address. ``per_ip``
+    applies to anonymous requests, and ``per_account`` to anonymous
+    requests naming the same ``email`` in their JSON body.
+    """
+
+    def __init__(self, per_ip: Optional[int] = None, per_user: Optional[int] = None,
+                 per_account: Optional[int] = None):
+        self.per_ip = per_ip
+        self.per_user = per_user
+        self.per_account = per_account
+
+
+class RateLimitMiddleware:
+    """ASGI middleware enforcing per-route budgets keyed by client IP and JWT subject"""
+
+    def __init__(self, app, budgets: Dict[str, RouteBudget], default_budget: RouteBudget,
+                 window_seconds: float, backend: RateLimitBackend = None):
+        self.app = app
+        self.budgets = budgets
+        self.default_budget = default_budget
+        self.window_seconds = window_seconds
+        self.backend = backend or InMemoryRateLimitBackend()
+        self.rejected = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope.get("path", "")
+        route = path if path in self.budgets else "*"
+        budget = self.budgets.get(path, self.default_budget)
+        now = time.time()
+
+        checks = []
+        user = self._user(scope) if budget.per_user is not None else None
+        if user is not None:
+            checks.append((f"{route}:user:{user}", budget.per_user))
+        else:
+            if budget.per_ip is not None:
+                client = scope.get("client")
+                checks.append((f"{route}:ip:{client[0] if client else 'unknown'}", budget.per_ip))
+            if budget.per_account is not None:
+                body = await self._read_body(receive)
+                if body is None:
+                    await self._send_json(send, 413, {"detail": "Request body too large"})
+                    return
+                receive = self._replay_body(body, receive)
+                account = self._account(body)
+                if account is not None:
+                    checks.append((f"{route}:account:{account}", budget.per_account))
+
+        for key, limit in checks:
+            try:
+                allowed, retry_after = await self.backend.ahit(key, limit, self.window_seconds, now)
+            except CacheUnavailable as e:
+                # A busy counter store should not take the API down with it
+                print(f"Rate limit counters unavailable, admitting request: {e}")
+                continue
+            if not allowed:
+                self.rejected += 1
+                await self._reject(send, retry_after)
+                return
+
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    def _user(scope) -> Optional[str]:
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and token:
+                    return verify_token(token.strip())
+        return None
+
+    @staticmethod
+    def _account(body: bytes) -> Optional[str]:
+        try:
+            email = json.loads(body).get("email")
+        except (ValueError, AttributeError):
+            return None
+        return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+    @staticmethod
+    async def _read_body(receive) -> Optional[bytes]:
+        """The whole request body, or None once it grows past MAX_ACCOUNT_BODY_BYTES"""
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_ACCOUNT_BODY_BYTES:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    @staticmethod
+    def _replay_body(body: bytes, receive):
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return replay
+
+    @staticmethod
+    async def _reject(send, retry_after: float):
+        await RateLimitMiddleware._send_json(send, 429, {"detail": "Too many requests"}, [
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode("latin-1")),
+        ])
+
+    @staticmethod
+    async def _send_json(send, status_code: int, payload: dict, headers=()):
+        body = json.dumps(payload).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                *headers,
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    def stats(self) -> dict:
+        return {"rejected": self.rejected}
@@ -0,0 +1,277 @@
+"""Weekly attendance reports for organizers.
+
+Per-event participant counts and hours for a period come from one grouped
+query over participation, events and users. Each organizer's PDF and CSV
+are then rendered in a process pool and stored under ``REPORT_DIR``; every
+file has a row in ``organizer_reports``. ReportLab styles are built once per
+pool process. With ``REPORTS_ENABLED`` the API builds the previous week's
+reports every ``REPORT_WEEKDAY`` at ``REPORT_HOUR_UTC``. The first worker to
+claim the week in ``report_runs`` builds it.
+
+Usage:
+    python reports.py                    # build last week's reports
+    python reports.py --week 2024-09-02  # the week containing that day
+    python reports.py --force            # rebuild a week that was already built
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from archive import archived_years_between, participation_totals
+from config import settings
+from models import User, Event, OrganizerReport, ReportRun
+
+REPORT_MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "csv": "text/csv",
+}
+
+REPORT_CSV_COLUMNS = ["event_id", "event_name", "event_date", "duration", "participants", "hours_awarded"]
+
+# A run that has not finished after this long belongs to a worker that died
+STALE_RUN = timedelta(hours=1)
+
+
+def week_bounds(day: date) -> Tuple[datetime, datetime]:
+    """Monday 00:00 of the week containing ``day`` and the Monday after it"""
+    start = datetime.combine(day - timedelta(days=day.weekday()), datetime.min.time())
+    return start, start + timedelta(days=7)
+
+
+def previous_week(now: datetime = None) -> Tuple[datetime, datetime]:
+    return week_bounds((now or datetime.utcnow()).date() - timedelta(days=7))
+
+
+def next_run(now: datetime = None) -> datetime:
+    """The next REPORT_WEEKDAY at REPORT_HOUR_UTC after ``now``"""
+    now = now or datetime.utcnow()
+    days_ahead = (settings.report_weekday - now.weekday()) % 7
+    run = datetime.combine(now.date() + timedelta(days=days_ahead), datetime.min.time())
+    run = run.replace(hour=settings.report_hour_utc)
+    return run if run > now else run + timedelta(days=7)
+
+
+def organizer_aggregates(db: Session, start: datetime, end: datetime) -> List[dict]:
+    """Every organizer's events in [start, end) with participants and hours, from one query"""
+    # A week can straddle the start of an academic year, with one side archived
+    # and the other still in participation; both are read
+    in_period = (Event.date >= start, Event.date < end)
+    totals = participation_totals(
+        archived_years_between(db, start, end), select(Event.id).where(*in_period)
+    )
+    rows = db.execute(
+        select(
+            User.id, User.name, User.email,
+            Event.id, Event.name, Event.date, Event.duration,
+            func.coalesce(totals.c.participant_count, 0),
+            func.coalesce(totals.c.total_hours_awarded, 0.0),
+        )
+        .select_from(Event)
+        .join(User, User.id == Event.organizer_id)
+        .outerjoin(totals, totals.c.event_id == Event.id)
+        .where(*in_period)
+        .order_by(User.id, Event.date, Event.id)
+    )
+
+    organizers: Dict[int, dict] = {}
+    for (organizer_id, organizer_name, organizer_email,
+         event_id, event_name, event_date, duration, participants, hours) in rows:
+        report = organizers.get(organizer_id)
+        if report is None:
+            report = organizers[organizer_id] = {
+                "organizer_id": organizer_id,
+                "organizer_name": organizer_name,
+                "organizer_email": organizer_email,
+                "period_start": start,
+                "period_end": end,
+                "events": [],
+                "participants": 0,
+                "hours": 0.0,
+            }
+        report["events"].append({
+            "id": event_id,
+            "name": event_name,
+            "date": event_date,
+            "duration": duration,
+            "participants": participants,
+            "hours": hours,
+        })
+        report["participants"] += participants
+        report["hours"] += hours
+    return list(organizers.values())
+
+
+def render_report(report: dict, directory: str) -> List[dict]:
+    """Write one organizer's PDF and CSV; runs in a pool process"""
+    from pdf_generator import generate_report_pdf
+
+    start, end = report["period_start"], report["period_end"]
+    period = f"{start:%d.%m.%Y} – {end - timedelta(days=1):%d.%m.%Y}"
+    pdf_bytes = generate_report_pdf(
+        report["organizer_name"], period, report["events"], report["participants"], report["hours"]
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REPORT_CSV_COLUMNS)
+    for event in report["events"]:
+        writer.writerow([event["id"], event["name"], event["date"].isoformat(), event["duration"],
+                         event["participants"], event["hours"]])
+    csv_bytes = buffer.getvalue().encode("utf-8")
+
+    outputs = []
+    for report_format, data in (("pdf", pdf_bytes), ("csv", csv_bytes)):
+        path = os.path.join(str(report["organizer_id"]), f"{start:%Y-%m-%d}.{report_format}")
+        _write_atomically(os.path.join(directory, path), data)
+        outputs.append({"format": report_format, "path": path, "size_bytes": len(data)})
+    return outputs
+
+
+def _write_atomically(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    # A download never sees a half-written file
+    os.replace(tmp_path, path)
+
+
+def render_reports(reports: List[dict], directory: str, workers: int) -> List[List[dict]]:
+    """Render every report, in ``workers`` processes (ReportLab is pure Python and holds the GIL)"""
+    if workers <= 1 or len(reports) <= 1:
+        return [render_report(report, directory) for report in reports]
+    # Spawned, not forked: the caller may be a threaded API worker
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(render_report, reports, [directory] * len(reports),
+                             chunksize=max(1, len(reports) // (workers * 4))))
+
+
+def store_reports(db: Session, reports: List[dict], outputs: List[List[dict]]):
+    """Upsert an organizer_reports row per rendered file"""
+    if not reports:
+        return
+    start = reports[0]["period_start"]
+    existing = {
+        (row.organizer_id, row.format): row
+        for row in db.execute(select(OrganizerReport).where(OrganizerReport.period_start == start)).scalars()
+    }
+    for report, files in zip(reports, outputs):
+        for output in files:
+            row = existing.get((report["organizer_id"], output["format"]))
+            if row is None:
+                row = OrganizerReport(organizer_id=report["organizer_id"], period_start=start,
+                                      format=output["format"])
+                db.add(row)
+            row.period_end = report["period_end"]
+            row.path = output["path"]
+            row.size_bytes = output["size_bytes"]
+            row.events = len(report["events"])
+            row.participants = report["participants"]
+            row.hours = report["hours"]
+            row.created_at = datetime.utcnow()
+    db.commit()
+
+
+def claim_run(db: Session, start: datetime, end: datetime, force: bool = False) -> bool:
+    """Take the period for this worker; False if another worker built or is building it"""
+    now = datetime.utcnow()
+    db.add(ReportRun(period_start=start, period_end=end, started_at=now))
+    try:
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+    condition = ReportRun.period_start == start
+    if not force:
+        condition = condition & ReportRun.finished_at.is_(None) & (ReportRun.started_at < now - STALE_RUN)
+    claimed = db.execute(
+        update(ReportRun).where(condition).values(started_at=now, finished_at=None)
+    ).rowcount
+    db.commit()
+    return claimed == 1
+
+
+def build_reports(session_factory, start: datetime, end: datetime, force: bool = False,
+                  workers: int = None, directory: str = None) -> dict:
+    """Claim, aggregate, render and store the reports for one period"""
+    workers = settings.report_workers if workers is None else workers
+    directory = directory or settings.report_dir
+    started = time.perf_counter()
+    with session_factory() as db:
+        if not claim_run(db, start, end, force):
+            return {"period_start": start.isoformat(), "skipped": True}
+        reports = organizer_aggregates(db, start, end)
+        # Release the connection while the pool renders
+        db.commit()
+        aggregate_seconds = time.perf_counter() - started
+
+        outputs = render_reports(reports, directory, workers)
+        store_reports(db, reports, outputs)
+        db.execute(
+            update(ReportRun).where(ReportRun.period_start == start)
+            .values(finished_at=datetime.utcnow(), reports=len(reports))
+        )
+        db.commit()
+    return {
+        "period_start": start.isoformat(),
+        "organizers": len(reports),
+        "events": sum(len(report["events"]) for report in reports),
+        "files": sum(len(files) for files in outputs),
+        "aggregate_seconds": round(aggregate_seconds, 3),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def reports_for(db: Session, user: User, organizer_id: int = None) -> List[OrganizerReport]:
+    """Stored reports an organizer may download (admins: everyone's, or one organizer's)"""
+    query = select(OrganizerReport).order_by(OrganizerReport.period_start.desc(), OrganizerReport.id)
+    if user.role != "admin":
+        query = query.where(OrganizerReport.organizer_id == user.id)
+    elif organizer_id is not None:
+        query = query.where(OrganizerReport.organizer_id == organizer_id)
+    return list(db.execute(query).scalars())
+
+
+async def schedule_reports(session_factory):
+    """Build last week's reports now if missing, then every REPORT_WEEKDAY at REPORT_HOUR_UTC"""
+    while True:
+        try:
+            start, end = previous_week()
+            result = await asyncio.to_thread(build_reports, session_factory, start, end)
+            if not result.get("skipped"):
+                print(f"Built organizer reports: {json.dumps(result)}")
+        except Exception as e:
+            print(f"Error building organizer reports: {e}")
+        await asyncio.sleep((next_run() - datetime.utcnow()).total_seconds())
+
+
+def main(argv=None):
+    from database import SessionLocal, create_tables
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--week", type=date.fromisoformat, help="any day of the week to build (default: last week)")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the week was already built")
+    parser.add_argument("--workers", type=int, default=settings.report_workers)
+    args = parser.parse_args(argv)
+
+    create_tables()
+    start, end = week_bounds(args.week) if args.week else previous_week()
+    print(json.dumps(build_reports(SessionLocal, start, end, args.force, args.workers), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import re
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, text, table, column
+from sqlalchemy.orm import Session
+
+from models import User, Event
+
+# External-content FTS5 index over events(name, description), kept in sync by triggers
+SEARCH_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+        name, description,
+        content='events', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS events_fts_ai AFTER INSERT ON events BEGIN
+        INSERT INTO events_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS events_fts_ad AFTER DELETE ON events BEGIN
+        INSERT INTO events_fts(events_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS events_fts_au AFTER UPDATE OF name, description ON events BEGIN
+        INSERT INTO events_fts(events_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO events_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_events_date ON events (date)",
+]
+
+DROP_SEARCH_INDEX_DDL = [
+    "DROP TRIGGER IF EXISTS events_fts_ai",
+    "DROP TRIGGER IF EXISTS events_fts_ad",
+    "DROP TRIGGER IF EXISTS events_fts_au",
+    "DROP TABLE IF EXISTS events_fts",
+]
+
+# PostgreSQL equivalent: a GIN index over a weighted tsvector, names ranked above descriptions
+PG_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(events.name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(events.description, '')), 'B')"
+)
+
+PG_SEARCH_INDEX_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_events_search ON events USING gin (({PG_DOCUMENT}))",
+    "CREATE INDEX IF NOT EXISTS ix_events_date ON events (date)",
+]
+
+# Column weights for bm25(): matches in the name rank above the description
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+events_fts = table("events_fts", column("rowid"))
+
+
+def create_search_index(engine):
+    """Create the FTS5 table and triggers, rebuilding the index when it is new"""
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            for statement in PG_SEARCH_INDEX_DDL:
+                conn.exec_driver_sql(statement)
+        return
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'events_fts'")
+        ).first()
+        for statement in SEARCH_INDEX_DDL:
+            conn.exec_driver_sql(statement)
+        if not exists:
+            conn.exec_driver_sql("INSERT INTO events_fts(events_fts) VALUES ('rebuild')")
+
+
+def drop_search_index(engine):
+    """Drop the FTS5 table and its triggers, e.g. before a bulk load"""
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX IF EXISTS ix_events_search")
+        return
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        for statement in DROP_SEARCH_INDEX_DDL:
+            conn.exec_driver_sql(statement)
+
+
+def build_match_query(q: str) -> Optional[str]:
+    """Turn free text into an FTS5 query: every word must match as a prefix"""
+    terms = re.findall(r"\w+", q or "")
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def build_tsquery(q: str) -> Optional[str]:
+    """The PostgreSQL to_tsquery() form of ``build_match_query``"""
+    terms = re.findall(r"\w+", q or "")
+    if not terms:
+        return None
+    return " & ".join(f"{term}:*" for term in terms)
+
+
+def search_events(db: Session, q: str = "", date_from: Optional[datetime] = None,
+                  date_to: Optional[datetime] = None, limit: int = 20, offset: int = 0):
+    """Return up to ``limit`` matching event rows, best ranked first"""
+    query = select(
+        Event.id,
+        Event.name,
+        Event.description,
+        Event.date,
+        Event.duration,
+        User.name.label("organizer_name"),
+    ).join(User, User.id == Event.organizer_id)
+
+    postgres = db.get_bind().dialect.name == "postgresql"
+    match = build_tsquery(q) if postgres else build_match_query(q)
+    if match and postgres:
+        tsquery = "to_tsquery('simple', :match)"
+        query = (
+            query.where(text(f"({PG_DOCUMENT}) @@ {tsquery}").bindparams(match=match))
+            .order_by(text(f"ts_rank({PG_DOCUMENT}, {tsquery}) DESC").bindparams(match=match), Event.date)
+        )
+    elif match:
+        query = (
+            query.join(events_fts, events_fts.c.rowid == Event.id)
+            .where(text("events_fts MATCH :match").bindparams(match=match))
+            .order_by(text(f"bm25(events_fts, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT})"), Event.date)
+        )
+    else:
+        query = query.order_by(Event.date)
+
+    if date_from is not None:
+        query = query.where(Event.date >= date_from)
+    if date_to is not None:
+        query = query.where(Event.date <= date_to)
+
+    return db.execute(query.limit(limit).offset(offset)).all()
+
+
+def like_search_events(db: Session, q: str, limit: int = 20, offset: int = 0):
+    """Substring scan equivalent of ``search_events``, kept for benchmarking"""
+    pattern = f"%{q}%"
+    query = (
+        select(Event.id, Event.name, Event.description, Event.date, Event.duration,
+               User.name.label("organizer_name"))
+        .join(User, User.id == Event.organizer_id)
+        .where(Event.name.like(pattern) | Event.description.like(pattern))
+        .order_by(Event.date)
+        .limit(limit)
+        .offset(offset)
+    )
+    return db.execute(query).all()
@@ -0,0 +1,272 @@
+"""Deterministic synthetic data generator and bulk loader.
+
+Creates users, events and participations from a fixed random seed and loads
+them with DBAPI ``executemany`` inside one large transaction, with SQLite
+durability pragmas relaxed for the duration of the load.
+
+Usage:
+    python seed_data.py --db bench_alumni_club.db --users 100000 \\
+        --events 10000 --participations 2000000 --seed 42
+    python seed_data.py --password-hash '$2b$12$...'     # pre-hashed fixture
+    python seed_data.py --password-fixtures hashes.json  # list of hashes
+    python seed_data.py --database-url postgresql+psycopg2://alumni@localhost/bench
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, inspect
+
+from models import Base, ARCHIVE_TABLE_PREFIX
+from search import create_search_index, drop_search_index
+
+DEFAULT_DB_PATH = "bench_alumni_club.db"
+DEFAULT_PASSWORD = "benchmark-password"
+CHUNK_SIZE = 100_000
+
+EVENT_TOPICS = (
+    "Volunteering", "Charity", "Career", "Alumni", "Science", "Sports", "Music",
+    "Ecology", "Mentoring", "Hackathon", "Library", "Theatre", "Debate", "Startup",
+)
+EVENT_KINDS = ("meetup", "workshop", "fair", "lecture", "marathon", "festival", "cleanup", "seminar")
+
+# Pragmas applied while loading; the previous values are restored afterwards
+LOAD_PRAGMAS = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+    "locking_mode": "EXCLUSIVE",
+    "temp_store": "MEMORY",
+    "cache_size": "-262144",
+}
+
+
+@contextmanager
+def relaxed_pragmas(dbapi_conn):
+    """Relax SQLite durability settings for a bulk load"""
+    cursor = dbapi_conn.cursor()
+    previous = {}
+    for name, value in LOAD_PRAGMAS.items():
+        previous[name] = cursor.execute(f"PRAGMA {name}").fetchone()[0]
+        cursor.execute(f"PRAGMA {name} = {value}")
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+def chunked(rows, size: int = CHUNK_SIZE):
+    """Group an iterator of rows into lists of at most ``size`` rows"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class DatasetGenerator:
+    """Generates reproducible rows for users, events and participations"""
+
+    def __init__(self, users: int, events: int, participations: int, seed: int = 42,
+                 password_hashes=None, now: datetime = None):
+        self.users = users
+        self.events = events
+        self.participations = participations
+        self.seed = seed
+        self.password_hashes = password_hashes or []
+        self.now = now or datetime(2024, 9, 1)
+        self.organizers = max(1, users // 100)
+        self.durations = []
+
+    def user_rows(self):
+        """Yield (id, name, email, password_hash, role, total_hours, created_at)"""
+        hashes = self.password_hashes
+        created_at = self.now.isoformat(sep=" ")
+        for i in range(1, self.users + 1):
+            yield (
+                i,
+                f"User {i}",
+                # Must pass the EmailStr validation on /login and /register
+                f"user{i}@example.com",
+                hashes[i % len(hashes)],
+                "organizer" if i <= self.organizers else "student",
+                0.0,
+                created_at,
+            )
+
+    def event_rows(self):
+        """Yield (id, name, description, date, duration, organizer_id, qr_code_data, qr_token, created_at)"""
+        rng = random.Random(f"{self.seed}-events")
+        created_at = self.now.isoformat(sep=" ")
+        self.durations = [0.0] * (self.events + 1)
+        for i in range(1, self.events + 1):
+            duration = rng.choice((0.5, 1.0, 1.5, 2.0))
+            self.durations[i] = duration
+            date = self.now + timedelta(minutes=rng.randint(-180 * 24 * 60, 180 * 24 * 60))
+            topic, kind = rng.choice(EVENT_TOPICS), rng.choice(EVENT_KINDS)
+            qr_token = f"{rng.getrandbits(96):024x}"
+            yield (
+                i,
+                f"{topic} {kind} {i}",
+                f"Synthetic {kind} about {topic.lower()} and {rng.choice(EVENT_TOPICS).lower()}",
+                date.isoformat(sep=" "),
+                duration,
+                rng.randint(1, self.organizers),
+                f"alumni_club_event_{qr_token}",
+                qr_token,
+                created_at,
+            )
+
+    def participation_rows(self):
+        """Yield (user_id, event_id, timestamp, hours_awarded) with distinct events per student"""
+        if not self.durations:
+            raise RuntimeError("event_rows() must be consumed before participation_rows()")
+        rng = random.Random(f"{self.seed}-participation")
+        students = self.users - self.organizers
+        if students <= 0:
+            return
+        per_student, extra = divmod(self.participations, students)
+        timestamp = self.now.isoformat(sep=" ")
+        event_ids = range(1, self.events + 1)
+        durations = self.durations
+        for offset, user_id in enumerate(range(self.organizers + 1, self.users + 1)):
+            count = min(self.events, per_student + (1 if offset < extra else 0))
+            for event_id in rng.sample(event_ids, count):
+                yield (user_id, event_id, timestamp, durations[event_id])
+
+
+def load_dataset(engine, generator: DatasetGenerator) -> dict:
+    """Recreate the schema and bulk load every table, returning row counts and timings"""
+    # The search index is rebuilt once after the load instead of per row by triggers
+    drop_search_index(engine)
+    Base.metadata.drop_all(bind=engine)
+    # Archived years of the previous dataset
+    with engine.begin() as conn:
+        for name in inspect(conn).get_table_names():
+            if name.startswith(ARCHIVE_TABLE_PREFIX):
+                conn.exec_driver_sql(f'DROP TABLE "{name}"')
+    Base.metadata.create_all(bind=engine)
+
+    stats = {}
+    raw = engine.raw_connection()
+    try:
+        is_sqlite = engine.dialect.name == "sqlite"
+        with (relaxed_pragmas(raw) if is_sqlite else nullcontext()):
+            cursor = raw.cursor()
+            steps = [
+                ("users", "INSERT INTO users (id, name, email, password_hash, role, total_hours, created_at) "
+                          "VALUES (?, ?, ?, ?, ?, ?, ?)", generator.user_rows),
+                ("events", "INSERT INTO events (id, name, description, date, duration, organizer_id, "
+                           "qr_code_data, qr_token, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", generator.event_rows),
+                ("participation", "INSERT INTO participation (user_id, event_id, timestamp, hours_awarded) "
+                                  "VALUES (?, ?, ?, ?)", generator.participation_rows),
+            ]
+            for table, sql, rows in steps:
+                if not is_sqlite:
+                    sql = sql.replace("?", "%s")
+                started = time.perf_counter()
+                count = 0
+                for chunk in chunked(rows()):
+                    cursor.executemany(sql, chunk)
+                    count += len(chunk)
+                stats[table] = {"rows": count, "seconds": round(time.perf_counter() - started, 2)}
+
+            # Denormalized totals in one aggregate pass over participation
+            started = time.perf_counter()
+            cursor.execute(
+                "UPDATE users SET total_hours = agg.hours "
+                "FROM (SELECT user_id, SUM(hours_awarded) AS hours FROM participation GROUP BY user_id) AS agg "
+                "WHERE users.id = agg.user_id"
+            )
+            stats["total_hours"] = {"seconds": round(time.perf_counter() - started, 2)}
+
+            # One ledger grant per check-in, so replaying the ledger gives the same totals
+            started = time.perf_counter()
+            placeholder = "?" if is_sqlite else "%s"
+            cursor.execute(
+                "INSERT INTO hour_ledger (user_id, event_id, hours, kind, created_at) "
+                "SELECT user_id, event_id, hours_awarded, 'grant', timestamp FROM participation ORDER BY id"
+            )
+            cursor.execute(
+                "INSERT INTO hour_ledger_checkpoints (name, seq, entries, updated_at) "
+                f"VALUES ('opened', 0, 0, {placeholder})", (generator.now.isoformat(sep=" "),)
+            )
+            stats["hour_ledger"] = {"seconds": round(time.perf_counter() - started, 2)}
+            if not is_sqlite:
+                # Ids were inserted explicitly; move the serial sequences past them
+                for table in ("users", "events"):
+                    cursor.execute(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                        f"(SELECT MAX(id) FROM {table}))"
+                    )
+            raw.commit()
+            cursor.close()
+    finally:
+        raw.close()
+
+    started = time.perf_counter()
+    create_search_index(engine)
+    stats["search_index"] = {"seconds": round(time.perf_counter() - started, 2)}
+    return stats
+
+
+def load_password_hashes(password: str = DEFAULT_PASSWORD, password_hash: str = None,
+                         fixtures_path: str = None):
+    """Return the password hashes to cycle through, hashing at most once"""
+    if fixtures_path:
+        with open(fixtures_path) as f:
+            hashes = json.load(f)
+        if not hashes:
+            raise ValueError(f"No password hashes in {fixtures_path}")
+        return list(hashes)
+    if password_hash:
+        return [password_hash]
+    from auth import get_password_hash
+    return [get_password_hash(password)]
+
+
+def seed_database(engine, users: int, events: int, participations: int, seed: int = 42,
+                  password_hashes=None) -> dict:
+    """Generate a dataset from ``seed`` and bulk load it into ``engine``"""
+    generator = DatasetGenerator(
+        users, events, participations, seed=seed,
+        password_hashes=password_hashes or load_password_hashes(),
+    )
+    return load_dataset(engine, generator)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="SQLite file to (re)create")
+    parser.add_argument("--database-url", help="load into this database instead, e.g. a PostgreSQL URL")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--events", type=int, default=10_000)
+    parser.add_argument("--participations", type=int, default=2_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--password", default=DEFAULT_PASSWORD, help="plain password for every user")
+    parser.add_argument("--password-hash", help="pre-hashed password used for every user")
+    parser.add_argument("--password-fixtures", help="JSON list of pre-hashed passwords to cycle through")
+    args = parser.parse_args(argv)
+
+    hashes = load_password_hashes(args.password, args.password_hash, args.password_fixtures)
+    engine = create_engine(args.database_url or f"sqlite:///{args.db}")
+    started = time.perf_counter()
+    stats = seed_database(engine, args.users, args.events, args.participations, args.seed, hashes)
+    stats["elapsed_seconds"] = round(time.perf_counter() - started, 2)
+    participation = stats["participation"]
+    if participation["seconds"]:
+        stats["participation_rows_per_minute"] = int(participation["rows"] / participation["seconds"] * 60)
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
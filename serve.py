@@ -0,0 +1,67 @@
+"""Production launcher: prepares the schema once, then pre-forks API workers.
+
+Workers skip ``create_tables()`` on startup and, when more than one is
+started, share response-cache versions, rate limit counters and
+invalidation messages through the SQLite cache backend.
+
+Usage:
+    python serve.py --workers 4
+    python serve.py --workers 4 --gunicorn          # gunicorn + uvicorn workers
+    python serve.py --workers 4 --cache-backend sqlite --shared-cache-path /run/alumni/cache.db
+"""
+import argparse
+import os
+import sys
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the API with several worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--cache-backend", choices=("memory", "sqlite"),
+                        help="default: sqlite with more than one worker, memory otherwise")
+    parser.add_argument("--shared-cache-path", help="SQLite file for the shared cache backend")
+    parser.add_argument("--gunicorn", action="store_true",
+                        help="supervise workers with gunicorn instead of uvicorn")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args):
+    """Export settings before anything imports config, so workers inherit them"""
+    cache_backend = args.cache_backend or ("sqlite" if args.workers > 1 else "memory")
+    if cache_backend == "memory" and args.workers > 1:
+        print("Warning: memory cache backend with several workers; caches will not be shared")
+    os.environ["CACHE_BACKEND"] = cache_backend
+    if args.shared_cache_path:
+        os.environ["SHARED_CACHE_PATH"] = args.shared_cache_path
+    os.environ["CREATE_TABLES_ON_STARTUP"] = "false"
+
+
+def prepare_database():
+    """Run schema creation once, in the parent, before any worker starts"""
+    from database import create_tables
+    create_tables()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+    prepare_database()
+
+    if args.gunicorn:
+        command = [
+            "gunicorn", "main:app",
+            "--worker-class", "uvicorn.workers.UvicornWorker",
+            "--workers", str(args.workers),
+            "--bind", f"{args.host}:{args.port}",
+        ]
+        os.execvp(command[0], command)
+
+    import uvicorn
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
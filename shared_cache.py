@@ -0,0 +1,349 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import settings
+
+
+class CacheUnavailable(Exception):
+    """A shared backend stayed locked by another worker past its busy timeout"""
+
+
+class CacheBackend:
+    """Key-value store with TTLs, counters and a message log for cache coherence.
+
+    Values must be ``str``, ``int``, ``float`` or ``bytes``. Backends with
+    ``shared = True`` are visible to every worker process. Async code uses
+    the ``a``-prefixed methods, which run shared backends in a thread and
+    raise ``CacheUnavailable`` instead of waiting on a busy store.
+    """
+
+    shared = False
+
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def add(self, key: str, value, ttl: Optional[float] = None) -> bool:
+        """Set ``key`` only if it is missing, returning whether it was stored"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        raise NotImplementedError
+
+    def publish(self, channel: str, payload: str, origin: str) -> int:
+        return 0
+
+    def messages_since(self, last_id: int) -> List[Tuple[int, str, str, str]]:
+        return []
+
+    def latest_message_id(self) -> int:
+        return 0
+
+    async def off_loop(self, fn, *args):
+        """Call ``fn`` (which uses this backend) from async code"""
+        if not self.shared:
+            return fn(*args)
+        # Shared backends do file I/O and may wait for another worker's write lock
+        try:
+            return await asyncio.to_thread(fn, *args)
+        except sqlite3.OperationalError as e:
+            raise CacheUnavailable(str(e)) from e
+
+    async def aget(self, key: str):
+        return await self.off_loop(self.get, key)
+
+    async def aset(self, key: str, value, ttl: Optional[float] = None):
+        return await self.off_loop(self.set, key, value, ttl)
+
+    async def aadd(self, key: str, value, ttl: Optional[float] = None) -> bool:
+        return await self.off_loop(self.add, key, value, ttl)
+
+    async def adelete(self, key: str):
+        return await self.off_loop(self.delete, key)
+
+    async def aincr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        return await self.off_loop(self.incr, key, amount, ttl)
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Process-local backend, used when a single worker serves the API"""
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[object, Optional[float]]] = {}
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+
+    def _live(self, key: str, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._entries[key]
+            return None
+        return entry
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._live(key, time.time())
+            return entry[0] if entry else None
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        with self._lock:
+            now = time.time()
+            self._entries[key] = (value, now + ttl if ttl else None)
+            self._maybe_prune(now)
+
+    def _maybe_prune(self, now: float):
+        # Entries written once and never read again would otherwise outlive their TTL
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        expired = [key for key, (_, expires_at) in self._entries.items()
+                   if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+
+    def add(self, key: str, value, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            now = time.time()
+            if self._live(key, now) is not None:
+                return False
+            self._entries[key] = (value, now + ttl if ttl else None)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        with self._lock:
+            now = time.time()
+            entry = self._live(key, now)
+            if entry is None:
+                value, expires_at = amount, (now + ttl if ttl else None)
+            else:
+                value, expires_at = entry[0] + amount, entry[1]
+            self._entries[key] = (value, expires_at)
+            return value
+
+
+class SqliteCacheBackend(CacheBackend):
+    """Backend in a WAL-mode SQLite file shared by every worker on the host"""
+
+    shared = True
+
+    SCHEMA = [
+        """
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            key TEXT PRIMARY KEY,
+            value,
+            expires_at REAL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS cache_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            origin TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """,
+    ]
+
+    def __init__(self, path: str, message_retention_seconds: float = 300.0, busy_timeout: float = 0.5):
+        self.path = path
+        self.message_retention_seconds = message_retention_seconds
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._last_prune = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        for statement in self.SCHEMA:
+            conn.execute(statement)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        row = self._conn().execute(
+            "SELECT value FROM cache_entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, now + ttl if ttl else None),
+        )
+        self._maybe_prune(now)
+
+    def add(self, key: str, value, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        cursor = self._conn().execute(
+            "INSERT INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE cache_entries.expires_at IS NOT NULL AND cache_entries.expires_at <= ?",
+            (key, value, now + ttl if ttl else None, now),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key: str):
+        self._conn().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        row = self._conn().execute(
+            "INSERT INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            "value = CASE WHEN cache_entries.expires_at IS NOT NULL AND cache_entries.expires_at <= ? "
+            "THEN excluded.value ELSE cache_entries.value + excluded.value END, "
+            "expires_at = CASE WHEN cache_entries.expires_at IS NOT NULL AND cache_entries.expires_at <= ? "
+            "THEN excluded.expires_at ELSE cache_entries.expires_at END "
+            "RETURNING value",
+            (key, amount, now + ttl if ttl else None, now, now),
+        ).fetchone()
+        self._maybe_prune(now)
+        return row[0]
+
+    def publish(self, channel: str, payload: str, origin: str) -> int:
+        now = time.time()
+        cursor = self._conn().execute(
+            "INSERT INTO cache_messages (channel, payload, origin, created_at) VALUES (?, ?, ?, ?)",
+            (channel, payload, origin, now),
+        )
+        self._maybe_prune(now)
+        return cursor.lastrowid
+
+    def messages_since(self, last_id: int) -> List[Tuple[int, str, str, str]]:
+        return self._conn().execute(
+            "SELECT id, channel, payload, origin FROM cache_messages WHERE id > ? ORDER BY id LIMIT 1000",
+            (last_id,),
+        ).fetchall()
+
+    def latest_message_id(self) -> int:
+        row = self._conn().execute("SELECT MAX(id) FROM cache_messages").fetchone()
+        return row[0] or 0
+
+    def _maybe_prune(self, now: float):
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        conn = self._conn()
+        conn.execute("DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM cache_messages WHERE created_at < ?", (now - self.message_retention_seconds,)
+        )
+
+
+class InvalidationBus:
+    """Delivers invalidation messages to local handlers and, through a shared backend, to other workers"""
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.origin = uuid.uuid4().hex
+        self._handlers: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+        self._last_id = backend.latest_message_id()
+
+    def subscribe(self, channel: str, handler: Callable[[dict], None]):
+        self._handlers[channel].append(handler)
+
+    def publish(self, channel: str, message: dict):
+        self._deliver(channel, message)
+        if self.backend.shared:
+            self.backend.publish(channel, json.dumps(message), self.origin)
+
+    def poll(self) -> int:
+        """Deliver messages published by other workers since the last poll"""
+        delivered = 0
+        for message_id, channel, payload, origin in self.backend.messages_since(self._last_id):
+            self._last_id = message_id
+            if origin != self.origin:
+                self._deliver(channel, json.loads(payload))
+                delivered += 1
+        return delivered
+
+    async def run(self, interval_seconds: float):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                self.poll()
+            except sqlite3.Error as e:
+                print(f"Error polling invalidation messages: {e}")
+
+    def _deliver(self, channel: str, message: dict):
+        for handler in self._handlers.get(channel, ()):
+            handler(message)
+
+
+def create_cache_backend(kind: str = None, path: str = None) -> CacheBackend:
+    kind = kind or settings.cache_backend
+    if kind == "memory":
+        return MemoryCacheBackend()
+    if kind == "sqlite":
+        return SqliteCacheBackend(path or settings.shared_cache_path,
+                                  busy_timeout=settings.shared_cache_busy_timeout_ms / 1000)
+    raise ValueError(f"Unknown cache backend: {kind}")
+
+
+cache_backend = create_cache_backend()
+invalidation_bus = InvalidationBus(cache_backend)
+
+
+class TableVersions:
+    """Per-table write counters; any change to a counter invalidates dependent ETags.
+
+    Counters live in the configured cache backend, so with a shared backend
+    every worker derives the same ETags and sees the others' writes,
+    including those of the Streamlit apps and the maintenance scripts.
+    """
+
+    def __init__(self, backend: CacheBackend = None, bus: InvalidationBus = None):
+        self.backend = backend or cache_backend
+        self.bus = bus or invalidation_bus
+        # Distinguishes these counters from ones that may have been reset
+        epoch = uuid.uuid4().hex
+        if self.backend.add("table_versions:epoch", epoch):
+            self.epoch = epoch
+        else:
+            self.epoch = self.backend.get("table_versions:epoch")
+
+    def get(self, table: str) -> int:
+        return self.backend.get(f"table_versions:{table}") or 0
+
+    def bump(self, *tables: str):
+        for table in tables:
+            self.backend.incr(f"table_versions:{table}")
+        self.bus.publish("tables", {"tables": list(tables)})
+
+    def snapshot(self, tables) -> Tuple[int, ...]:
+        return tuple(self.get(table) for table in tables)
+
+    async def asnapshot(self, tables) -> Tuple[int, ...]:
+        return await self.backend.off_loop(self.snapshot, tables)
+
+
+table_versions = TableVersions()
@@ -1,4 +1,6 @@
+import os
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 import qrcode
 import io
@@ -7,15 +9,20 @@ from PIL import Image
 from datetime import datetime, date, time
 import sqlalchemy as sa
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, CHAR
 from passlib.context import CryptContext
-import uuid
+import re
+import secrets
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER
+from archive import is_archived
+from ledger import LEDGER_GRANT, ensure_ledger, ledger_entry, record_entries
+from models import HourLedgerEntry
+from shared_cache import table_versions
 
 # --- DB Setup ---
 Base = declarative_base()
@@ -23,6 +30,10 @@ DB_PATH = "sqlite:///alumni_club.db"
 engine = sa.create_engine(DB_PATH, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(bind=engine)
 
+# Organizer dashboard: participants shown per page, and pages kept per process
+PARTICIPANTS_PAGE_SIZE = 50
+PARTICIPANT_PAGES_CACHED = 256
+
 # --- Password Hashing ---
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 def hash_password(password):
@@ -52,6 +63,7 @@ class Event(Base):
     duration = Column(Float, nullable=False)
     organizer_id = Column(Integer, ForeignKey("users.id"))
     qr_code_data = Column(String, unique=True, nullable=False)
+    qr_token = Column(CHAR(24), unique=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     organizer = relationship("User", back_populates="events")
     participations = relationship("Participation", back_populates="event")
@@ -67,10 +79,25 @@ class Participation(Base):
     event = relationship("Event", back_populates="participations")
 
 Base.metadata.create_all(engine)
+if "qr_token" not in {c["name"] for c in sa.inspect(engine).get_columns("events")}:
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ALTER TABLE events ADD COLUMN qr_token CHAR(24)")
+        conn.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ix_events_qr_token ON events (qr_token)")
+# Hours awarded here are recorded in hour_ledger like the API's
+ensure_ledger(engine)
 
 # --- QR utils ---
-def generate_qr_code(event_id):
-    qr_data = f"alumni_club_event_{event_id}_{uuid.uuid4().hex[:8]}"
+QR_PREFIX = "alumni_club_event_"
+QR_TOKEN_PATTERN = re.compile(r"[0-9a-f]{24}")
+
+def parse_qr_token(qr_data):
+    if not qr_data or not qr_data.startswith(QR_PREFIX):
+        return None
+    token = qr_data[len(QR_PREFIX):]
+    return token if QR_TOKEN_PATTERN.fullmatch(token) else None
+
+def generate_qr_code(token):
+    qr_data = f"{QR_PREFIX}{token}"
     qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
     qr.add_data(qr_data)
     qr.make(fit=True)
@@ -82,7 +109,20 @@ def generate_qr_code(event_id):
     return qr_data, img_b64, img_bytes
 
 def validate_qr_data(qr_data):
-    return qr_data and qr_data.startswith("alumni_club_event_")
+    return qr_data and qr_data.startswith(QR_PREFIX)
+
+# Decodes in the browser and returns only the QR text (see qr_scanner/index.html)
+qr_scanner = components.declare_component("qr_scanner", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "qr_scanner"))
+
+def decode_qr_image(image_bytes):
+    """Server-side fallback for browsers without camera access"""
+    try:
+        from pyzbar import pyzbar
+    except ImportError:
+        return None
+    for code in pyzbar.decode(Image.open(io.BytesIO(image_bytes)).convert("L")):
+        return code.data.decode("utf-8")
+    return None
 
 # --- PDF Certificate ---
 def create_certificate_pdf(student_name, total_hours, events_count):
@@ -149,6 +189,9 @@ def get_user_by_email(email):
         return db.query(User).filter(User.email == email).first()
 
 def create_event(name, description, event_date, duration, organizer_id):
+    # Случайный 96-битный токен: QR-код готов до вставки, мероприятие записывается один раз
+    qr_token = secrets.token_hex(12)
+    qr_data, qr_b64, qr_bytes = generate_qr_code(qr_token)
     with SessionLocal() as db:
         event = Event(
             name=name,
@@ -156,40 +199,72 @@ def create_event(name, description, event_date, duration, organizer_id):
             date=event_date,
             duration=duration,
             organizer_id=organizer_id,
-            qr_code_data="temp"
+            qr_code_data=qr_data,
+            qr_token=qr_token
         )
         db.add(event)
         db.commit()
-        db.refresh(event)
-        event_id = event.id  # Сохраняем id до закрытия сессии
-        qr_data, qr_b64, qr_bytes = generate_qr_code(event_id)
-        event.qr_code_data = qr_data
-        db.commit()
-        return event_id, qr_b64, qr_data, qr_bytes
+        table_versions.bump("events")
+        return event.id, qr_b64, qr_data, qr_bytes
 
 def get_events():
     with SessionLocal() as db:
         return db.query(Event).all()
 
 def get_my_events(organizer_id):
+    """Organizer's events with participant counts and hours, from one grouped query"""
     with SessionLocal() as db:
-        return db.query(Event).filter(Event.organizer_id == organizer_id).all()
+        totals = (
+            db.query(
+                Participation.event_id,
+                sa.func.count(Participation.id).label("participant_count"),
+                sa.func.sum(Participation.hours_awarded).label("total_hours_awarded"),
+            )
+            .join(Event, Event.id == Participation.event_id)
+            .filter(Event.organizer_id == organizer_id)
+            .group_by(Participation.event_id)
+            .subquery()
+        )
+        return (
+            db.query(
+                Event.id, Event.name, Event.description, Event.date, Event.duration,
+                sa.func.coalesce(totals.c.participant_count, 0).label("participant_count"),
+                sa.func.coalesce(totals.c.total_hours_awarded, 0.0).label("total_hours_awarded"),
+                sa.select(sa.func.coalesce(sa.func.max(HourLedgerEntry.seq), 0))
+                .scalar_subquery().label("ledger_seq"),
+            )
+            .outerjoin(totals, totals.c.event_id == Event.id)
+            .filter(Event.organizer_id == organizer_id)
+            .order_by(Event.date.desc(), Event.id)
+            .all()
+        )
 
 def get_event_by_qr(qr_data):
+    qr_token = parse_qr_token(qr_data)
     with SessionLocal() as db:
+        if qr_token is not None:
+            return db.query(Event).filter(Event.qr_token == qr_token).first()
         return db.query(Event).filter(Event.qr_code_data == qr_data).first()
 
 def get_participation(user_id, event_id):
     with SessionLocal() as db:
         return db.query(Participation).filter(Participation.user_id == user_id, Participation.event_id == event_id).first()
 
+def is_event_archived(event):
+    with SessionLocal() as db:
+        return is_archived(db, event.date)
+
 def add_participation(user_id, event_id, hours):
     with SessionLocal() as db:
         participation = Participation(user_id=user_id, event_id=event_id, hours_awarded=hours)
         db.add(participation)
         user = db.query(User).filter(User.id == user_id).first()
         user.total_hours += hours
+        db.flush()
+        record_entries(db, [ledger_entry(user_id, hours, LEDGER_GRANT, event_id)])
         db.commit()
+        # Cached /events and /my-events responses of the API depend on these tables
+        table_versions.bump("participation", "users")
         return participation
 
 def get_my_participations(user_id):
@@ -206,19 +281,35 @@ def get_my_participations(user_id):
             })
         return result
 
-def get_event_participants(event_id):
+def get_event_participants(event_id, limit, offset=0):
+    """One page of an event's participants, in check-in order"""
     with SessionLocal() as db:
-        participations = db.query(Participation).filter(Participation.event_id == event_id).all()
-        result = []
-        for p in participations:
-            user = db.query(User).filter(User.id == p.user_id).first()
-            result.append({
-                "user_name": user.name,
-                "user_email": user.email,
-                "timestamp": p.timestamp,
-                "hours_awarded": p.hours_awarded
-            })
-        return result
+        rows = (
+            db.query(User.name, User.email, Participation.timestamp, Participation.hours_awarded)
+            .join(User, User.id == Participation.user_id)
+            .filter(Participation.event_id == event_id)
+            .order_by(Participation.id)
+            .limit(limit)
+            .offset(offset)
+            .all()
+        )
+        return [
+            {"user_name": name, "user_email": email, "timestamp": timestamp, "hours_awarded": hours}
+            for name, email, timestamp, hours in rows
+        ]
+
+@st.cache_data(max_entries=PARTICIPANT_PAGES_CACHED, show_spinner=False)
+def get_participants_page(event_id, version, page):
+    """Participants page as a DataFrame; ``version`` changes with every check-in, so stale pages are never served"""
+    participants = get_event_participants(event_id, PARTICIPANTS_PAGE_SIZE, page * PARTICIPANTS_PAGE_SIZE)
+    df = pd.DataFrame(participants, columns=['user_name', 'user_email', 'timestamp', 'hours_awarded'])
+    df['timestamp'] = pd.to_datetime(df['timestamp']).dt.strftime('%d.%m.%Y %H:%M')
+    return df.rename(columns={
+        'user_name': 'Имя',
+        'user_email': 'Email',
+        'timestamp': 'Время участия',
+        'hours_awarded': 'Часов начислено'
+    })
 
 def count_events_participated(user_id):
     with SessionLocal() as db:
@@ -268,6 +359,24 @@ def login_page():
             else:
                 st.error(msg)
 
+def confirm_participation(user, qr_data):
+    if not validate_qr_data(qr_data):
+        st.error("QR-код не от Alumni Club Connect")
+        return
+    event = get_event_by_qr(qr_data)
+    if not event:
+        st.error("Мероприятие не найдено")
+    elif get_participation(user.id, event.id):
+        st.error("Вы уже участвовали в этом мероприятии")
+    elif is_event_archived(event):
+        # Its check-ins are in an archive table, so get_participation cannot see them
+        st.error("Мероприятие относится к архивному учебному году")
+    else:
+        add_participation(user.id, event.id, event.duration)
+        st.success(f"Участие в {event.name} подтверждено! Получено часов: {event.duration}")
+        st.balloons()
+        st.rerun()
+
 def student_dashboard():
     user = get_user_by_id(st.session_state.user_id)
     st.title(f"👋 Добро пожаловать, {user.name}!")
@@ -281,22 +390,27 @@ def student_dashboard():
     with col3:
         st.metric("До сертификата", f"{max(300-total_hours, 0):.1f} ч")
     st.progress(progress)
-    st.subheader("Ввести данные QR-кода")
-    qr_data = st.text_input("Введите данные QR-кода")
-    if qr_data and st.button("Подтвердить участие"):
-        if not validate_qr_data(qr_data):
-            st.error("QR-код не от Alumni Club Connect")
-        else:
-            event = get_event_by_qr(qr_data)
-            if not event:
-                st.error("Мероприятие не найдено")
-            elif get_participation(user.id, event.id):
-                st.error("Вы уже участвовали в этом мероприятии")
+    st.subheader("📱 Сканирование QR-кода")
+    tab1, tab2, tab3 = st.tabs(["Камера", "Ввести данные", "Загрузить изображение"])
+    with tab1:
+        scan = qr_scanner(prefix=QR_PREFIX, key="qr_scanner", default=None)
+        # The component keeps returning its last value on every rerun
+        if scan and scan["scanned_at"] != st.session_state.get("last_scan"):
+            st.session_state.last_scan = scan["scanned_at"]
+            confirm_participation(user, scan["data"])
+    with tab2:
+        qr_data = st.text_input("Введите данные QR-кода")
+        if qr_data and st.button("Подтвердить участие"):
+            confirm_participation(user, qr_data)
+    with tab3:
+        st.caption("Если камера недоступна, загрузите фото QR-кода")
+        uploaded_file = st.file_uploader("Изображение с QR-кодом", type=["png", "jpg", "jpeg"])
+        if uploaded_file and st.button("Сканировать QR-код"):
+            qr_data = decode_qr_image(uploaded_file.getvalue())
+            if qr_data is None:
+                st.error("QR-код на изображении не найден")
             else:
-                add_participation(user.id, event.id, event.duration)
-                st.success(f"Участие в {event.name} подтверждено! Получено часов: {event.duration}")
-                st.balloons()
-                st.rerun()
+                confirm_participation(user, qr_data)
     st.subheader("📊 История участия")
     participations = get_my_participations(user.id)
     if participations:
@@ -339,25 +453,37 @@ def organizer_dashboard():
     with tab2:
         st.subheader("📅 Мои мероприятия")
         events = get_my_events(user.id)
-        if events:
-            for event in events:
-                with st.expander(f"{event.name} - {event.date.strftime('%d.%m.%Y %H:%M')}"):
-                    st.write(f"**Описание:** {event.description or 'Нет описания'}")
-                    st.write(f"**Дата:** {event.date.strftime('%d.%m.%Y %H:%M')}")
-                    st.write(f"**Продолжительность:** {event.duration} часов")
-                    participants = get_event_participants(event.id)
-                    st.write(f"**Всего участников:** {len(participants)}")
-                    if participants:
-                        df = pd.DataFrame(participants)
-                        df['timestamp'] = pd.to_datetime(df['timestamp']).dt.strftime('%d.%m.%Y %H:%M')
-                        st.dataframe(df[['user_name', 'user_email', 'timestamp', 'hours_awarded']].rename(columns={
-                            'user_name': 'Имя',
-                            'user_email': 'Email',
-                            'timestamp': 'Время участия',
-                            'hours_awarded': 'Часов начислено'
-                        }))
-                    else:
-                        st.info("Пока нет участников")
+        if not events:
+            st.info("Пока нет созданных мероприятий")
+            return
+        # Only the selected event's participants are loaded; the list itself comes from one grouped query
+        events_by_id = {e.id: e for e in events}
+        event = events_by_id[st.selectbox(
+            "Мероприятие",
+            list(events_by_id),
+            format_func=lambda event_id: (
+                f"{events_by_id[event_id].name} - {events_by_id[event_id].date.strftime('%d.%m.%Y %H:%M')} "
+                f"({events_by_id[event_id].participant_count} уч.)"
+            ),
+            key="organizer_event",
+        )]
+        st.write(f"**Описание:** {event.description or 'Нет описания'}")
+        st.write(f"**Дата:** {event.date.strftime('%d.%m.%Y %H:%M')}")
+        st.write(f"**Продолжительность:** {event.duration} часов")
+        st.write(f"**Всего участников:** {event.participant_count}")
+        st.write(f"**Начислено часов:** {event.total_hours_awarded:g}")
+        if not event.participant_count:
+            st.info("Пока нет участников")
+            return
+        pages = -(-event.participant_count // PARTICIPANTS_PAGE_SIZE)
+        page = 1
+        if pages > 1:
+            page = st.number_input("Страница", min_value=1, max_value=pages, value=1, key=f"participants_page_{event.id}")
+        # Participation ids can be reused after a delete, but ledger seqs never are:
+        # every check-in and revocation appends one, so it always gives a new version
+        version = (event.participant_count, event.ledger_seq)
+        st.dataframe(get_participants_page(event.id, version, int(page) - 1))
+        st.caption(f"Страница {int(page)} из {pages}")
 
 def main():
     with st.sidebar:
@@ -0,0 +1,207 @@
+"""Bulk user import from registrar spreadsheets (CSV or XLSX).
+
+Rows are validated column-wise with pandas, deduplicated against existing
+accounts in chunked queries, hashed across a process pool and inserted in
+one bulk statement. Rows without a password get a generated one; the report
+lists those emails, and includes the passwords themselves only when asked to.
+
+Usage:
+    python user_import.py students.xlsx [--default-role student] [--workers 4]
+    python user_import.py students.xlsx --include-passwords > passwords.json
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import secrets
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Optional
+
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import User
+from auth import get_password_hash
+from config import settings
+from seed_data import chunked
+
+# pandas is imported on first use so the API does not load it at startup
+if TYPE_CHECKING:
+    import pandas as pd
+
+VALID_ROLES = ["student", "organizer", "admin"]
+EMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[A-Za-z]{2,}$"
+SUPPORTED_EXTENSIONS = (".csv", ".xlsx")
+
+# Below this many passwords the pool start-up costs more than it saves
+MIN_PARALLEL_HASHES = 16
+# Emails per IN (...) lookup, well under SQLite's bound-variable limit (999 before 3.32)
+EMAIL_LOOKUP_CHUNK = 500
+
+
+class ImportFileError(ValueError):
+    """Raised when the uploaded spreadsheet cannot be read"""
+
+
+def read_spreadsheet(source, filename: str) -> "pd.DataFrame":
+    """Read a CSV or XLSX file (path or bytes) with every column as text"""
+    import pandas as pd
+
+    extension = os.path.splitext(filename.lower())[1]
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise ImportFileError("Only .csv and .xlsx files are supported")
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    try:
+        if extension == ".csv":
+            df = pd.read_csv(source, dtype=str, keep_default_na=False)
+        else:
+            df = pd.read_excel(source, dtype=str, keep_default_na=False)
+    except Exception as e:
+        raise ImportFileError(f"Could not read {filename}: {e}")
+    df.columns = [str(column).strip().lower() for column in df.columns]
+    missing = {"name", "email"} - set(df.columns)
+    if missing:
+        raise ImportFileError(f"Missing required columns: {', '.join(sorted(missing))}")
+    return df
+
+
+def validate_users(df: "pd.DataFrame", default_role: str = "student"):
+    """Normalize and validate all rows at once, returning (valid rows, per-row errors)"""
+    import pandas as pd
+
+    df = df.copy()
+    df["name"] = df["name"].fillna("").astype(str).str.strip()
+    df["email"] = df["email"].fillna("").astype(str).str.strip().str.lower()
+    if "role" in df.columns:
+        df["role"] = df["role"].fillna("").astype(str).str.strip().str.lower().replace("", default_role)
+    else:
+        df["role"] = default_role
+    if "password" not in df.columns:
+        df["password"] = ""
+    df["password"] = df["password"].fillna("").astype(str)
+
+    # Checks in priority order; each row reports the first one it fails
+    checks = [
+        (df["name"] == "", "Name is required"),
+        (~df["email"].str.match(EMAIL_PATTERN), "Invalid email address"),
+        (~df["role"].isin(VALID_ROLES), "Invalid role"),
+        ((df["password"] != "") & (df["password"].str.len() < settings.password_min_length),
+         f"Password must be at least {settings.password_min_length} characters"),
+        (df["email"].duplicated(keep="first"), "Duplicate email in file"),
+    ]
+    reason = pd.Series("", index=df.index)
+    for mask, message in checks:
+        reason = reason.mask((reason == "") & mask, message)
+
+    invalid = reason != ""
+    errors = [
+        # +2: header row plus 1-based spreadsheet numbering
+        {"row": int(position) + 2, "email": email, "error": message}
+        for position, email, message in zip(
+            df.index[invalid], df.loc[invalid, "email"], reason[invalid]
+        )
+    ]
+    return df.loc[~invalid, ["name", "email", "role", "password"]], errors
+
+
+def existing_emails(db: Session, emails) -> set:
+    """Return which of ``emails`` already belong to a user, one query per chunk"""
+    existing = set()
+    for chunk in chunked(emails, EMAIL_LOOKUP_CHUNK):
+        existing.update(db.execute(select(User.email).where(User.email.in_(chunk))).scalars())
+    return existing
+
+
+def hash_passwords(passwords, workers: Optional[int] = None):
+    """Hash passwords with bcrypt, spread across a process pool for large batches"""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(passwords) < MIN_PARALLEL_HASHES:
+        return [get_password_hash(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    # Spawned, not forked: the caller may be a threaded API worker, and a fork
+    # copies locks held by its other threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(get_password_hash, passwords, chunksize=chunksize))
+
+
+def import_users(db: Session, df: "pd.DataFrame", default_role: str = "student",
+                 workers: Optional[int] = None, include_passwords: bool = False) -> dict:
+    """Validate, deduplicate, hash and bulk insert users from a DataFrame
+
+    Generated passwords are only put in the report with ``include_passwords``;
+    otherwise it lists the affected emails so the passwords can be reset.
+    """
+    valid, errors = validate_users(df, default_role)
+
+    existing = existing_emails(db, valid["email"].tolist())
+    if existing:
+        duplicate = valid["email"].isin(existing)
+        errors.extend(
+            {"row": int(position) + 2, "email": email, "error": "Email already registered"}
+            for position, email in zip(valid.index[duplicate], valid.loc[duplicate, "email"])
+        )
+        valid = valid.loc[~duplicate]
+    # Release the connection while the passwords are hashed; a concurrent
+    # registration of the same email still fails the insert on the unique index
+    db.commit()
+
+    passwords = valid["password"].tolist()
+    generated = []
+    for i, password in enumerate(passwords):
+        if not password:
+            passwords[i] = secrets.token_urlsafe(12)
+            generated.append({"email": valid["email"].iat[i], "password": passwords[i]})
+
+    rows = [
+        {"name": name, "email": email, "password_hash": password_hash, "role": role, "total_hours": 0.0}
+        for name, email, role, password_hash in zip(
+            valid["name"], valid["email"], valid["role"], hash_passwords(passwords, workers)
+        )
+    ]
+    if rows:
+        try:
+            db.execute(insert(User), rows)
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise
+
+    errors.sort(key=lambda error: error["row"])
+    return {
+        "total_rows": len(df),
+        "created": len(rows),
+        "failed": len(errors),
+        "errors": errors,
+        "generated_passwords_for": [entry["email"] for entry in generated],
+        **({"generated_passwords": generated} if include_passwords else {}),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="CSV or XLSX file with name, email and optional role, password columns")
+    parser.add_argument("--default-role", default="student", choices=VALID_ROLES)
+    parser.add_argument("--workers", type=int, default=None, help="hashing processes (default: CPU count)")
+    parser.add_argument("--include-passwords", action="store_true",
+                        help="print generated passwords in the report (keep the output private)")
+    args = parser.parse_args(argv)
+
+    from database import SessionLocal, create_tables
+
+    create_tables()
+    df = read_spreadsheet(args.path, args.path)
+    db = SessionLocal()
+    try:
+        report = import_users(db, df, args.default_role, args.workers, args.include_passwords)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0 if not report["errors"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())